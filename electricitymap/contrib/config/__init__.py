@@ -1,7 +1,7 @@
 import json
 from copy import deepcopy
 from pathlib import Path
-from typing import Dict, List, NewType, Tuple
+from typing import Dict, List, NewType, Optional, Tuple
 
 ZoneKey = NewType("ZoneKey", str)
 Point = NewType("Point", Tuple[float, float])
@@ -78,9 +78,13 @@ for zone, neighbors in ZONE_NEIGHBOURS.items():
     ZONE_NEIGHBOURS[zone] = sorted(neighbors)
 
 
-def emission_factors(zone_key: ZoneKey) -> Dict[str, float]:
-    override = CO2EQ_PARAMETERS["emissionFactors"]["zoneOverrides"].get(zone_key, {})
-    defaults = CO2EQ_PARAMETERS["emissionFactors"]["defaults"]
+def emission_factors(
+    zone_key: ZoneKey, co2eq_parameters: Optional[Dict] = None
+) -> Dict[str, float]:
+    """Returns the emission factors of a zone, lifecycle ones by default."""
+    parameters = co2eq_parameters or CO2EQ_PARAMETERS
+    override = parameters["emissionFactors"]["zoneOverrides"].get(zone_key, {})
+    defaults = parameters["emissionFactors"]["defaults"]
 
     def get_most_recent_value(emission_factors: Dict) -> Dict:
         _emission_factors = deepcopy(emission_factors)
@@ -1,4 +1,5 @@
 from datetime import datetime
+from io import BytesIO
 from logging import Logger, getLogger
 from typing import Optional, Union
 
@@ -9,6 +10,8 @@ import numpy as np
 from PIL import Image
 from requests import Session
 
+from parsers.lib.config import cpu_bound
+
 URL = "http://194.110.178.135/grafik/stamnat.php"
 SOURCE = "kraftnat.ax"
 TZ = "Europe/Mariehamn"
@@ -887,17 +890,25 @@ def _get_masks(session=None):
 
 def _fetch_data(session: Optional[Session] = None) -> dict:
     """Return usable data from source."""
-    # Load masks for reading numbers from the image
-    # Create a dictionary of symbols and their pixel masks
-    mapping = _get_masks(session)
-
     # Download the updating image from Kraftnät Åland
     r = session or Session()
 
-    im = Image.open(r.get(URL, stream=True).raw)
+    content = r.get(URL).content
     # Get timestamp
     fetchtime = arrow.utcnow().floor("second").to(TZ)
 
+    return {**_read_image(content), "fetchtime": fetchtime}
+
+
+@cpu_bound
+def _read_image(content: bytes) -> dict:
+    """Reads the values shown in the image, by matching digit masks."""
+    # Load masks for reading numbers from the image
+    # Create a dictionary of symbols and their pixel masks
+    mapping = _get_masks()
+
+    im = Image.open(BytesIO(content))
+
     # "data" is a height x width x 3 RGB numpy array
     data = np.array(im)
     # red, green, blue, alpha = data.T
@@ -997,7 +1008,6 @@ def _fetch_data(session: Optional[Session] = None) -> dict:
         "fossil": fossil,
         "SE3->AX": se_3_flow,
         "FI->AX": fin_flow,
-        "fetchtime": fetchtime,
     }
 
 
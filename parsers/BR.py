@@ -1,7 +1,9 @@
+import time
 from collections import defaultdict
 from datetime import datetime
 from logging import Logger, getLogger
-from typing import Any, Dict, Optional, Union
+from threading import Lock
+from typing import Any, Dict, Optional, Tuple, Union
 
 import arrow
 from requests import Session
@@ -46,11 +48,25 @@ COUNTRIES_EXCHANGE = {
     "PY": {"name": "paraguai", "flow": -1},
 }
 
+# All BR zones and exchanges read the same ONS snapshot. It is downloaded once and
+# shared for SNAPSHOT_TTL seconds, so every value of a cycle comes from the same
+# document timestamp (`json_data["Data"]`).
+SNAPSHOT_TTL = 60
+_snapshot: Optional[Tuple[float, dict]] = None
+_snapshot_lock = Lock()
+
 
 def get_data(session: Optional[Session]):
     """Requests generation data in json format."""
-    s = session or Session()
-    json_data = s.get(URL).json()
+    global _snapshot
+    # Concurrent callers wait for a single download.
+    with _snapshot_lock:
+        if _snapshot is not None and time.monotonic() - _snapshot[0] < SNAPSHOT_TTL:
+            return _snapshot[1]
+
+        s = session or Session()
+        json_data = s.get(URL).json()
+        _snapshot = (time.monotonic(), json_data)
 
     return json_data
 
@@ -8,19 +8,25 @@ and exposes them via a unified API.
 Requires an API key, set in the EIA_KEY environment variable. Get one here:
 https://www.eia.gov/opendata/register.php
 """
+import asyncio
+import math
 from datetime import datetime, timedelta
 from logging import Logger, getLogger
-from typing import Optional
+from typing import Any, Dict, List, Optional, Tuple
 
 import arrow
 from dateutil import parser, tz
 from requests import Session
 
+from parsers.lib import incremental
 from parsers.lib.config import refetch_frequency
 
 from .ENTSOE import merge_production_outputs
+from .lib.utils import get_token
 from .lib.validation import validate
 
+SERIES_ENDPOINT = "https://api.eia.gov/series/"
+
 # Reverse exchanges need to be multiplied by -1, since they are reported in the opposite direction
 REVERSE_EXCHANGES = [
     "US-CA->MX-BC",
@@ -316,6 +322,22 @@ def fetch_consumption_forecast(
     )
 
 
+async def fetch_consumption_forecast_async(
+    zone_key: str,
+    session=None,
+    target_datetime: Optional[datetime] = None,
+    logger: Logger = getLogger(__name__),
+):
+    """Same as fetch_consumption_forecast, with a parsers.lib.aio.AsyncSession."""
+    return await _fetch_series_async(
+        zone_key,
+        FORECAST_SERIES % REGIONS[zone_key],
+        session=session,
+        target_datetime=target_datetime,
+        logger=logger,
+    )
+
+
 def fetch_production(
     zone_key: str,
     session: Optional[Session] = None,
@@ -345,12 +367,60 @@ def fetch_consumption(
         target_datetime=target_datetime,
         logger=logger,
     )
+    return _consumption(consumption)
+
+
+async def fetch_consumption_async(
+    zone_key: str,
+    session=None,
+    target_datetime: Optional[datetime] = None,
+    logger: Logger = getLogger(__name__),
+):
+    """Same as fetch_consumption, with a parsers.lib.aio.AsyncSession."""
+    consumption = await _fetch_series_async(
+        zone_key,
+        DEMAND_SERIES % REGIONS[zone_key],
+        session=session,
+        target_datetime=target_datetime,
+        logger=logger,
+    )
+    return _consumption(consumption)
+
+
+def _consumption(consumption: list) -> list:
     for point in consumption:
         point["consumption"] = point.pop("value")
 
     return consumption
 
 
+# EIA does not currently split production from the Virgil Summer C
+# plant across the two owning/ utilizing BAs:
+# US-CAR-SCEG and US-CAR-SC,
+# but attributes it all to US-CAR-SCEG
+# Here we apply a temporary fix for that until EIA properly splits the production
+# This split can be found in the eGRID data,
+# https://www.epa.gov/energy/emissions-generation-resource-integrated-database-egrid
+SC_VIRGIL_OWNERSHIP = 0.3333333
+
+
+def _production_mix_series(zone_key: str) -> List[Tuple[str, str, str]]:
+    """Returns the (type, series zone key, series id) of each production type."""
+    series = []
+    for type, code in TYPES.items():
+        series_zone_key = zone_key
+        if zone_key == "US-CAR-SC" and type == "nuclear":
+            series_zone_key = "US-CAR-SCEG"
+        series.append(
+            (
+                type,
+                series_zone_key,
+                PRODUCTION_MIX_SERIES % (REGIONS[series_zone_key], code),
+            )
+        )
+    return series
+
+
 @refetch_frequency(timedelta(days=1))
 def fetch_production_mix(
     zone_key: str,
@@ -358,34 +428,53 @@ def fetch_production_mix(
     target_datetime: Optional[datetime] = None,
     logger: Logger = getLogger(__name__),
 ):
-    mixes = []
-    for type, code in TYPES.items():
-        series = PRODUCTION_MIX_SERIES % (REGIONS[zone_key], code)
-        mix = _fetch_series(
-            zone_key,
-            series,
-            session=session,
-            target_datetime=target_datetime,
-            logger=logger,
+    mixes = [
+        (
+            type,
+            _fetch_series(
+                series_zone_key,
+                series_id,
+                session=session,
+                target_datetime=target_datetime,
+                logger=logger,
+            ),
         )
+        for type, series_zone_key, series_id in _production_mix_series(zone_key)
+    ]
+    return _production_mix(zone_key, mixes, logger)
 
-        # EIA does not currently split production from the Virgil Summer C
-        # plant across the two owning/ utilizing BAs:
-        # US-CAR-SCEG and US-CAR-SC,
-        # but attributes it all to US-CAR-SCEG
-        # Here we apply a temporary fix for that until EIA properly splits the production
-        # This split can be found in the eGRID data,
-        # https://www.epa.gov/energy/emissions-generation-resource-integrated-database-egrid
-        SC_VIRGIL_OWNERSHIP = 0.3333333
-        if zone_key == "US-CAR-SC" and type == "nuclear":
-            series = PRODUCTION_MIX_SERIES % (REGIONS["US-CAR-SCEG"], code)
-            mix = _fetch_series(
-                "US-CAR-SCEG",
-                series,
+
+async def fetch_production_mix_async(
+    zone_key: str,
+    session=None,
+    target_datetime: Optional[datetime] = None,
+    logger: Logger = getLogger(__name__),
+):
+    """Same as fetch_production_mix, with a parsers.lib.aio.AsyncSession.
+    The series of all production types are queried concurrently."""
+    series = _production_mix_series(zone_key)
+    mixes = await asyncio.gather(
+        *(
+            _fetch_series_async(
+                series_zone_key,
+                series_id,
                 session=session,
                 target_datetime=target_datetime,
                 logger=logger,
             )
+            for _, series_zone_key, series_id in series
+        )
+    )
+    return _production_mix(
+        zone_key, [(type, mix) for (type, _, _), mix in zip(series, mixes)], logger
+    )
+
+
+def _production_mix(zone_key: str, typed_mixes: List[Tuple[str, list]], logger: Logger):
+    """Merges the series of each production type into production events."""
+    mixes = []
+    for type, mix in typed_mixes:
+        if zone_key == "US-CAR-SC" and type == "nuclear":
             for point in mix:
                 point.update({"value": point["value"] * SC_VIRGIL_OWNERSHIP})
 
@@ -464,6 +553,29 @@ def fetch_exchange(
         target_datetime=target_datetime,
         logger=logger,
     )
+    return _exchange(sortedcodes, exchange)
+
+
+async def fetch_exchange_async(
+    zone_key1: str,
+    zone_key2: str,
+    session=None,
+    target_datetime: Optional[datetime] = None,
+    logger: Logger = getLogger(__name__),
+):
+    """Same as fetch_exchange, with a parsers.lib.aio.AsyncSession."""
+    sortedcodes = "->".join(sorted([zone_key1, zone_key2]))
+    exchange = await _fetch_series_async(
+        sortedcodes,
+        EXCHANGES[sortedcodes],
+        session=session,
+        target_datetime=target_datetime,
+        logger=logger,
+    )
+    return _exchange(sortedcodes, exchange)
+
+
+def _exchange(sortedcodes: str, exchange: list) -> list:
     for point in exchange:
         point.update(
             {
@@ -477,6 +589,32 @@ def fetch_exchange(
     return exchange
 
 
+def _series_limits(target_datetime: Optional[datetime]) -> Dict[str, Any]:
+    """Returns the `start` and `end`, or the number of points `num`, of a series
+    query."""
+    if target_datetime:
+        try:
+            target_datetime = arrow.get(target_datetime).datetime
+        except arrow.parser.ParserError:
+            raise ValueError(
+                f"target_datetime must be a valid datetime - received {target_datetime}"
+            )
+        utc = tz.gettz("UTC")
+        # eia currently only accepts utc timestamps in the form YYYYMMDDTHHZ
+        end = target_datetime.astimezone(utc).strftime("%Y%m%dT%HZ")
+        start = (target_datetime.astimezone(utc) - timedelta(days=1)).strftime(
+            "%Y%m%dT%HZ"
+        )
+        return {"start": start, "end": end}
+
+    # Get the last 24 hours available, or fewer if the runner already has
+    # most of them.
+    now = arrow.utcnow()
+    start = arrow.get(incremental.get_start(now.shift(hours=-24).datetime))
+    hours = math.ceil((now - start).total_seconds() / 3600)
+    return {"num": max(1, min(24, hours))}
+
+
 def _fetch_series(
     zone_key: str,
     series_id,
@@ -493,28 +631,35 @@ def _fetch_series(
 
     series = Series(series_id=series_id, session=s)
 
-    if target_datetime:
-        try:
-            target_datetime = arrow.get(target_datetime).datetime
-        except arrow.parser.ParserError:
-            raise ValueError(
-                f"target_datetime must be a valid datetime - received {target_datetime}"
-            )
-        utc = tz.gettz("UTC")
-        if isinstance(target_datetime, datetime.datetime):
-            # eia currently only accepts utc timestamps in the form YYYYMMDDTHHZ
-            end = target_datetime.astimezone(utc).strftime("%Y%m%dT%HZ")
-            start = (
-                target_datetime.astimezone(utc) - datetime.timedelta(days=1)
-            ).strftime("%Y%m%dT%HZ")
-        else:
-            end = None
-            start = None
-        raw_data = series.get_data(start=start, end=end)
+    limits = _series_limits(target_datetime)
+    if "num" in limits:
+        raw_data = series.last(limits["num"])
     else:
-        # Get the last 24 hours available.
-        raw_data = series.last(24)
+        raw_data = series.get_data(start=limits["start"], end=limits["end"])
+
+    return _series_points(zone_key, series_id, raw_data, logger)
 
+
+async def _fetch_series_async(
+    zone_key: str,
+    series_id,
+    session=None,
+    target_datetime: Optional[datetime] = None,
+    logger: Logger = getLogger(__name__),
+):
+    """Same as _fetch_series, with a parsers.lib.aio.AsyncSession. Queries the
+    endpoint used by eiapy directly."""
+    params = {
+        "api_key": get_token("EIA_KEY"),
+        "series_id": series_id,
+        **_series_limits(target_datetime),
+    }
+    response = await session.get(SERIES_ENDPOINT, params=params)
+    return _series_points(zone_key, series_id, response.json(), logger)
+
+
+def _series_points(zone_key: str, series_id, raw_data: dict, logger: Logger):
+    """Converts a series response to data points."""
     eia_error_message = raw_data.get("data", {}).get("error")
     if eia_error_message:
         logger.error(f"EIA error, for series_id [{series_id}]: {eia_error_message}")
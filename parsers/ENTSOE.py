@@ -12,6 +12,7 @@ Day-ahead Price
 Generation Forecast
 Consumption Forecast
 """
+import asyncio
 import itertools
 import re
 from collections import defaultdict
@@ -25,7 +26,9 @@ import pandas as pd
 from bs4 import BeautifulSoup
 from requests import Session
 
-from parsers.lib.config import refetch_frequency
+from parsers.lib import incremental
+from parsers.lib.cache import immutable
+from parsers.lib.config import cpu_bound, refetch_frequency
 
 from .lib.utils import get_token, sum_production_dicts
 from .lib.validation import validate
@@ -70,7 +73,10 @@ ENTSOE_PARAMETER_GROUPS = {
     "storage": {"hydro storage": ["B10"]},
 }
 ENTSOE_PARAMETER_BY_GROUP = {
-    v: k for k, g in ENTSOE_PARAMETER_GROUPS.items() for v in g
+    v: k
+    for groups in ENTSOE_PARAMETER_GROUPS.values()
+    for k, g in groups.items()
+    for v in g
 }
 # Get all the individual storage parameters in one list
 ENTSOE_STORAGE_PARAMETERS = list(
@@ -423,26 +429,50 @@ def check_response(response, function_name):
             )
 
 
-def query_ENTSOE(session, params, target_datetime=None, span=(-48, 24)):
-    """
-    Makes a standard query to the ENTSOE API with a modifiable set of parameters.
-    Allows an existing session to be passed.
-    Raises an exception if no API token is found.
-    Returns a request object.
-    """
+def _add_ENTSOE_query_params(params, target_datetime=None, span=(-48, 24)):
+    """Adds the queried period and an API token to the query parameters."""
     if target_datetime is None:
         target_datetime = arrow.utcnow()
+        # Live queries start shortly before the data the runner already has
+        period_start = arrow.get(
+            incremental.get_start(target_datetime.shift(hours=span[0]).datetime)
+        )
     else:
         # make sure we have an arrow object
         target_datetime = arrow.get(target_datetime)
-    params["periodStart"] = target_datetime.shift(hours=span[0]).format("YYYYMMDDHH00")
+        period_start = target_datetime.shift(hours=span[0])
+    params["periodStart"] = period_start.format("YYYYMMDDHH00")
     params["periodEnd"] = target_datetime.shift(hours=span[1]).format("YYYYMMDDHH00")
 
     # Due to rate limiting, we need to spread our requests across different tokens
     tokens = get_token("ENTSOE_TOKEN").split(",")
 
     params["securityToken"] = np.random.choice(tokens)
-    return session.get(ENTSOE_ENDPOINT, params=params)
+    return params
+
+
+def query_ENTSOE(session, params, target_datetime=None, span=(-48, 24)):
+    """
+    Makes a standard query to the ENTSOE API with a modifiable set of parameters.
+    Allows an existing session to be passed.
+    Raises an exception if no API token is found.
+    Returns a request object.
+    """
+    params = _add_ENTSOE_query_params(params, target_datetime, span)
+    # Windows in the past are final
+    period_end = (
+        arrow.get(target_datetime).shift(hours=span[1]).datetime
+        if target_datetime
+        else None
+    )
+    with immutable(period_end):
+        return session.get(ENTSOE_ENDPOINT, params=params)
+
+
+async def query_ENTSOE_async(session, params, target_datetime=None, span=(-48, 24)):
+    """Same as query_ENTSOE, with a parsers.lib.aio.AsyncSession."""
+    params = _add_ENTSOE_query_params(params, target_datetime, span)
+    return await session.get(ENTSOE_ENDPOINT, params=params)
 
 
 def query_consumption(domain, session, target_datetime=None) -> Union[str, None]:
@@ -492,15 +522,18 @@ def query_production_per_units(
         check_response(response, query_production_per_units.__name__)
 
 
-def query_exchange(
-    in_domain, out_domain, session, target_datetime=None
-) -> Union[str, None]:
-
-    params = {
+def _exchange_params(in_domain, out_domain) -> Dict[str, str]:
+    return {
         "documentType": "A11",
         "in_Domain": in_domain,
         "out_Domain": out_domain,
     }
+
+
+def query_exchange(
+    in_domain, out_domain, session, target_datetime=None
+) -> Union[str, None]:
+    params = _exchange_params(in_domain, out_domain)
     response = query_ENTSOE(session, params, target_datetime=target_datetime)
     if response.ok:
         return response.text
@@ -508,6 +541,19 @@ def query_exchange(
         check_response(response, query_exchange.__name__)
 
 
+async def query_exchange_async(
+    in_domain, out_domain, session, target_datetime=None
+) -> Union[str, None]:
+    params = _exchange_params(in_domain, out_domain)
+    response = await query_ENTSOE_async(
+        session, params, target_datetime=target_datetime
+    )
+    if response.ok:
+        return response.text
+    else:
+        check_response(response, query_exchange.__name__)
+
+
 def query_exchange_forecast(
     in_domain, out_domain, session, target_datetime=None
 ) -> Union[str, None]:
@@ -525,13 +571,16 @@ def query_exchange_forecast(
         check_response(response, query_exchange_forecast.__name__)
 
 
-def query_price(domain, session, target_datetime=None) -> Union[str, None]:
-
-    params = {
+def _price_params(domain) -> Dict[str, str]:
+    return {
         "documentType": "A44",
         "in_Domain": domain,
         "out_Domain": domain,
     }
+
+
+def query_price(domain, session, target_datetime=None) -> Union[str, None]:
+    params = _price_params(domain)
     response = query_ENTSOE(session, params, target_datetime=target_datetime)
     if response.ok:
         return response.text
@@ -539,6 +588,17 @@ def query_price(domain, session, target_datetime=None) -> Union[str, None]:
         check_response(response, query_price.__name__)
 
 
+async def query_price_async(domain, session, target_datetime=None) -> Union[str, None]:
+    params = _price_params(domain)
+    response = await query_ENTSOE_async(
+        session, params, target_datetime=target_datetime
+    )
+    if response.ok:
+        return response.text
+    else:
+        check_response(response, query_price.__name__)
+
+
 def query_generation_forecast(
     in_domain, session, target_datetime=None
 ) -> Union[str, None]:
@@ -603,6 +663,7 @@ def datetime_from_position(start, position, resolution):
     raise NotImplementedError("Could not recognise resolution %s" % resolution)
 
 
+@cpu_bound
 def parse_scalar(
     xml_text, only_inBiddingZone_Domain=False, only_outBiddingZone_Domain=False
 ) -> Union[tuple, None]:
@@ -632,6 +693,7 @@ def parse_scalar(
     return values, datetimes
 
 
+@cpu_bound
 def parse_production(xml_text) -> Union[tuple, None]:
 
     if not xml_text:
@@ -646,7 +708,7 @@ def parse_production(xml_text) -> Union[tuple, None]:
         is_production = (
             len(timeseries.find_all("inBiddingZone_Domain.mRID".lower())) > 0
         )
-        psr_type = (
+        psr_type = str(
             timeseries.find_all("mktpsrtype")[0].find_all("psrtype")[0].contents[0]
         )
 
@@ -664,7 +726,7 @@ def parse_production(xml_text) -> Union[tuple, None]:
                     productions[i][psr_type] -= quantity
             except ValueError:  # Not in list
                 datetimes.append(datetime)
-                productions.append(defaultdict(lambda: 0))
+                productions.append(defaultdict(int))
                 productions[-1][psr_type] = quantity if is_production else -1 * quantity
     return productions, datetimes
 
@@ -711,6 +773,7 @@ def parse_self_consumption(xml_text):
     return res
 
 
+@cpu_bound
 def parse_production_per_units(xml_text) -> Union[dict, None]:
     values = {}
 
@@ -727,13 +790,15 @@ def parse_production_per_units(xml_text) -> Union[dict, None]:
         psr_type = (
             timeseries.find_all("mktpsrtype")[0].find_all("psrtype")[0].contents[0]
         )
-        unit_key = (
+        # Plain strings, as bs4 strings drag their whole tree along when the
+        # result is pickled back from a process pool.
+        unit_key = str(
             timeseries.find_all("mktpsrtype")[0]
             .find_all("powersystemresources")[0]
             .find_all("mrid")[0]
             .contents[0]
         )
-        unit_name = (
+        unit_name = str(
             timeseries.find_all("mktpsrtype")[0]
             .find_all("powersystemresources")[0]
             .find_all("name")[0]
@@ -760,9 +825,10 @@ def parse_production_per_units(xml_text) -> Union[dict, None]:
                     "unitName": unit_name,
                 }
 
-    return values.values()
+    return list(values.values())
 
 
+@cpu_bound
 def parse_exchange(
     xml_text, is_import, quantities=None, datetimes=None
 ) -> Union[tuple, None]:
@@ -801,6 +867,7 @@ def parse_exchange(
     return quantities, datetimes
 
 
+@cpu_bound
 def parse_price(xml_text) -> Union[tuple, None]:
 
     if not xml_text:
@@ -811,7 +878,7 @@ def parse_price(xml_text) -> Union[tuple, None]:
     currencies = []
     datetimes = []
     for timeseries in soup.find_all("timeseries"):
-        currency = timeseries.find_all("currency_unit.name")[0].contents[0]
+        currency = str(timeseries.find_all("currency_unit.name")[0].contents[0])
         resolution = timeseries.find_all("resolution")[0].contents[0]
         datetime_start = arrow.get(timeseries.find_all("start")[0].contents[0])
         for entry in timeseries.find_all("point"):
@@ -1094,6 +1161,51 @@ def fetch_production_per_units(
     return data
 
 
+def _exchange_domains(zone_key1: str, zone_key2: str):
+    """Returns the sorted zone keys, the exchange key and both ENTSOE domains."""
+    sorted_zone_keys = sorted([zone_key1, zone_key2])
+    key = "->".join(sorted_zone_keys)
+    if key in ENTSOE_EXCHANGE_DOMAIN_OVERRIDE:
+        domain1, domain2 = ENTSOE_EXCHANGE_DOMAIN_OVERRIDE[key]
+    else:
+        domain1 = ENTSOE_DOMAIN_MAPPINGS[zone_key1]
+        domain2 = ENTSOE_DOMAIN_MAPPINGS[zone_key2]
+    return sorted_zone_keys, key, domain1, domain2
+
+
+def _exchange_events(
+    zone_key1: str, sorted_zone_keys: List[str], key: str, parsed
+) -> List[dict]:
+    """Turns parsed exchange quantities into events, dropping future ones."""
+    # Create a hashmap with key (datetime)
+    exchange_hashmap = {}
+    if parsed:
+        quantities, datetimes = parsed
+        for i in range(len(quantities)):
+            exchange_hashmap[datetimes[i]] = quantities[i]
+
+    # Remove all dates in the future
+    exchange_dates = sorted(set(exchange_hashmap.keys()), reverse=True)
+    exchange_dates = list(filter(lambda x: x <= arrow.now(), exchange_dates))
+    if not len(exchange_dates):
+        raise QueryError("No exchange data found")
+    data = []
+    for exchange_date in exchange_dates:
+        net_flow = exchange_hashmap[exchange_date]
+        data.append(
+            {
+                "sortedZoneKeys": key,
+                "datetime": exchange_date.datetime,
+                "netFlow": net_flow
+                if zone_key1[0] == sorted_zone_keys
+                else -1 * net_flow,
+                "source": "entsoe.eu",
+            }
+        )
+
+    return data
+
+
 @refetch_frequency(timedelta(days=2))
 def fetch_exchange(
     zone_key1: str,
@@ -1108,15 +1220,7 @@ def fetch_exchange(
     """
     if not session:
         session = Session()
-    sorted_zone_keys = sorted([zone_key1, zone_key2])
-    key = "->".join(sorted_zone_keys)
-    if key in ENTSOE_EXCHANGE_DOMAIN_OVERRIDE:
-        domain1, domain2 = ENTSOE_EXCHANGE_DOMAIN_OVERRIDE[key]
-    else:
-        domain1 = ENTSOE_DOMAIN_MAPPINGS[zone_key1]
-        domain2 = ENTSOE_DOMAIN_MAPPINGS[zone_key2]
-    # Create a hashmap with key (datetime)
-    exchange_hashmap = {}
+    sorted_zone_keys, key, domain1, domain2 = _exchange_domains(zone_key1, zone_key2)
     # Grab exchange
     # Import
     parsed = parse_exchange(
@@ -1133,31 +1237,34 @@ def fetch_exchange(
             quantities=parsed[0],
             datetimes=parsed[1],
         )
-        if parsed:
-            quantities, datetimes = parsed
-            for i in range(len(quantities)):
-                exchange_hashmap[datetimes[i]] = quantities[i]
 
-    # Remove all dates in the future
-    exchange_dates = sorted(set(exchange_hashmap.keys()), reverse=True)
-    exchange_dates = list(filter(lambda x: x <= arrow.now(), exchange_dates))
-    if not len(exchange_dates):
-        raise QueryError("No exchange data found")
-    data = []
-    for exchange_date in exchange_dates:
-        net_flow = exchange_hashmap[exchange_date]
-        data.append(
-            {
-                "sortedZoneKeys": key,
-                "datetime": exchange_date.datetime,
-                "netFlow": net_flow
-                if zone_key1[0] == sorted_zone_keys
-                else -1 * net_flow,
-                "source": "entsoe.eu",
-            }
+    return _exchange_events(zone_key1, sorted_zone_keys, key, parsed)
+
+
+async def fetch_exchange_async(
+    zone_key1: str,
+    zone_key2: str,
+    session=None,
+    target_datetime: Optional[datetime] = None,
+    logger: Logger = getLogger(__name__),
+) -> List[dict]:
+    """Same as fetch_exchange, with a parsers.lib.aio.AsyncSession.
+    Imports and exports are queried concurrently."""
+    sorted_zone_keys, key, domain1, domain2 = _exchange_domains(zone_key1, zone_key2)
+    import_xml, export_xml = await asyncio.gather(
+        query_exchange_async(domain1, domain2, session, target_datetime),
+        query_exchange_async(domain2, domain1, session, target_datetime),
+    )
+    parsed = parse_exchange(import_xml, is_import=True)
+    if parsed:
+        parsed = parse_exchange(
+            xml_text=export_xml,
+            is_import=False,
+            quantities=parsed[0],
+            datetimes=parsed[1],
         )
 
-    return data
+    return _exchange_events(zone_key1, sorted_zone_keys, key, parsed)
 
 
 @refetch_frequency(timedelta(days=2))
@@ -1224,23 +1331,13 @@ def fetch_exchange_forecast(
     return data
 
 
-@refetch_frequency(timedelta(days=2))
-def fetch_price(
-    zone_key: str,
-    session: Optional[Session] = None,
-    target_datetime: Optional[datetime] = None,
-    logger: Logger = getLogger(__name__),
-) -> list:
-    """Gets day-ahead price for specified zone."""
-    # Note: This is day-ahead prices
-    if not session:
-        session = Session()
+def _price_domain(zone_key: str) -> str:
     if zone_key in ENTSOE_PRICE_DOMAIN_OVERRIDE:
-        domain = ENTSOE_PRICE_DOMAIN_OVERRIDE[zone_key]
-    else:
-        domain = ENTSOE_DOMAIN_MAPPINGS[zone_key]
-    # Grab consumption
-    parsed = parse_price(query_price(domain, session, target_datetime=target_datetime))
+        return ENTSOE_PRICE_DOMAIN_OVERRIDE[zone_key]
+    return ENTSOE_DOMAIN_MAPPINGS[zone_key]
+
+
+def _price_events(zone_key: str, parsed) -> Optional[list]:
     if parsed:
         data = []
         prices, currencies, datetimes = parsed
@@ -1258,6 +1355,35 @@ def fetch_price(
         return data
 
 
+@refetch_frequency(timedelta(days=2))
+def fetch_price(
+    zone_key: str,
+    session: Optional[Session] = None,
+    target_datetime: Optional[datetime] = None,
+    logger: Logger = getLogger(__name__),
+) -> list:
+    """Gets day-ahead price for specified zone."""
+    # Note: This is day-ahead prices
+    if not session:
+        session = Session()
+    domain = _price_domain(zone_key)
+    # Grab consumption
+    parsed = parse_price(query_price(domain, session, target_datetime=target_datetime))
+    return _price_events(zone_key, parsed)
+
+
+async def fetch_price_async(
+    zone_key: str,
+    session=None,
+    target_datetime: Optional[datetime] = None,
+    logger: Logger = getLogger(__name__),
+) -> list:
+    """Same as fetch_price, with a parsers.lib.aio.AsyncSession."""
+    domain = _price_domain(zone_key)
+    xml_text = await query_price_async(domain, session, target_datetime=target_datetime)
+    return _price_events(zone_key, parse_price(xml_text))
+
+
 @refetch_frequency(timedelta(days=2))
 def fetch_generation_forecast(
     zone_key: str,
@@ -5,11 +5,12 @@ from typing import Optional
 import arrow
 import cv2
 import numpy as np
-import pytesseract
 from imageio import imread
 from PIL import Image, ImageOps
 from requests import Session
 
+from .lib.ocr import images_to_string
+
 url = "https://mahasldc.in/wp-content/reports/sldc/mvrreport3.jpg"
 
 # specifies locations of data in the image
@@ -150,9 +151,7 @@ def fetch_production(
     imgs = [read(loc["value"], image) for loc in locations.values()]
 
     # string together all image sections and recognize resulting line
-    imgs_line = np.hstack(list(np.asarray(i) for i in imgs[:]))
-    imgs_line = Image.fromarray(imgs_line)
-    text = pytesseract.image_to_string(imgs_line, lang="digits_comma", config="--psm 7")
+    text = images_to_string(imgs, lang="digits_comma", config="--psm 7")
     text = text.split(" ")
 
     # generate dict from string list
@@ -12,6 +12,8 @@ from bs4 import BeautifulSoup
 from dateutil import tz
 from requests import Session
 
+from parsers.lib.cache import immutable
+
 MX_PRODUCTION_URL = (
     "https://www.cenace.gob.mx/SIM/VISTA/REPORTES/EnergiaGenLiqAgregada.aspx"
 )
@@ -162,7 +164,10 @@ def fetch_production(
     if cache_key in DATA_CACHE:
         df = DATA_CACHE[cache_key]
     else:
-        df = fetch_csv_for_date(target_datetime, session=session)
+        # The report of a month is final once the month is over
+        month_end = arrow.get(target_datetime).shift(months=1).floor("month")
+        with immutable(month_end.datetime):
+            df = fetch_csv_for_date(target_datetime, session=session)
         DATA_CACHE[cache_key] = df
 
     data = []
@@ -1,7 +1,6 @@
 #!/usr/bin/env python3
 
 import math
-from asyncio.log import logger
 from copy import copy
 from datetime import datetime, timedelta
 from logging import Logger, getLogger
@@ -10,14 +9,23 @@ from typing import Optional
 import arrow
 import numpy as np
 import pandas as pd
-from requests import Session, get
+from requests import Session
 
-from electricitymap.contrib.config import ZONES_CONFIG
+from parsers.lib import capacity
+from parsers.lib.composite import Composite, fetch_inputs, series
 from parsers.lib.config import refetch_frequency
 
 from . import DK, ENTSOE, statnett
 
-ZONE_CONFIG = ZONES_CONFIG["NL"]
+# The exchanges with DK-DK1 and NO are added separately, they need resampling
+COMPOSITE = Composite(
+    zone_key="NL",
+    consumption=ENTSOE.fetch_consumption,
+    production=ENTSOE.fetch_production,
+    exchanges={
+        exchange_key: ENTSOE.fetch_exchange for exchange_key in ["BE", "DE", "GB"]
+    },
+)
 
 
 @refetch_frequency(timedelta(days=1))
@@ -27,64 +35,46 @@ def fetch_production(
     target_datetime: Optional[datetime] = None,
     logger: Logger = getLogger(__name__),
 ):
+    r = session or Session()
+
+    # NL has exchanges with BE, DE, NO, GB, DK-DK1
+    inputs = fetch_inputs(COMPOSITE, r, target_datetime, logger)
     if target_datetime is None:
         target_datetime = arrow.utcnow()
     else:
         target_datetime = arrow.get(target_datetime)
-    r = session or Session()
 
-    consumptions = ENTSOE.fetch_consumption(
-        zone_key=zone_key, session=r, target_datetime=target_datetime, logger=logger
-    )
+    consumptions = inputs.consumption
     if not consumptions:
         return
     for c in consumptions:
         del c["source"]
     df_consumptions = pd.DataFrame.from_dict(consumptions).set_index("datetime")
 
-    # NL has exchanges with BE, DE, NO, GB, DK-DK1
-    exchanges = []
-    for exchange_key in ["BE", "DE", "GB"]:
-        zone_1, zone_2 = sorted([exchange_key, zone_key])
-        exchange = ENTSOE.fetch_exchange(
-            zone_key1=zone_1,
-            zone_key2=zone_2,
-            session=r,
-            target_datetime=target_datetime,
-            logger=logger,
-        )
-        if not exchange:
-            return
-        exchanges.extend(exchange or [])
-
-    # add NO data, fetch once for every hour
-    # This introduces an error, because it doesn't use the average power flow
-    # during the hour, but rather only the value during the first minute of the
-    # hour!
+    if not all(inputs.exchanges.values()):
+        return
+    exchanges = [e for exchange in inputs.exchanges.values() for e in exchange]
+
+    # add NO data, averaged per hour
     zone_1, zone_2 = sorted(["NO", zone_key])
-    exchange_NO = [
-        statnett.fetch_exchange(
-            zone_key1=zone_1,
-            zone_key2=zone_2,
-            session=r,
-            target_datetime=dt.datetime,
-            logger=logger,
-        )
-        for dt in arrow.Arrow.range(
-            "hour",
-            arrow.get(min([e["datetime"] for e in exchanges])).replace(minute=0),
-            arrow.get(max([e["datetime"] for e in exchanges])).replace(minute=0),
-        )
-    ]
+    exchange_NO = statnett.fetch_exchange_range(
+        zone_key1=zone_1,
+        zone_key2=zone_2,
+        start=min([e["datetime"] for e in exchanges]),
+        end=arrow.get(max([e["datetime"] for e in exchanges])).shift(hours=1).datetime,
+        session=r,
+        logger=logger,
+    )
     exchanges.extend(exchange_NO)
 
     # add DK1 data (only for dates after operation)
     if target_datetime > arrow.get("2019-08-24", "YYYY-MM-DD"):
         zone_1, zone_2 = sorted(["DK-DK1", zone_key])
         df_dk = pd.DataFrame(
-            DK.fetch_exchange(
-                zone_key1=zone_1,
-                zone_key2=zone_2,
+            series(
+                DK.fetch_exchange,
+                zone_1,
+                zone_2,
                 session=r,
                 target_datetime=target_datetime,
                 logger=logger,
@@ -132,10 +122,7 @@ def fetch_production(
         - df_consumptions_with_exchanges["NL_import"]
     )
 
-    # Fetch all production
-    productions = ENTSOE.fetch_production(
-        zone_key=zone_key, session=r, target_datetime=target_datetime, logger=logger
-    )
+    productions = inputs.production
     if not productions:
         return
 
@@ -163,12 +150,15 @@ def fetch_production(
             )
 
     # Add capacities
-    solar_capacity_df = get_solar_capacities()
-    wind_capacity_df = get_wind_capacities()
-    for p in productions:
+    datetimes = [p["datetime"] for p in productions]
+    solar_capacities = capacity.capacity_at("NL", "solar", datetimes, r, logger)
+    wind_capacities = capacity.capacity_at("NL", "wind", datetimes, r, logger)
+    for p, solar_capacity, wind_capacity in zip(
+        productions, solar_capacities, wind_capacities
+    ):
         p["capacity"] = {
-            "solar": round(get_solar_capacity_at(p["datetime"], solar_capacity_df), 3),
-            "wind": round(get_wind_capacity_at(p["datetime"], wind_capacity_df), 3),
+            "solar": round(float(solar_capacity), 3),
+            "wind": round(float(wind_capacity), 3),
         }
 
     # Filter invalid
@@ -261,30 +251,23 @@ def get_production_data_energieopwek(date, session: Optional[Session] = None):
     return df
 
 
-def get_wind_capacities() -> pd.DataFrame:
+@capacity.source("NL", "wind", ttl=timedelta(days=7))
+def get_wind_capacities(session: Session, logger: Logger) -> pd.Series:
     url_wind_capacities = "https://api.windstats.nl/stats"
 
-    capacities_df = pd.DataFrame(columns=["datetime", "capacity (MW)"])
-    try:
-        r = get(url_wind_capacities)
-        per_year_split_capacity = r.json()["combinedPowerPerYearSplitByLandAndSea"]
-    except Exception as e:
-        logger.error(f"Error fetching wind capacities: {e}")
-        return capacities_df
+    r = session.get(url_wind_capacities)
+    per_year_split_capacity = r.json()["combinedPowerPerYearSplitByLandAndSea"]
 
-    per_year_capacity = {
-        f"{year}-01-01 00:00:00+00:00": sum(split.values())
-        for (year, split) in per_year_split_capacity.items()
-    }
-
-    capacities_df["datetime"] = pd.to_datetime(list(per_year_capacity.keys()))
-    capacities_df["capacity (MW)"] = list(per_year_capacity.values())
-    capacities_df = capacities_df.set_index("datetime")
-
-    return capacities_df
+    return pd.Series(
+        {
+            f"{year}-01-01 00:00:00+00:00": sum(split.values())
+            for (year, split) in per_year_split_capacity.items()
+        }
+    )
 
 
-def get_solar_capacities() -> pd.DataFrame:
+@capacity.source("NL", "solar", ttl=timedelta(days=7))
+def get_solar_capacities(session: Session, logger: Logger) -> pd.Series:
     solar_capacity_base_url = "https://opendata.cbs.nl/ODataApi/odata/82610ENG/UntypedDataSet?$filter=((EnergySourcesTechniques+eq+%27E006590+%27))+and+("
 
     START_YEAR = 2010
@@ -299,50 +282,17 @@ def get_solar_capacities() -> pd.DataFrame:
         else:
             url_solar_capacity += f"(Periods+eq+%27{year}JJ00%27)+or+"
 
-    solar_capacity_df = pd.DataFrame(columns=["datetime", "capacity (MW)"])
+    r = session.get(url_solar_capacity)
+    per_year_capacity = r.json()["value"]
 
-    try:
-        r = get(url_solar_capacity)
-        per_year_capacity = r.json()["value"]
-    except Exception as e:
-        logger.error(f"Error fetching solar capacities: {e}")
-        return solar_capacity_df
-
-    for yearly_row in per_year_capacity:
-        capacity = float(yearly_row["ElectricalCapacityEndOfYear_8"])
-        datetime = arrow.get(yearly_row["Periods"].split("JJ")[0]).format()
-        solar_capacity_df = solar_capacity_df.append(
-            {"datetime": datetime, "capacity (MW)": capacity}, ignore_index=True
-        )
-    solar_capacity_df.datetime = pd.to_datetime(solar_capacity_df.datetime)
-    solar_capacity_df = solar_capacity_df.set_index("datetime")
-
-    return solar_capacity_df
-
-
-def _get_capacity_at(date: datetime, mode: str, capacity_df: pd.DataFrame) -> float:
-    assert mode in ["solar", "wind"]
-    default_capacity = ZONE_CONFIG["capacity"][mode]
-    if capacity_df.empty:
-        return default_capacity
-    latest_year = date.year
-    while latest_year > 2015:
-        # Latest capacity for the year to date might not have been published yet, so revert back to latest known year
-        if capacity_df[capacity_df.index.year == latest_year]["capacity (MW)"].empty:
-            latest_year -= 1
-        else:
-            return float(
-                capacity_df[capacity_df.index.year == latest_year]["capacity (MW)"][0]
+    return pd.Series(
+        {
+            arrow.get(yearly_row["Periods"].split("JJ")[0]).format(): float(
+                yearly_row["ElectricalCapacityEndOfYear_8"]
             )
-    return default_capacity
-
-
-def get_solar_capacity_at(date: datetime, solar_capacity_df: pd.DataFrame) -> float:
-    return _get_capacity_at(date, "solar", solar_capacity_df)
-
-
-def get_wind_capacity_at(date: datetime, wind_capacity_df: pd.DataFrame) -> float:
-    return _get_capacity_at(date, "wind", wind_capacity_df)
+            for yearly_row in per_year_capacity
+        }
+    )
 
 
 if __name__ == "__main__":
@@ -1,13 +1,18 @@
+import time
+from collections import OrderedDict, defaultdict
 from datetime import datetime, timedelta
 from logging import Logger, getLogger
-from typing import Dict, List, Mapping, Optional, Tuple, Union
+from threading import Lock
+from typing import Dict, List, Mapping, NamedTuple, Optional, Tuple, Union
 
 import arrow
 import pandas as pd
 import requests
 from requests import Session
 
+from parsers.lib.cache import immutable
 from parsers.lib.config import refetch_frequency
+from parsers.lib.singleflight import SingleFlight
 
 REFETCH_FREQUENCY = timedelta(days=21)
 
@@ -62,6 +67,27 @@ OPENNEM_STORAGE_CATEGORIES = {
 }
 SOURCE = "opennem.org.au"
 
+# In live mode, every zone, price and exchange reads the same latest.json, and
+# for past periods the same monthly document per network (and region). Each
+# download is parsed and indexed once and shared: latest.json and documents of
+# the current month are downloaded again once older than LIVE_CACHE_TTL, those
+# of past months are final.
+LIVE_CACHE_TTL = 5 * 60
+MAX_CACHED_DOCUMENTS = 64
+
+
+class Datasets(NamedTuple):
+    """The datasets of a document, in document order, indexed by (type, region)
+    and by (type, interconnector id), e.g. ("power", "NSW1->QLD1")."""
+
+    by_region: Dict[Tuple[str, str], List[dict]]
+    by_interconnector: Dict[Tuple[str, str], List[dict]]
+
+
+_documents: "OrderedDict[str, Tuple[float, Datasets]]" = OrderedDict()
+_documents_lock = Lock()
+_downloads = SingleFlight()
+
 
 def dataset_to_df(dataset):
     series = dataset["history"]
@@ -122,6 +148,22 @@ def sum_vector(pd_series, keys, ignore_nans=False):
         return None
 
 
+def sum_columns(df: pd.DataFrame, keys, ignore_nans=False) -> List[Optional[float]]:
+    """Same as `sum_vector` applied to every row of `df`, for the whole frame at
+    once."""
+    # Only consider keys that are columns of df
+    filtered_keys = df.columns.intersection(keys)
+    if not filtered_keys.size:
+        return [None] * len(df)
+
+    # Require all present keys to be non-null
+    df_filtered = df[filtered_keys]
+    sums = df_filtered.fillna(0).sum(axis=1)
+    if not ignore_nans:
+        sums = sums.where(df_filtered.notnull().all(axis=1))
+    return [None if pd.isnull(value) else value for value in sums.tolist()]
+
+
 def filter_production_objs(
     objs: List[Dict], logger: Logger = getLogger(__name__)
 ) -> List[Dict]:
@@ -171,6 +213,54 @@ def generate_url(
     return url
 
 
+def index_datasets(datasets: List[dict]) -> Datasets:
+    by_region = defaultdict(list)
+    by_interconnector = defaultdict(list)
+    for ds in datasets:
+        if ds.get("region"):
+            by_region[(ds["type"], ds["region"])].append(ds)
+        id_parts = (ds.get("id") or "").split(".")
+        if len(id_parts) > 1:
+            by_interconnector[(ds["type"], id_parts[-2])].append(ds)
+    return Datasets(dict(by_region), dict(by_interconnector))
+
+
+def _fetch_datasets(
+    url: str,
+    is_live: bool,
+    session: Optional[Session],
+    logger: Logger,
+    period_end: Optional[datetime] = None,
+) -> Datasets:
+    """Returns the indexed datasets of a document, downloading it unless it is
+    cached. The datasets are shared between callers and must not be modified.
+    Documents of a period ending at `period_end` can be cached on disk, see
+    parsers.lib.cache."""
+    with _documents_lock:
+        if url in _documents:
+            fetched_at, datasets = _documents[url]
+            if not is_live or time.monotonic() - fetched_at < LIVE_CACHE_TTL:
+                _documents.move_to_end(url)
+                return datasets
+
+    def download() -> Datasets:
+        logger.info(f"Requesting {url}..")
+        with immutable(period_end):
+            r = (session or requests).get(url)
+        r.raise_for_status()
+        logger.debug("Parsing JSON..")
+        datasets = index_datasets(r.json()["data"])
+        with _documents_lock:
+            _documents[url] = (time.monotonic(), datasets)
+            _documents.move_to_end(url)
+            while len(_documents) > MAX_CACHED_DOCUMENTS:
+                _documents.popitem(last=False)
+        return datasets
+
+    # Concurrent callers wait for a single download
+    return _downloads.do(url, download)[0]
+
+
 def fetch_main_price_df(
     zone_key: Union[str, None] = None,
     sorted_zone_keys: Union[str, None] = None,
@@ -224,27 +314,30 @@ def _fetch_main_df(
         logger=logger,
     )
 
+    is_live = target_datetime is None or arrow.get(target_datetime).floor(
+        "month"
+    ) >= arrow.utcnow().floor("month")
+    period_end = (
+        arrow.get(target_datetime).shift(months=1).floor("month").datetime
+        if target_datetime
+        else None
+    )
     # Fetches the last week of data
-    logger.info(f"Requesting {url}..")
-    r = (session or requests).get(url)
-    r.raise_for_status()
-    logger.debug("Parsing JSON..")
-    datasets = r.json()["data"]
+    datasets = _fetch_datasets(url, is_live, session, logger, period_end)
     logger.debug("Filtering datasets..")
 
-    def filter_dataset(ds: dict) -> bool:
-        filter_data_type = ds["type"] == data_type
-        filter_region = False
-        if zone_key:
-            filter_region |= ds.get("region") == region
-        if sorted_zone_keys:
-            filter_region |= (
-                ds.get("id").split(".")[-2]
-                == EXCHANGE_MAPPING_DICTIONARY["->".join(sorted_zone_keys)]["region_id"]
-            )
-        return filter_data_type and filter_region
-
-    filtered_datasets = [ds for ds in datasets if filter_dataset(ds)]
+    filtered_datasets = []
+    if zone_key:
+        filtered_datasets += datasets.by_region.get((data_type, region), [])
+    if sorted_zone_keys:
+        interconnector_id = EXCHANGE_MAPPING_DICTIONARY["->".join(sorted_zone_keys)][
+            "region_id"
+        ]
+        filtered_datasets += [
+            ds
+            for ds in datasets.by_interconnector.get((data_type, interconnector_id), [])
+            if ds not in filtered_datasets
+        ]
     logger.debug("Concatenating datasets..")
     df = pd.concat([dataset_to_df(ds) for ds in filtered_datasets], axis=1)
 
@@ -287,47 +380,39 @@ def fetch_production(
         df["BATTERY_DISCHARGING"] = df["BATTERY_DISCHARGING"] * -1
 
     logger.debug("Preparing final objects..")
+    production = {
+        mode: sum_columns(df, keys)
+        for mode, keys in OPENNEM_PRODUCTION_CATEGORIES.items()
+    }
+    storage = {
+        # opennem reports charging as negative, we here should report as positive
+        # Note: we made the sign switch before, so we can just sum them up
+        "battery": sum_columns(df, OPENNEM_STORAGE_CATEGORIES["battery"]),
+        # opennem reports pumping as positive, we here should report as positive
+        "hydro": sum_columns(df, OPENNEM_STORAGE_CATEGORIES["hydro"]),
+    }
+    capacity = {
+        mode: sum_vector(capacities, keys)
+        for mode, keys in OPENNEM_PRODUCTION_CATEGORIES.items()
+    }
+    capacity["hydro storage"] = capacities.get(OPENNEM_STORAGE_CATEGORIES["hydro"][0])
+    capacity["battery storage"] = capacities.get(
+        OPENNEM_STORAGE_CATEGORIES["battery"][0]
+    )
     objs = [
         {
             "datetime": arrow.get(dt.to_pydatetime()).datetime,
-            "production": {  # Unit is MW
-                "coal": sum_vector(row, OPENNEM_PRODUCTION_CATEGORIES["coal"]),
-                "gas": sum_vector(row, OPENNEM_PRODUCTION_CATEGORIES["gas"]),
-                "oil": sum_vector(row, OPENNEM_PRODUCTION_CATEGORIES["oil"]),
-                "hydro": sum_vector(row, OPENNEM_PRODUCTION_CATEGORIES["hydro"]),
-                "wind": sum_vector(row, OPENNEM_PRODUCTION_CATEGORIES["wind"]),
-                "biomass": sum_vector(row, OPENNEM_PRODUCTION_CATEGORIES["biomass"]),
-                # We here assume all rooftop solar is fed to the grid
-                # This assumption should be checked and we should here only report
-                # grid-level generation
-                "solar": sum_vector(row, OPENNEM_PRODUCTION_CATEGORIES["solar"]),
-            },
-            "storage": {
-                # opennem reports charging as negative, we here should report as positive
-                # Note: we made the sign switch before, so we can just sum them up
-                "battery": sum_vector(row, OPENNEM_STORAGE_CATEGORIES["battery"]),
-                # opennem reports pumping as positive, we here should report as positive
-                "hydro": sum_vector(row, OPENNEM_STORAGE_CATEGORIES["hydro"]),
-            },
-            "capacity": {
-                "coal": sum_vector(capacities, OPENNEM_PRODUCTION_CATEGORIES["coal"]),
-                "gas": sum_vector(capacities, OPENNEM_PRODUCTION_CATEGORIES["gas"]),
-                "oil": sum_vector(capacities, OPENNEM_PRODUCTION_CATEGORIES["oil"]),
-                "hydro": sum_vector(capacities, OPENNEM_PRODUCTION_CATEGORIES["hydro"]),
-                "wind": sum_vector(capacities, OPENNEM_PRODUCTION_CATEGORIES["wind"]),
-                "biomass": sum_vector(
-                    capacities, OPENNEM_PRODUCTION_CATEGORIES["biomass"]
-                ),
-                "solar": sum_vector(capacities, OPENNEM_PRODUCTION_CATEGORIES["solar"]),
-                "hydro storage": capacities.get(OPENNEM_STORAGE_CATEGORIES["hydro"][0]),
-                "battery storage": capacities.get(
-                    OPENNEM_STORAGE_CATEGORIES["battery"][0]
-                ),
-            },
+            # Unit is MW
+            # We here assume all rooftop solar is fed to the grid
+            # This assumption should be checked and we should here only report
+            # grid-level generation
+            "production": {mode: values[i] for mode, values in production.items()},
+            "storage": {mode: values[i] for mode, values in storage.items()},
+            "capacity": dict(capacity),
             "source": SOURCE,
             "zoneKey": zone_key,
         }
-        for dt, row in df.iterrows()
+        for i, dt in enumerate(df.index)
     ]
 
     objs = filter_production_objs(objs)
@@ -402,7 +487,7 @@ def fetch_exchange(
             "source": SOURCE,
             "sortedZoneKeys": key,
         }
-        for dt, value in series.iteritems()
+        for dt, value in series.items()
     ]
 
 
@@ -2,10 +2,13 @@
 # -*- coding: utf-8 -*-
 
 import json
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from functools import reduce
 from logging import Logger, getLogger
-from typing import List, Optional, Union
+from threading import Lock
+from typing import Dict, List, Optional, Tuple, Union
 
 import arrow
 import pandas as pd
@@ -54,6 +57,13 @@ exchange_ids = {
 
 # Each exchange is contained in a div tag with a "data-id" attribute that is unique.
 
+# Hourly flow diagrams are shared by all exchange pairs. Historical ones don't change
+# once published, so they are cached per (date, hour) and indexed by exchange id.
+MAX_FLOW_SNAPSHOTS = 24 * 7
+MAX_PARALLEL_FLOW_REQUESTS = 8
+_flow_snapshots: "OrderedDict[Tuple[str, int], Dict[int, dict]]" = OrderedDict()
+_flow_snapshots_lock = Lock()
+
 
 tz = "Europe/Moscow"
 
@@ -264,6 +274,32 @@ def response_checker(json_content) -> bool:
     return non_zero
 
 
+def _fetch_flow_snapshot(
+    session: Session, url: str, date: str, hour: int, cache: bool
+) -> Optional[Dict[int, dict]]:
+    """Returns the flows of one hourly flow diagram indexed by `Id`, or None if
+    the data is not yet available. Only available snapshots are cached."""
+    key = (date, hour)
+    if cache:
+        with _flow_snapshots_lock:
+            if key in _flow_snapshots:
+                _flow_snapshots.move_to_end(key)
+                return _flow_snapshots[key]
+
+    response = session.get(url, verify=False)
+    json_content = json.loads(response.text)
+    if not response_checker(json_content):
+        return None
+
+    flows = {item["Id"]: item for item in json_content["Flows"]}
+    if cache:
+        with _flow_snapshots_lock:
+            _flow_snapshots[key] = flows
+            while len(_flow_snapshots) > MAX_FLOW_SNAPSHOTS:
+                _flow_snapshots.popitem(last=False)
+    return flows
+
+
 def fetch_exchange(
     zone_key1: str,
     zone_key2: str,
@@ -272,7 +308,9 @@ def fetch_exchange(
     logger: Logger = getLogger(__name__),
 ) -> list:
     """Requests the last known power exchange (in MW) between two zones."""
-    if target_datetime:
+    if isinstance(target_datetime, datetime):
+        today = arrow.get(target_datetime)
+    elif target_datetime:
         today = arrow.get(target_datetime, "YYYYMMDD")
     else:
         today = arrow.utcnow()
@@ -293,16 +331,19 @@ def fetch_exchange(
             url = BASE_EXCHANGE_URL + DATE + "&Hour={}".format(hour)
             exchange_urls.append((url, int(hour)))
 
-    datapoints = []
-    for url, hour in exchange_urls:
-        response = r.get(url, verify=False)
-        json_content = json.loads(response.text)
+    def fetch_hour(url_and_hour: Tuple[str, int]) -> Optional[Dict[int, dict]]:
+        url, hour = url_and_hour
+        return _fetch_flow_snapshot(r, url, date, hour, cache=bool(target_datetime))
 
-        if response_checker(json_content):
-            datapoints.append((json_content["Flows"], hour))
-        else:
-            # data not yet available for this hour
-            continue
+    with ThreadPoolExecutor(max_workers=MAX_PARALLEL_FLOW_REQUESTS) as executor:
+        snapshots = list(executor.map(fetch_hour, exchange_urls))
+
+    datapoints = [
+        (flows, hour)
+        for flows, (_, hour) in zip(snapshots, exchange_urls)
+        # data not yet available for this hour
+        if flows is not None
+    ]
 
     sortedcodes = "->".join(sorted([zone_key1, zone_key2]))
     reversesortedcodes = "->".join(sorted([zone_key1, zone_key2], reverse=True))
@@ -319,8 +360,7 @@ def fetch_exchange(
     data = []
     for datapoint, hour in datapoints:
         try:
-            exchange = [item for item in datapoint if item["Id"] == exchange_id][0]
-            flow = exchange.get("NumValue") * direction
+            flow = datapoint[exchange_id]["NumValue"] * direction
         except KeyError:
             # flow is unknown or not available
             flow = None
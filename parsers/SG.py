@@ -8,9 +8,10 @@ from typing import Optional
 
 import arrow
 from PIL import Image, ImageOps
-from pytesseract import image_to_string
 from requests import Session
 
+from .lib.ocr import image_to_string
+
 TIMEZONE = "Asia/Singapore"
 
 TICKER_URL = "https://www.emcsg.com/ChartServer/blue/ticker"
@@ -2,6 +2,7 @@
 
 from collections import defaultdict
 from datetime import datetime, timedelta
+from io import StringIO
 from logging import Logger, getLogger
 from typing import List, Optional, Union
 
@@ -10,6 +11,7 @@ import pandas
 from bs4 import BeautifulSoup
 from requests import Session
 
+from parsers.lib.cache import immutable
 from parsers.lib.config import refetch_frequency
 
 CAISO_PROXY = "https://us-ca-proxy-jfnx5klx2a-uw.a.run.app"
@@ -27,7 +29,7 @@ def fetch_production(
 ) -> list:
     """Requests the last known production mix (in MW) of a given country."""
     if target_datetime:
-        return fetch_historical_production(target_datetime, zone_key)
+        return fetch_historical_production(target_datetime, zone_key, session)
 
     target_datetime = arrow.get(target_datetime)
 
@@ -91,15 +93,23 @@ def fetch_production(
     return daily_data
 
 
-def fetch_historical_production(target_datetime: datetime, zone_key: str):
-    return fetch_historical_data(target_datetime, zone_key)[0]
+def fetch_historical_production(
+    target_datetime: datetime, zone_key: str, session: Optional[Session] = None
+):
+    return fetch_historical_data(target_datetime, zone_key, session)[0]
 
 
-def fetch_historical_exchange(target_datetime: datetime):
-    return fetch_historical_data(target_datetime)[1]
+def fetch_historical_exchange(
+    target_datetime: datetime, session: Optional[Session] = None
+):
+    return fetch_historical_data(target_datetime, session=session)[1]
 
 
-def fetch_historical_data(target_datetime: datetime, zone_key: str = "US-CA"):
+def fetch_historical_data(
+    target_datetime: datetime,
+    zone_key: str = "US-CA",
+    session: Optional[Session] = None,
+):
     # caiso.com provides daily data until the day before today
     # get a clean date at the beginning of yesterday
     target_date = (
@@ -113,9 +123,14 @@ def fetch_historical_data(target_datetime: datetime, zone_key: str = "US-CA"):
         + target_date.format("YYYYMMDD")
         + "_DailyRenewablesWatch.txt"
     )
+    # Downloaded once through the session, so that it can be cached
+    with immutable(target_date.shift(days=1).datetime):
+        response = (session or Session()).get(url)
+    response.raise_for_status()
+    report = response.text
 
     renewable_resources = pandas.read_table(
-        url,
+        StringIO(report),
         sep="\t\t",
         skiprows=2,
         header=None,
@@ -134,7 +149,7 @@ def fetch_historical_data(target_datetime: datetime, zone_key: str = "US-CA"):
         engine="python",
     )
     other_resources = pandas.read_table(
-        url,
+        StringIO(report),
         sep="\t\t",
         skiprows=30,
         header=None,
@@ -222,7 +237,7 @@ def fetch_exchange(
         return exchange
 
     if isinstance(target_datetime, datetime):
-        return fetch_historical_exchange(target_datetime)
+        return fetch_historical_exchange(target_datetime, s)
 
     # CSV has imports to California as positive.
     # Electricity Map expects A->B to indicate flow to B as positive.
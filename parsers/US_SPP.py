@@ -3,15 +3,17 @@
 """Parser for the Southwest Power Pool area of the United States."""
 
 
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from io import StringIO
 from logging import Logger, getLogger
 from typing import Optional
 
+import numpy as np
 import pandas as pd
 from dateutil import parser, tz
 from requests import Session
 
+from parsers.lib.cache import immutable
 from parsers.lib.config import refetch_frequency
 
 HISTORIC_GENERATION_BASE_URL = "https://marketplace.spp.org/file-browser-api/download/generation-mix-historical?path=%2F"
@@ -48,11 +50,22 @@ def get_data(url, session: Optional[Session] = None):
     return df
 
 
+def _parse_gmt_datetimes(values: pd.Series) -> list:
+    """Parses a column of timestamps into datetimes with GMT attached."""
+    gmt = tz.gettz("Etc/GMT")
+    return [ts.to_pydatetime().replace(tzinfo=gmt) for ts in pd.to_datetime(values)]
+
+
+def _to_float(values: pd.Series) -> pd.Series:
+    """Converts a column to floats, unparseable values become NaN."""
+    return pd.to_numeric(values, errors="coerce").astype(float)
+
+
 def data_processor(df, logger: Logger) -> list:
     """
     Takes a dataframe and logging instance as input.
     Checks for new generation types and logs a warning if any are found.
-    Parses the dataframe row by row removing unneeded keys.
+    Parses the dataframe column-wise removing unneeded keys.
 
     :return: list of tuples containing a datetime object and production dictionary.
     """
@@ -97,19 +110,23 @@ def data_processor(df, logger: Logger) -> list:
 
     keys_to_remove = keys_to_remove | unknown_keys
 
-    processed_data = []
-    for index, row in df.iterrows():
-        production = row.to_dict()
-        production["unknown"] = sum([production[k] for k in unknown_keys])
+    # Historical files hold a full year of 5-minute data, so everything below
+    # works on whole columns. Any NaN in an unknown column propagates to "unknown".
+    unknown = 0
+    for k in unknown_keys:
+        unknown = unknown + df[k].to_numpy()
+    if isinstance(unknown, int):
+        unknown = np.zeros(len(df), dtype=int)
 
-        dt_aware = production["GMT MKT Interval"].to_pydatetime()
-        for k in keys_to_remove:
-            production.pop(k, None)
+    kept_keys = [k for k in df.columns if k not in keys_to_remove]
+    mapped_keys = [MAPPING.get(k, k) for k in kept_keys] + ["unknown"]
+    columns = [df[k].tolist() for k in kept_keys] + [unknown.tolist()]
+    datetimes = [ts.to_pydatetime() for ts in df["GMT MKT Interval"]]
 
-        mapped_production = {MAPPING.get(k, k): v for k, v in production.items()}
-
-        processed_data.append((dt_aware, mapped_production))
-    return processed_data
+    return [
+        (dt_aware, dict(zip(mapped_keys, values)))
+        for dt_aware, values in zip(datetimes, zip(*columns))
+    ]
 
 
 @refetch_frequency(timedelta(days=1))
@@ -136,7 +153,10 @@ def fetch_production(
             filename = f"GenMix_{target_year}.csv"
 
         historic_generation_url = HISTORIC_GENERATION_BASE_URL + filename
-        raw_data = get_data(historic_generation_url, session=session)
+        # The file of a year is final once the year is over, the year-to-date
+        # file keeps growing
+        with immutable(datetime(target_year + 1, 1, 1, tzinfo=timezone.utc)):
+            raw_data = get_data(historic_generation_url, session=session)
         # In some cases the timeseries column is named differently, so we standardize it
         raw_data.rename(columns={"GMTTime": "GMT MKT Interval"}, inplace=True)
 
@@ -197,23 +217,21 @@ def fetch_exchange(
 
     # TODO check glossary for flow direction.
 
-    exchange_data = []
-    for index, row in raw_data.iterrows():
-        all_exchanges = row.to_dict()
-
-        dt_aware = parser.parse(all_exchanges["GMTTime"])
+    netflows = 0
+    for tie in exchange_ties:
+        netflows = netflows + raw_data[tie].to_numpy()
 
-        flows = [all_exchanges[tie] for tie in exchange_ties]
-        netflow = sum(flows)
+    datetimes = [ts.to_pydatetime() for ts in pd.to_datetime(raw_data["GMTTime"])]
 
-        exchange = {
+    exchange_data = [
+        {
             "sortedZoneKeys": sorted_codes,
             "datetime": dt_aware,
             "netFlow": netflow,
             "source": "spp.org",
         }
-
-        exchange_data.append(exchange)
+        for dt_aware, netflow in zip(datetimes, netflows.tolist())
+    ]
 
     return exchange_data
 
@@ -239,25 +257,18 @@ def fetch_load_forecast(
 
     raw_data = get_data(LOAD_URL)
 
-    data = []
-    for index, row in raw_data.iterrows():
-        forecast = row.to_dict()
-
-        dt = parser.parse(forecast["GMTIntervalEnd"]).replace(
-            tzinfo=tz.gettz("Etc/GMT")
-        )
-        load = float(forecast["MTLF"])
+    datetimes = _parse_gmt_datetimes(raw_data["GMTIntervalEnd"])
+    loads = raw_data["MTLF"].astype(float).tolist()
 
-        datapoint = {
+    return [
+        {
             "datetime": dt,
             "value": load,
             "zoneKey": zone_key,
             "source": "spp.org",
         }
-
-        data.append(datapoint)
-
-    return data
+        for dt, load in zip(datetimes, loads)
+    ]
 
 
 @refetch_frequency(timedelta(days=1))
@@ -285,34 +296,29 @@ def fetch_wind_solar_forecasts(
     # sometimes there is a leading whitespace in column names
     raw_data.columns = raw_data.columns.str.lstrip()
 
-    data = []
-    for index, row in raw_data.iterrows():
-        forecast = row.to_dict()
-
-        dt = parser.parse(forecast["GMTIntervalEnd"]).replace(
-            tzinfo=tz.gettz("Etc/GMT")
-        )
-
-        try:
-            solar = float(forecast["Wind Forecast MW"])
-            wind = float(forecast["Solar Forecast MW"])
-        except ValueError:
-            # can be NaN
-            continue
+    datetimes = _parse_gmt_datetimes(raw_data["GMTIntervalEnd"])
+    solar = _to_float(raw_data["Wind Forecast MW"])
+    wind = _to_float(raw_data["Solar Forecast MW"])
+    # Rows with values that can't be read as floats are skipped, NaNs are kept.
+    valid = (solar.notna() | raw_data["Wind Forecast MW"].isna()) & (
+        wind.notna() | raw_data["Solar Forecast MW"].isna()
+    )
 
-        datapoint = {
+    return [
+        {
             "datetime": dt,
             "production": {
-                "solar": solar,
-                "wind": wind,
+                "solar": solar_value,
+                "wind": wind_value,
             },
             "zoneKey": zone_key,
             "source": "spp.org",
         }
-
-        data.append(datapoint)
-
-    return data
+        for dt, solar_value, wind_value, is_valid in zip(
+            datetimes, solar.tolist(), wind.tolist(), valid.tolist()
+        )
+        if is_valid
+    ]
 
 
 if __name__ == "__main__":
@@ -0,0 +1,226 @@
+"""
+asyncio execution path for parsers.
+
+`AsyncSession` is a small aiohttp-backed stand-in for `requests.Session`, passed
+to parsers through their usual `session` argument. A parser module opts in by
+defining `<function>_async` next to a configured `<function>`, e.g.
+`ENTSOE.fetch_exchange_async`. `run_parsers` fans configured entries out onto one
+event loop: async variants are awaited, every other parser runs in a bounded
+thread pool as before.
+
+Requires aiohttp (the `async` extra), which is not needed by the synchronous
+parsers.
+"""
+
+import asyncio
+import importlib
+import json
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import partial
+from logging import Logger, getLogger
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import aiohttp
+
+from electricitymap.contrib.config import EXCHANGES_CONFIG, ZONES_CONFIG
+from electricitymap.contrib.config.constants import EXCHANGE_DATA_TYPES
+from parsers.lib.instrumentation import instrument
+from parsers.lib.singleflight import coalescing_session
+
+DEFAULT_CONNECTIONS = 1000
+DEFAULT_CONNECTIONS_PER_HOST = 16
+DEFAULT_THREADS = 16
+DEFAULT_TIMEOUT = 60
+
+
+class AsyncResponse:
+    """The subset of `requests.Response` used by parsers. The body is read when
+    the response is received, so it can be used outside of the event loop."""
+
+    def __init__(
+        self,
+        url: str,
+        status_code: int,
+        headers: Dict[str, str],
+        content: bytes,
+        encoding: Optional[str],
+    ):
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.encoding = encoding or "utf-8"
+
+    @property
+    def ok(self) -> bool:
+        return self.status_code < 400
+
+    @property
+    def text(self) -> str:
+        return self.content.decode(self.encoding, errors="replace")
+
+    def json(self, **kwargs) -> Any:
+        return json.loads(self.text, **kwargs)
+
+
+class AsyncSession:
+    """aiohttp-backed session with a `requests.Session`-like interface, where
+    `get`, `post` and `request` are coroutines.
+
+    The underlying aiohttp session is created on first use, inside the running
+    event loop. Use it as an async context manager or call `close()`.
+    """
+
+    def __init__(
+        self,
+        connections: int = DEFAULT_CONNECTIONS,
+        connections_per_host: int = DEFAULT_CONNECTIONS_PER_HOST,
+        timeout: float = DEFAULT_TIMEOUT,
+    ):
+        self.connections = connections
+        self.connections_per_host = connections_per_host
+        self.timeout = timeout
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=self.connections, limit_per_host=self.connections_per_host
+                ),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+        return self._session
+
+    async def request(
+        self,
+        method: str,
+        url: str,
+        params: Optional[Dict[str, Any]] = None,
+        data: Any = None,
+        json: Any = None,
+        headers: Optional[Dict[str, str]] = None,
+        verify: bool = True,
+        timeout: Optional[float] = None,
+        **kwargs,
+    ) -> AsyncResponse:
+        """Same arguments as `requests.Session.request`. Unsupported ones, such
+        as `stream`, are ignored."""
+        request_kwargs: Dict[str, Any] = {}
+        if timeout is not None:
+            request_kwargs["timeout"] = aiohttp.ClientTimeout(total=timeout)
+        if not verify:
+            request_kwargs["ssl"] = False
+        async with self._get_session().request(
+            method,
+            url,
+            params=params,
+            data=data,
+            json=json,
+            headers=headers,
+            **request_kwargs,
+        ) as response:
+            content = await response.read()
+            return AsyncResponse(
+                str(response.url),
+                response.status,
+                dict(response.headers),
+                content,
+                response.charset,
+            )
+
+    async def get(self, url: str, **kwargs) -> AsyncResponse:
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs) -> AsyncResponse:
+        return await self.request("POST", url, **kwargs)
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def __aenter__(self) -> "AsyncSession":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+
+class ParserRun(NamedTuple):
+    key: str
+    data_type: str
+    result: Any
+    error: Optional[Exception]
+
+
+def get_parser_functions(
+    key: str, data_type: str
+) -> Tuple[Callable, Optional[Callable]]:
+    """Returns the configured parser function and its async variant, if any."""
+    config = EXCHANGES_CONFIG if data_type in EXCHANGE_DATA_TYPES else ZONES_CONFIG
+    function_name = config.get(key, {}).get("parsers", {}).get(data_type)
+    if not function_name:
+        raise NotImplementedError(f"No {data_type} parser configured for {key}")
+    mod_name, fun_name = function_name.split(".")
+    mod = importlib.import_module(f"parsers.{mod_name}")
+    return (
+        instrument(getattr(mod, fun_name), data_type),
+        getattr(mod, f"{fun_name}_async", None),
+    )
+
+
+async def run_parsers(
+    entries: Iterable[Tuple[str, str]],
+    target_datetime: Optional[datetime] = None,
+    session: Optional[AsyncSession] = None,
+    threads: int = DEFAULT_THREADS,
+    logger: Logger = getLogger(__name__),
+) -> List[ParserRun]:
+    """Runs parsers for (key, data type) entries concurrently on the running loop."""
+    loop = asyncio.get_running_loop()
+    sync_session = coalescing_session(pool_size=threads)
+    owns_session = session is None
+    session = session or AsyncSession()
+
+    async def run(executor: ThreadPoolExecutor, key: str, data_type: str) -> ParserRun:
+        args = key.split("->") if data_type in EXCHANGE_DATA_TYPES else [key]
+        try:
+            function, async_function = get_parser_functions(key, data_type)
+            if async_function is not None:
+                result = await async_function(
+                    *args,
+                    session=session,
+                    target_datetime=target_datetime,
+                    logger=logger,
+                )
+            else:
+                result = await loop.run_in_executor(
+                    executor,
+                    partial(
+                        function,
+                        *args,
+                        session=sync_session,
+                        target_datetime=target_datetime,
+                        logger=logger,
+                    ),
+                )
+        except Exception as e:
+            logger.exception(f"{data_type} parser failed for {key}", extra={"key": key})
+            return ParserRun(key, data_type, None, e)
+        return ParserRun(key, data_type, result, None)
+
+    try:
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            return await asyncio.gather(
+                *(run(executor, key, data_type) for key, data_type in entries)
+            )
+    finally:
+        if owns_session:
+            await session.close()
+
+
+def run(entries: Iterable[Tuple[str, str]], **kwargs) -> List[ParserRun]:
+    """Synchronous entry point for `run_parsers`."""
+    return asyncio.run(run_parsers(entries, **kwargs))
@@ -0,0 +1,310 @@
+"""
+Backfills the history of one zone/exchange and data type over a date range.
+
+The range is split into `REFETCH_FREQUENCY`-sized windows (the history returned
+by one call ending at `target_datetime`), which are fetched in parallel. Events
+are deduplicated by datetime (in UTC) and streamed to a JSON lines file as windows
+complete. Completed windows are checkpointed next to the output file, so an
+interrupted run picks up where it stopped. Events can also be appended to a
+parsers.lib.timeseries.TimeSeriesStore (for the data types it has columns for),
+for analysis over mapped arrays, and streamed to a Parquet dataset (see
+parsers.lib.parquet, requires pyarrow). Responses for windows older than the
+cache horizon are kept in a parsers.lib.cache.DiskCache, for parsers that mark
+their requests as cacheable, so a re-run hardly uses the network.
+
+Usage: python -m parsers.lib.backfill DE production 2021-01-01 2022-01-01 -o DE.jsonl
+"""
+
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta, timezone
+from logging import Logger, getLogger
+from pathlib import Path
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Set,
+    TextIO,
+    Tuple,
+)
+
+import arrow
+import click
+from requests import Session
+
+from electricitymap.contrib.config.constants import EXCHANGE_DATA_TYPES
+from electricitymap.contrib.config.model import CONFIG_MODEL
+from parsers.lib import processing
+from parsers.lib.cache import DEFAULT_DIRECTORY, DiskCache, cached_session
+from parsers.lib.instrumentation import instrument
+from parsers.lib.timeseries import COLUMNS, TimeSeriesStore
+
+if TYPE_CHECKING:
+    from parsers.lib.parquet import ParquetWriter
+
+# Window used for parsers that don't declare a refetch frequency.
+DEFAULT_WINDOW = timedelta(hours=1)
+DEFAULT_WORKERS = 4
+
+
+def get_parser_function(key: str, data_type: str) -> Callable:
+    """Returns the configured parser function of a zone or exchange."""
+    if data_type in EXCHANGE_DATA_TYPES:
+        exchange = CONFIG_MODEL.exchanges.get(key)
+        parsers = exchange.parsers if exchange else None
+    else:
+        zone = CONFIG_MODEL.zones.get(key)
+        parsers = zone.parsers if zone else None
+    function = parsers.get_function(data_type) if parsers else None
+    if function is None:
+        raise NotImplementedError(f"No {data_type} parser configured for {key}")
+    return instrument(function, data_type)
+
+
+def split_windows(start: datetime, end: datetime, window: timedelta) -> List[datetime]:
+    """Returns the target datetimes covering (start, end], one per window."""
+    targets = []
+    target = end
+    while target > start:
+        targets.append(target)
+        target -= window
+    return targets
+
+
+def _event_datetime(event: dict) -> datetime:
+    """Returns the datetime of an event in UTC, so that the same instant given
+    with different offsets is deduplicated."""
+    dt = event["datetime"]
+    if isinstance(dt, str):
+        dt = arrow.get(dt).datetime
+    if dt.utcoffset() is None:
+        raise ValueError(f"Event datetime {dt} has no timezone")
+    return dt.astimezone(timezone.utc)
+
+
+def _serialize(value: Any) -> str:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"{type(value)} is not JSON serializable")
+
+
+class Checkpoint:
+    """Set of completed window targets, persisted as JSON after every update."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.done: Set[str] = set()
+        if path.exists():
+            self.done = set(json.loads(path.read_text())["done"])
+
+    def __contains__(self, target: datetime) -> bool:
+        return target.isoformat() in self.done
+
+    def add(self, target: datetime) -> None:
+        self.done.add(target.isoformat())
+        tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+        tmp_path.write_text(json.dumps({"done": sorted(self.done)}))
+        os.replace(tmp_path, self.path)
+
+
+def backfill(
+    key: str,
+    data_type: str,
+    start: datetime,
+    end: datetime,
+    output_path: Path,
+    workers: int = DEFAULT_WORKERS,
+    window: Optional[timedelta] = None,
+    function: Optional[Callable] = None,
+    session: Optional[Session] = None,
+    cache: Optional[DiskCache] = None,
+    store: Optional[TimeSeriesStore] = None,
+    parquet: Optional["ParquetWriter"] = None,
+    logger: Logger = getLogger(__name__),
+) -> Dict[str, int]:
+    """Fetches every window of (start, end] and appends new events to `output_path`.
+
+    Returns counts of fetched, skipped (already checkpointed) and failed windows,
+    and of written events. A window fails if the parser raises, returns an event
+    without a valid datetime, or its events can't be written. Failed windows are
+    retried by the next run.
+
+    With `parquet`, windows are committed to the dataset about every
+    `row_group_size` rows, and only checkpointed once committed.
+    """
+    function = function or get_parser_function(key, data_type)
+    window = window or getattr(function, "REFETCH_FREQUENCY", None) or DEFAULT_WINDOW
+    args = key.split("->") if data_type in EXCHANGE_DATA_TYPES else [key]
+    session = session or Session()
+    if cache is not None:
+        session = cached_session(cache, session)
+
+    output_path = Path(output_path)
+    checkpoint = Checkpoint(output_path.with_suffix(output_path.suffix + ".checkpoint"))
+
+    # Datetimes already written by a previous run
+    seen: Set[str] = set()
+    if output_path.exists():
+        with open(output_path) as f:
+            seen = {
+                _event_datetime(json.loads(line)).isoformat()
+                for line in f
+                if line.strip()
+            }
+
+    all_targets = split_windows(start, end, window)
+    targets = [target for target in all_targets if target not in checkpoint]
+    stats = {
+        "fetched": 0,
+        "skipped": len(all_targets) - len(targets),
+        "failed": 0,
+        "events": 0,
+    }
+
+    def fetch(target: datetime) -> List[dict]:
+        result = function(*args, session=session, target_datetime=target, logger=logger)
+        if isinstance(result, dict):
+            return [result]
+        return list(result or [])
+
+    # Windows whose events aren't committed to the dataset yet, with the events
+    pending: List[Tuple[datetime, List[dict]]] = []
+
+    def complete_pending(output: TextIO) -> None:
+        # Events in the output file are skipped by the next run, so they are
+        # written there last, once the store and dataset have them.
+        try:
+            if parquet is not None:
+                parquet.commit()
+            for _, written in pending:
+                for event in written:
+                    output.write(json.dumps(event, default=_serialize) + "\n")
+            output.flush()
+        except Exception:
+            logger.exception(f"Backfill of {key} {data_type} failed to write")
+            stats["failed"] += len(pending)
+        else:
+            for target, written in pending:
+                checkpoint.add(target)
+                stats["fetched"] += 1
+                stats["events"] += len(written)
+        pending.clear()
+
+    with open(output_path, "a") as output, ThreadPoolExecutor(workers) as executor:
+        futures = {executor.submit(fetch, target): target for target in targets}
+        for future in as_completed(futures):
+            target = futures[future]
+            try:
+                events = future.result()
+                # Results are handled here, in a single thread.
+                written: Dict[str, dict] = {}
+                for dt, event in sorted(
+                    ((_event_datetime(event), event) for event in events),
+                    key=lambda item: item[0],
+                ):
+                    if start <= dt <= end and dt.isoformat() not in seen:
+                        written.setdefault(dt.isoformat(), {**event, "datetime": dt})
+                if store is not None:
+                    store.append(key, data_type, list(written.values()))
+                if parquet is not None:
+                    parquet.write(key, data_type, list(written.values()))
+            except Exception:
+                logger.exception(f"Backfill of {key} {data_type} failed at {target}")
+                stats["failed"] += 1
+                continue
+
+            seen.update(written)
+            pending.append((target, list(written.values())))
+            # Each commit adds a part file per partition
+            if parquet is None or parquet.pending_rows >= parquet.row_group_size:
+                complete_pending(output)
+        complete_pending(output)
+
+    return stats
+
+
+@click.command()
+@click.argument("key")
+@click.argument("data-type")
+@click.argument("start")
+@click.argument("end")
+@click.option("-o", "--output", required=True, help="JSON lines file to append to.")
+@click.option("--workers", default=DEFAULT_WORKERS, show_default=True)
+@click.option("--window-hours", type=float, default=None, help="Overrides the window.")
+@click.option(
+    "--cache-dir",
+    default=str(DEFAULT_DIRECTORY),
+    show_default=True,
+    help="Response cache.",
+)
+@click.option("--no-cache", is_flag=True, help="Don't cache historical responses.")
+@click.option("--store", default=None, help="Also append events to this store.")
+@click.option("--parquet", default=None, help="Also write events to this dataset.")
+@click.option(
+    "--processes",
+    type=int,
+    default=None,
+    envvar=processing.ENV_VARIABLE,
+    help="Run CPU-bound parsing stages in a pool of this many processes.",
+)
+def main(
+    key,
+    data_type,
+    start,
+    end,
+    output,
+    workers,
+    window_hours,
+    cache_dir,
+    no_cache,
+    store,
+    parquet,
+    processes,
+):
+    """\b
+    Examples
+    -------
+    >>> python -m parsers.lib.backfill DE production 2021-01-01 2022-01-01 -o DE.jsonl
+    >>> python -m parsers.lib.backfill "DE->FR" exchange 2022-01-01 2022-02-01 -o x.jsonl
+    """
+    if store and data_type not in COLUMNS:
+        raise click.BadParameter(
+            f"the store has no columns for {data_type}, only for " + ", ".join(COLUMNS),
+            param_hint="--store",
+        )
+    window = timedelta(hours=window_hours) if window_hours else None
+    writer = None
+    if parquet:
+        from parsers.lib.parquet import ParquetWriter
+
+        writer = ParquetWriter(parquet)
+    if processes:
+        processing.start(processes)
+    try:
+        stats = backfill(
+            key,
+            data_type,
+            arrow.get(start).datetime,
+            arrow.get(end).datetime,
+            Path(output),
+            workers=workers,
+            window=window,
+            cache=None if no_cache else DiskCache(cache_dir),
+            store=TimeSeriesStore(store) if store else None,
+            parquet=writer,
+        )
+    finally:
+        processing.shutdown()
+        if writer is not None:
+            writer.close()
+    print(stats)
+
+
+if __name__ == "__main__":
+    # pylint: disable=no-value-for-parameter
+    main()
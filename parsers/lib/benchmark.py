@@ -0,0 +1,244 @@
+"""
+Benchmarks parsers offline against cassettes recorded with
+`test_parser --record` (see parsers.lib.cassette).
+
+Each case is the parser run recorded in one cassette. Its time is split into:
+- network: time spent in the HTTP transport (replayed from the cassette),
+- parse: time spent decoding payloads (BeautifulSoup, `Response.json`, the
+  pandas readers),
+- validate: `parsers.lib.validation.validate` inside the parser, plus the
+  feeder validation of the returned events (parsers.lib.quality),
+- transform: the rest of the parser call.
+Phases are timed by the hooks of parsers.lib.instrumentation. Phase times are
+exclusive (nested phases are not counted twice) and summed over threads, so
+`transform` is a lower bound for parsers that use a thread pool.
+
+The in-memory caches of parser modules (see MEMORY_CACHES) are emptied before
+every run, so each one replays the whole cassette.
+
+Timing runs are separate from one extra run under tracemalloc, which is too slow
+to time with, and gives the peak of memory allocated by each case. The peak RSS
+of the whole benchmark process is reported once, as `process_peak_rss_kb`.
+Results are written as JSON so runs can be compared between commits.
+
+Usage: python -m parsers.lib.benchmark cassettes/*.json.gz -o results.json
+"""
+
+import json
+import platform
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+from collections import defaultdict
+from contextlib import contextmanager
+from logging import CRITICAL, getLogger
+from pathlib import Path
+from threading import Lock, local
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import arrow
+import click
+
+from electricitymap.contrib.config.constants import EXCHANGE_DATA_TYPES
+from parsers.lib import cassette
+from parsers.lib.backfill import get_parser_function
+from parsers.lib.instrumentation import timing_phases
+from parsers.lib.quality import VALIDATORS, ValidationError
+
+PHASES = ("network", "parse", "transform", "validate")
+DEFAULT_REPEAT = 5
+# Module-level caches kept between calls, per parser module. Containers are
+# emptied, other values are reset to None.
+MEMORY_CACHES = {
+    "BR": ["_snapshot"],
+    "OPENNEM": ["_documents"],
+    "RU": ["_flow_snapshots"],
+    "occtonet": ["_link_cache", "_authorised_sessions", "_default_session"],
+    "statnett": ["_flow_maps"],
+    "lib.capacity": ["_series"],
+    "lib.ocr": ["_results"],
+}
+
+
+class PhaseTimer:
+    """Accumulates exclusive time per phase, per thread."""
+
+    def __init__(self):
+        self.totals: Dict[str, float] = defaultdict(float)
+        self._lock = Lock()
+        self._local = local()
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        stack = self._local.__dict__.setdefault("stack", [])
+        # [child time]
+        frame = [0.0]
+        stack.append(frame)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            stack.pop()
+            if stack:
+                stack[-1][0] += elapsed
+            with self._lock:
+                self.totals[name] += elapsed - frame[0]
+
+
+def clear_memory_caches() -> None:
+    """Empties MEMORY_CACHES in every imported copy of the parser modules, e.g.
+    both parsers.BR and electricitymap.contrib.parsers.BR."""
+    for name, module in list(sys.modules.items()):
+        prefix, _, module_name = name.partition("parsers.")
+        if prefix not in ("", "electricitymap.contrib.") or not module_name:
+            continue
+        for attribute in MEMORY_CACHES.get(module_name, []):
+            value = getattr(module, attribute, None)
+            if hasattr(value, "clear"):
+                value.clear()
+            else:
+                setattr(module, attribute, None)
+
+
+def load_case(path: Path) -> Tuple[Dict[str, Any], Callable, List[str]]:
+    """Returns the cassette metadata, parser function and positional arguments."""
+    meta = cassette.Cassette.load(path).meta
+    key, data_type = meta["zone"], meta["data_type"]
+    args = key.split("->") if data_type in EXCHANGE_DATA_TYPES else [key]
+    return meta, get_parser_function(key, data_type), args
+
+
+def run_case(path: Path, timer: PhaseTimer) -> Tuple[int, int]:
+    """Replays one cassette. Returns the number of events and of events that
+    failed feeder validation."""
+    meta, function, args = load_case(path)
+    target_datetime = meta.get("target_datetime")
+    if target_datetime:
+        target_datetime = arrow.get(target_datetime).datetime
+    logger = getLogger(__name__)
+    clear_memory_caches()
+    # Hooks are installed before the cassette replaces the transport
+    with timing_phases(timer), cassette.replaying(path):
+        with timer.phase("transform"):
+            result = function(*args, target_datetime=target_datetime, logger=logger)
+        events = result if isinstance(result, (list, tuple)) else [result]
+        events = [event for event in events if event]
+        failures = 0
+        validator = VALIDATORS.get(meta["data_type"])
+        with timer.phase("validate"):
+            for event in events if validator else []:
+                try:
+                    validator(event, meta["zone"])
+                except ValidationError:
+                    failures += 1
+    return len(events), failures
+
+
+def benchmark(path: Path, repeat: int = DEFAULT_REPEAT) -> Dict[str, Any]:
+    """Benchmarks the parser run recorded in a cassette."""
+    meta, _, _ = load_case(path)
+    # Warm-up: imports and config loading
+    run_case(path, PhaseTimer())
+
+    runs = []
+    for _ in range(repeat):
+        timer = PhaseTimer()
+        events, failures = run_case(path, timer)
+        seconds = {p: timer.totals[p] for p in PHASES}
+        runs.append({**seconds, "total": sum(seconds.values())})
+
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        run_case(path, PhaseTimer())
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    def median(values: List[float]) -> float:
+        return sorted(values)[len(values) // 2]
+
+    return {
+        "cassette": str(path),
+        "zone": meta["zone"],
+        "data_type": meta["data_type"],
+        "events": events,
+        "validation_failures": failures,
+        "repeat": repeat,
+        "seconds": {key: median([run[key] for run in runs]) for key in runs[0]},
+        "seconds_min": {key: min(run[key] for run in runs) for key in runs[0]},
+        "allocated_peak_bytes": peak - before,
+        "allocated_retained_bytes": current - before,
+    }
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, check=True, text=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: List[Dict], baseline: List[Dict]) -> Dict[str, float]:
+    """Ratio of total median time to the baseline, per cassette."""
+    baseline_totals = {r["cassette"]: r["seconds"]["total"] for r in baseline}
+    return {
+        r["cassette"]: r["seconds"]["total"] / baseline_totals[r["cassette"]]
+        for r in results
+        if baseline_totals.get(r["cassette"])
+    }
+
+
+@click.command()
+@click.argument("cassettes", nargs=-1, required=True, type=click.Path(exists=True))
+@click.option("--repeat", default=DEFAULT_REPEAT, show_default=True)
+@click.option("-o", "--output", default=None, help="JSON file to write results to.")
+@click.option("--baseline", default=None, help="Previous results to compare with.")
+def main(cassettes, repeat, output, baseline):
+    """\b
+    Examples
+    -------
+    >>> python -m parsers.lib.benchmark cassettes/*.json.gz -o after.json
+    >>> python -m parsers.lib.benchmark cassettes/*.json.gz --baseline before.json
+    """
+    # Parser logging would dominate short runs
+    getLogger().setLevel(CRITICAL)
+    results = [benchmark(Path(path), repeat) for path in cassettes]
+
+    print(f"{'case':<40}" + "".join(f"{p:>11}" for p in PHASES + ("total",)))
+    for result in results:
+        case = f"{result['zone']} {result['data_type']}"
+        seconds = result["seconds"]
+        print(
+            f"{case:<40}"
+            + "".join(f"{seconds[p] * 1000:>9.1f}ms" for p in PHASES + ("total",))
+        )
+    if baseline:
+        ratios = compare(results, json.loads(Path(baseline).read_text())["results"])
+        for path, ratio in sorted(ratios.items(), key=lambda item: -item[1]):
+            print(f"{ratio:6.2f}x  {path}")
+
+    if output:
+        Path(output).write_text(
+            json.dumps(
+                {
+                    "revision": _git_revision(),
+                    "python": platform.python_version(),
+                    "process_peak_rss_kb": resource.getrusage(
+                        resource.RUSAGE_SELF
+                    ).ru_maxrss,
+                    "results": results,
+                },
+                indent=2,
+            )
+        )
+
+
+if __name__ == "__main__":
+    # pylint: disable=no-value-for-parameter
+    main()
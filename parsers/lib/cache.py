@@ -0,0 +1,217 @@
+"""
+On-disk cache for upstream documents that can't change anymore.
+
+Documents describing a period that is old enough, such as ENTSOE windows in the
+past or CAISO daily reports, are final once published. Responses to requests
+made while fetching such a period are kept on disk, so re-running a backfill
+hardly touches the network.
+
+Caching is opt-in per request: a parser wraps a request in `immutable` with
+the end of the period the requested document covers, e.g. the end of the day of
+a daily report or the end of the queried window:
+
+    with immutable(period_end):
+        response = session.get(url)
+
+Responses are only cached if that period ended longer than the horizon ago and
+the session has a CachingAdapter mounted, as backfill sessions do:
+
+    session = cached_session(DiskCache())
+    fetch_production("DE", session=session, target_datetime=target_datetime)
+
+Requests outside of `immutable`, such as live or undated URLs, and requests in
+`uncached()` always go to the network.
+
+Entries are gzipped files named after a hash of the normalised request (method,
+URL with sorted query and redacted credentials, body). They are written
+atomically, so several worker processes can share a cache directory. The
+least recently used entries are evicted once the directory grows over its size
+limit.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from threading import Lock
+from typing import Iterator, Optional, Tuple, Union
+
+from requests import PreparedRequest, Response, Session
+from requests.adapters import HTTPAdapter
+
+from parsers.lib.cassette import build_response, request_key, response_meta
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+DEFAULT_DIRECTORY = Path(
+    os.environ.get(
+        "PARSER_CACHE_DIR", Path.home() / ".cache" / "electricitymap" / "parsers"
+    )
+)
+DEFAULT_HORIZON = timedelta(days=7)
+DEFAULT_MAX_BYTES = 2 * 1024**3
+CACHEABLE_METHODS = {"GET", "POST"}
+
+_cacheable: ContextVar[bool] = ContextVar("_cacheable", default=False)
+
+
+@contextmanager
+def immutable(
+    period_end: Optional[datetime], horizon: timedelta = DEFAULT_HORIZON
+) -> Iterator[bool]:
+    """Makes requests in the block, for documents covering a period that ends at
+    `period_end`, cacheable if that is older than `horizon`. Yields whether it
+    is."""
+    cacheable = period_end is not None and (
+        period_end.astimezone(timezone.utc) < datetime.now(timezone.utc) - horizon
+    )
+    token = _cacheable.set(cacheable)
+    try:
+        yield cacheable
+    finally:
+        _cacheable.reset(token)
+
+
+@contextmanager
+def uncached() -> Iterator[None]:
+    """Bypasses the cache for requests in the block."""
+    token = _cacheable.set(False)
+    try:
+        yield
+    finally:
+        _cacheable.reset(token)
+
+
+class DiskCache:
+    """Size-bounded, multi-process safe store of compressed responses."""
+
+    def __init__(
+        self,
+        directory: Union[str, Path] = DEFAULT_DIRECTORY,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+    ):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        # Bytes written since the size of the directory was last checked
+        self._written = 0
+        self._lock = Lock()
+
+    def _path(self, key: str) -> Path:
+        digest = hashlib.sha256(key.encode()).hexdigest()
+        return self.directory / digest[:2] / f"{digest}.gz"
+
+    def get(self, key: str) -> Optional[Tuple[dict, bytes]]:
+        path = self._path(key)
+        try:
+            with gzip.open(path, "rb") as f:
+                meta = json.loads(f.readline())
+                content = f.read()
+            # Marks the entry as recently used
+            os.utime(path)
+        except (OSError, EOFError, ValueError):
+            # Missing, evicted by another process or truncated
+            return None
+        if meta.pop("key", None) != key:
+            return None
+        return meta, content
+
+    def set(self, key: str, meta: dict, content: bytes) -> None:
+        path = self._path(key)
+        path.parent.mkdir(exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as raw, gzip.GzipFile(fileobj=raw, mode="wb") as f:
+                f.write(json.dumps({"key": key, **meta}).encode() + b"\n")
+                f.write(content)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        with self._lock:
+            self._written += path.stat().st_size
+            should_evict = self._written > self.max_bytes // 10
+            if should_evict:
+                self._written = 0
+        if should_evict:
+            self.evict()
+
+    def evict(self) -> None:
+        """Removes least recently used entries until the cache fits its limit.
+        Skipped if another process is already evicting."""
+        with open(self.directory / ".lock", "w") as lock:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    return
+            entries = []
+            for path in self.directory.glob("*/*.gz"):
+                try:
+                    stat = path.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    path.unlink()
+                except OSError:
+                    pass
+                total -= size
+
+
+class CachingAdapter(HTTPAdapter):
+    """Serves cacheable requests from a DiskCache."""
+
+    def __init__(self, cache: DiskCache, **kwargs):
+        super().__init__(**kwargs)
+        self.cache = cache
+
+    def send(self, request: PreparedRequest, *args, **kwargs) -> Response:
+        if not _cacheable.get() or request.method not in CACHEABLE_METHODS:
+            return super().send(request, *args, **kwargs)
+        key = request_key(request.method, request.url, request.body)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return build_response(request, *cached)
+        response = super().send(request, *args, **kwargs)
+        if response.status_code == 200:
+            self.cache.set(key, response_meta(response), response.content)
+        return response
+
+
+def cached_session(cache: DiskCache, session: Optional[Session] = None) -> Session:
+    """A new session with a CachingAdapter for http and https. The settings of
+    `session`, such as headers, cookies and auth, are copied; `session` itself
+    and its adapters are left as they are."""
+    cached = Session()
+    if session is not None:
+        cached.headers = session.headers.copy()
+        cached.cookies = session.cookies.copy()
+        cached.hooks = {event: list(hooks) for event, hooks in session.hooks.items()}
+        cached.proxies = session.proxies.copy()
+        cached.params = session.params.copy()
+        for attribute in (
+            "auth",
+            "verify",
+            "cert",
+            "stream",
+            "trust_env",
+            "max_redirects",
+        ):
+            setattr(cached, attribute, getattr(session, attribute))
+    adapter = CachingAdapter(cache)
+    cached.mount("https://", adapter)
+    cached.mount("http://", adapter)
+    return cached
@@ -0,0 +1,109 @@
+"""
+Installed capacity time series per (zone, mode).
+
+The capacity of a mode is the `capacity` in zones.json, unless a parser
+registers a source for it, a function returning capacities indexed by the
+datetime they apply from:
+
+    @capacity.source("NL", "solar")
+    def get_solar_capacities(session: Session, logger: Logger) -> pd.Series: ...
+
+Sources are called at most once per `ttl` (capacities are published yearly at
+best) and the series is kept in memory. Lookups take a whole array of datetimes:
+
+    capacity_at("NL", "solar", [p["datetime"] for p in productions])
+
+Datetimes before the first known capacity get the first one. If a source fails
+or returns nothing, the zones.json value is used.
+"""
+
+from datetime import datetime, timedelta
+from logging import Logger, getLogger
+from threading import Lock
+from time import monotonic
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from requests import Session
+
+from electricitymap.contrib.config import ZONES_CONFIG
+
+DEFAULT_TTL = timedelta(days=1)
+
+Source = Callable[[Session, Logger], pd.Series]
+
+_sources: Dict[Tuple[str, str], Tuple[Source, timedelta]] = {}
+_series: Dict[Tuple[str, str], Tuple[float, pd.Series]] = {}
+_series_lock = Lock()
+
+
+def source(
+    zone_key: str, mode: str, ttl: timedelta = DEFAULT_TTL
+) -> Callable[[Source], Source]:
+    """Registers a function as the source of the capacities of a (zone, mode)."""
+
+    def wrap(f: Source) -> Source:
+        _sources[(zone_key, mode)] = (f, ttl)
+        return f
+
+    return wrap
+
+
+def get_static_capacity(zone_key: str, mode: str) -> Optional[float]:
+    return ZONES_CONFIG.get(zone_key, {}).get("capacity", {}).get(mode)
+
+
+def get_series(
+    zone_key: str,
+    mode: str,
+    session: Optional[Session] = None,
+    logger: Logger = getLogger(__name__),
+) -> pd.Series:
+    """Returns the capacities of a (zone, mode), sorted by datetime (UTC). Empty
+    if there is no source or it failed."""
+    key = (zone_key, mode)
+    if key not in _sources:
+        return pd.Series(dtype=float)
+    f, ttl = _sources[key]
+    with _series_lock:
+        cached = _series.get(key)
+    if cached is not None and monotonic() - cached[0] < ttl.total_seconds():
+        return cached[1]
+
+    try:
+        series = f(session or Session(), logger)
+    except Exception as e:
+        logger.warning(f"Error fetching {mode} capacities of {zone_key}: {e}")
+        # Keep using stale capacities rather than none
+        return cached[1] if cached is not None else pd.Series(dtype=float)
+    series = series.dropna().astype(float)
+    series.index = pd.to_datetime(series.index, utc=True)
+    series = series.sort_index()
+    with _series_lock:
+        _series[key] = (monotonic(), series)
+    return series
+
+
+def capacity_at(
+    zone_key: str,
+    mode: str,
+    datetimes: Iterable[datetime],
+    session: Optional[Session] = None,
+    logger: Logger = getLogger(__name__),
+) -> np.ndarray:
+    """Returns the capacity of a (zone, mode) as of each of `datetimes`. NaN
+    where it is unknown."""
+    datetimes = pd.to_datetime(list(datetimes), utc=True)
+    series = get_series(zone_key, mode, session, logger)
+    if series.empty:
+        static = get_static_capacity(zone_key, mode)
+        return np.full(len(datetimes), np.nan if static is None else float(static))
+    positions = series.index.searchsorted(datetimes, side="right") - 1
+    return series.to_numpy()[np.clip(positions, 0, None)]
+
+
+def clear() -> None:
+    """Forgets fetched capacities."""
+    with _series_lock:
+        _series.clear()
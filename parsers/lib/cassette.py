@@ -0,0 +1,303 @@
+"""
+Records the HTTP exchanges of a parser run to a compressed cassette, and
+replays them later without the network.
+
+Recording and replaying both work at the transport level (every
+`requests.adapters.HTTPAdapter`), so parsers that create their own `Session`
+are covered too. Requests are matched on method, URL and body. Query parameters,
+headers and form or JSON body fields that look like credentials are redacted
+before being stored and are ignored when matching, so cassettes can be shared
+and replayed without tokens.
+
+Parsers that query a window relative to "now" only replay deterministically
+when given the `target_datetime` the cassette was recorded with, which is stored
+in the cassette metadata.
+
+Usage:
+    with recording("DE_production.json.gz", meta={...}):
+        fetch_production("DE")
+    with replaying("DE_production.json.gz"):
+        fetch_production("DE")
+"""
+
+import base64
+import gzip
+import hashlib
+import json
+import re
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from pathlib import Path
+from threading import Lock
+from typing import Any, Deque, Dict, Iterator, List, Optional, Union
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from requests import PreparedRequest, Response
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectionError
+from requests.structures import CaseInsensitiveDict
+
+from parsers.lib.instrumentation import instrumented_send
+
+CASSETTE_VERSION = 1
+REDACTED = "REDACTED"
+_SECRET_NAME = re.compile(
+    r"token|key|secret|password|passwd|auth|cookie|signature", re.IGNORECASE
+)
+
+_active_lock = Lock()
+_active: Optional["Cassette"] = None
+# The transport that was in place before the active cassette
+_previous_send = HTTPAdapter.send
+
+
+class CassetteMiss(ConnectionError):
+    """Raised in replay mode for a request that isn't in the cassette. Parsers
+    see it like any other connection error."""
+
+
+def redact_url(url: str) -> str:
+    """Redacts credential-looking query parameters and sorts the query."""
+    parts = urlsplit(url)
+    query = sorted(
+        (name, REDACTED if _SECRET_NAME.search(name) else value)
+        for name, value in parse_qsl(parts.query, keep_blank_values=True)
+    )
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+def redact_headers(headers: Dict[str, str]) -> Dict[str, str]:
+    return {
+        name: REDACTED if _SECRET_NAME.search(name) else value
+        for name, value in headers.items()
+    }
+
+
+def _body_bytes(body: Union[bytes, str, None]) -> bytes:
+    if body is None:
+        return b""
+    if isinstance(body, str):
+        return body.encode()
+    if isinstance(body, bytes):
+        return body
+    # Streamed bodies (generators, files) can't be read twice
+    return b""
+
+
+def _redact_json(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {
+            name: REDACTED if _SECRET_NAME.search(name) else _redact_json(item)
+            for name, item in value.items()
+        }
+    if isinstance(value, list):
+        return [_redact_json(item) for item in value]
+    return value
+
+
+def redact_body(body: bytes) -> bytes:
+    """Redacts credential-looking fields of a JSON or form-encoded body. Other
+    bodies, and bodies without such fields, are returned as they are."""
+    try:
+        text = body.decode()
+    except UnicodeDecodeError:
+        return body
+    try:
+        data = json.loads(text)
+    except ValueError:
+        try:
+            fields = parse_qsl(text, keep_blank_values=True, strict_parsing=True)
+        except ValueError:
+            return body
+        if not any(_SECRET_NAME.search(name) for name, _ in fields):
+            return body
+        redacted_fields = [
+            (name, REDACTED if _SECRET_NAME.search(name) else value)
+            for name, value in fields
+        ]
+        return urlencode(redacted_fields).encode()
+    redacted = _redact_json(data)
+    return body if redacted == data else json.dumps(redacted).encode()
+
+
+def request_key(method: str, url: str, body: Union[bytes, str, None]) -> str:
+    body_digest = hashlib.sha1(redact_body(_body_bytes(body))).hexdigest()
+    return f"{method.upper()} {redact_url(url)} {body_digest}"
+
+
+def _encode(content: bytes) -> str:
+    return base64.b64encode(content).decode()
+
+
+def _decode(content: str) -> bytes:
+    return base64.b64decode(content.encode())
+
+
+def response_meta(response: Response) -> Dict[str, Any]:
+    """Everything but the body of a response, as JSON-serialisable values."""
+    return {
+        "status_code": response.status_code,
+        "reason": response.reason,
+        "url": redact_url(response.url),
+        "headers": dict(response.headers),
+        "encoding": response.encoding,
+    }
+
+
+def build_response(
+    request: PreparedRequest, meta: Dict[str, Any], content: bytes
+) -> Response:
+    """Rebuilds a response to `request` from `response_meta` and its body."""
+    response = Response()
+    response.status_code = meta["status_code"]
+    response.reason = meta["reason"]
+    response.headers = CaseInsensitiveDict(meta["headers"])
+    response.encoding = meta["encoding"]
+    response.url = request.url
+    response.request = request
+    response._content = content
+    response._content_consumed = True
+    return response
+
+
+class Cassette:
+    """HTTP interactions of one parser run. Identical requests are replayed in
+    the order they were recorded; the last response is repeated afterwards."""
+
+    def __init__(self, meta: Optional[Dict[str, Any]] = None):
+        self.meta = meta or {}
+        self.interactions: List[Dict[str, Any]] = []
+        self._queues: Dict[str, Deque[Dict[str, Any]]] = defaultdict(deque)
+        self._last: Dict[str, Dict[str, Any]] = {}
+        self._lock = Lock()
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> "Cassette":
+        with gzip.open(path, "rt") as f:
+            data = json.load(f)
+        if data.get("version") != CASSETTE_VERSION:
+            raise ValueError(f"Unsupported cassette version in {path}")
+        cassette = cls(data["meta"])
+        for interaction in data["interactions"]:
+            cassette._add(interaction)
+        return cassette
+
+    def save(self, path: Union[str, Path]) -> None:
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with gzip.open(path, "wt") as f:
+            json.dump(
+                {
+                    "version": CASSETTE_VERSION,
+                    "meta": self.meta,
+                    "interactions": self.interactions,
+                },
+                f,
+                default=str,
+            )
+
+    def _add(self, interaction: Dict[str, Any]) -> None:
+        with self._lock:
+            self.interactions.append(interaction)
+            self._queues[interaction["key"]].append(interaction)
+
+    def record(self, request: PreparedRequest, response: Response) -> None:
+        body = _body_bytes(request.body)
+        self._add(
+            {
+                "key": request_key(request.method, request.url, body),
+                "request": {
+                    "method": request.method,
+                    "url": redact_url(request.url),
+                    "headers": redact_headers(dict(request.headers)),
+                    "body": _encode(redact_body(body)),
+                },
+                "response": {
+                    **response_meta(response),
+                    "content": _encode(response.content),
+                },
+            }
+        )
+
+    def add_response(
+        self,
+        url: str,
+        content: Union[bytes, str],
+        method: str = "GET",
+        status_code: int = 200,
+    ) -> None:
+        """Records a response built by hand, e.g. for a synthetic cassette."""
+        request = PreparedRequest()
+        request.prepare(method=method, url=url)
+        response = Response()
+        response.status_code = status_code
+        response.url = url
+        response.encoding = "utf-8"
+        response._content = content.encode() if isinstance(content, str) else content
+        self.record(request, response)
+
+    def play(self, request: PreparedRequest) -> Response:
+        key = request_key(request.method, request.url, request.body)
+        with self._lock:
+            queue = self._queues.get(key)
+            if queue:
+                interaction = self._last[key] = queue.popleft()
+            elif key in self._last:
+                interaction = self._last[key]
+            else:
+                raise CassetteMiss(f"No recorded response for {key}", request=request)
+
+        recorded = interaction["response"]
+        return build_response(request, recorded, _decode(recorded["content"]))
+
+
+def _recording_send(adapter: HTTPAdapter, request: PreparedRequest, *args, **kwargs):
+    response = _previous_send(adapter, request, *args, **kwargs)
+    # Reads the body, so it is also available to the caller.
+    response.content
+    _active.record(request, response)
+    return response
+
+
+# Replaces the instrumented transport, so it times its own phase
+@instrumented_send
+def _replaying_send(adapter: HTTPAdapter, request: PreparedRequest, *args, **kwargs):
+    return _active.play(request)
+
+
+@contextmanager
+def _patched(cassette: Cassette, send) -> Iterator[Cassette]:
+    global _active, _previous_send
+    with _active_lock:
+        if _active is not None:
+            raise RuntimeError("A cassette is already recording or replaying")
+        _active = cassette
+        _previous_send = HTTPAdapter.send
+        HTTPAdapter.send = send
+    try:
+        yield cassette
+    finally:
+        with _active_lock:
+            HTTPAdapter.send = _previous_send
+            _active = None
+
+
+@contextmanager
+def recording(
+    path: Union[str, Path], meta: Optional[Dict[str, Any]] = None
+) -> Iterator[Cassette]:
+    """Records every HTTP exchange made inside the block to `path`. The cassette
+    is written even if the block raises, so failing runs can be replayed too."""
+    cassette = Cassette(meta)
+    with _patched(cassette, _recording_send):
+        try:
+            yield cassette
+        finally:
+            cassette.save(path)
+
+
+@contextmanager
+def replaying(path: Union[str, Path]) -> Iterator[Cassette]:
+    """Serves HTTP requests made inside the block from the cassette at `path`.
+    Requests that weren't recorded raise `CassetteMiss`."""
+    with _patched(Cassette.load(path), _replaying_send) as cassette:
+        yield cassette
@@ -0,0 +1,235 @@
+"""
+Composite zones, whose production is derived from series of other parsers.
+
+Some zones don't publish a complete production breakdown, and the missing part
+is derived from what is known about the zone: its consumption, its exchanges
+with each neighbour and its reported production. Such a zone declares these
+inputs once:
+
+    COMPOSITE = Composite(
+        zone_key="CH",
+        consumption=ENTSOE.fetch_consumption,
+        production=ENTSOE.fetch_production,
+        exchanges={"AT": ENTSOE.fetch_exchange, "DE": ENTSOE.fetch_exchange},
+    )
+
+and `fetch_inputs(COMPOSITE, ...)` returns them. Inputs are read from the
+`SeriesStore` of the current cycle, so a series used by several composites is
+only fetched and parsed once per cycle. The scheduler keeps a store for its
+whole run, whose entries expire after a cycle, and also shares the upstream
+documents themselves through it (see `cycle_session`), e.g. between a
+composite and the standalone exchange entries of its neighbours.
+"""
+
+import copy
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timedelta
+from logging import Logger, getLogger
+from threading import Lock
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+import arrow
+from requests import PreparedRequest, Response, Session
+
+from parsers.lib import incremental
+from parsers.lib.cassette import build_response, request_key, response_meta
+from parsers.lib.singleflight import CoalescingAdapter, SingleFlight
+
+DEFAULT_MAX_AGE = timedelta(minutes=5)
+
+_active: ContextVar[Optional["SeriesStore"]] = ContextVar("_active", default=None)
+
+
+class SeriesStore:
+    """Keeps the results of parser calls, and the documents they download, for
+    `max_age`. Concurrent identical calls are made once."""
+
+    def __init__(self, max_age: timedelta = DEFAULT_MAX_AGE):
+        self.max_age = max_age.total_seconds()
+        self._series: Dict[Tuple, Tuple[float, Any]] = {}
+        self._documents: Dict[str, Tuple[float, dict, bytes]] = {}
+        self._flight = SingleFlight()
+        self._lock = Lock()
+        self.hits = 0
+
+    def _is_fresh(self, stored_at: float) -> bool:
+        return time.monotonic() - stored_at < self.max_age
+
+    def _prune(self) -> None:
+        for entries in (self._series, self._documents):
+            for key in [k for k, v in entries.items() if not self._is_fresh(v[0])]:
+                del entries[key]
+
+    def series(
+        self,
+        function: Callable,
+        args: Tuple[str, ...],
+        session: Optional[Session] = None,
+        target_datetime: Optional[datetime] = None,
+        logger: Logger = getLogger(__name__),
+    ) -> Any:
+        """Returns `function(*args, ...)`, called at most once per cycle. Each
+        caller gets its own copy of the result, which it may modify."""
+        if target_datetime is not None:
+            target_datetime = arrow.get(target_datetime).to("UTC").datetime
+        key = (f"{function.__module__}.{function.__qualname__}", args, target_datetime)
+        with self._lock:
+            stored = self._series.get(key)
+            if stored is not None and self._is_fresh(stored[0]):
+                self.hits += 1
+                return copy.deepcopy(stored[1])
+
+        def call() -> Any:
+            # The result is shared with callers that may know less data
+            with incremental.unbounded():
+                result = function(
+                    *args,
+                    session=session,
+                    target_datetime=target_datetime,
+                    logger=logger,
+                )
+            with self._lock:
+                self._prune()
+                self._series[key] = (time.monotonic(), result)
+            return result
+
+        result, _ = self._flight.do(repr(key), call)
+        return copy.deepcopy(result)
+
+    def get_document(self, key: str) -> Optional[Tuple[dict, bytes]]:
+        with self._lock:
+            stored = self._documents.get(key)
+            if stored is None or not self._is_fresh(stored[0]):
+                return None
+            self.hits += 1
+            return stored[1], stored[2]
+
+    def set_document(self, key: str, meta: dict, content: bytes) -> None:
+        with self._lock:
+            self._prune()
+            self._documents[key] = (time.monotonic(), meta, content)
+
+
+@contextmanager
+def cycle(store: Optional[SeriesStore] = None) -> Iterator[SeriesStore]:
+    """Makes `store` the store of the current cycle inside the block. Without a
+    store, keeps the active one or starts a new one."""
+    store = store or _active.get() or SeriesStore()
+    token = _active.set(store)
+    try:
+        yield store
+    finally:
+        _active.reset(token)
+
+
+def series(
+    function: Callable,
+    *args: str,
+    session: Optional[Session] = None,
+    target_datetime: Optional[datetime] = None,
+    logger: Logger = getLogger(__name__),
+) -> Any:
+    """Calls a parser function through the store of the current cycle."""
+    with cycle() as store:
+        return store.series(function, args, session, target_datetime, logger)
+
+
+class CycleAdapter(CoalescingAdapter):
+    """Serves GET requests made again within a cycle from a SeriesStore."""
+
+    def __init__(self, store: SeriesStore, **kwargs):
+        super().__init__(**kwargs)
+        self.store = store
+
+    def send(self, request: PreparedRequest, *args, **kwargs) -> Response:
+        if request.method != "GET" or kwargs.get("stream"):
+            return super().send(request, *args, **kwargs)
+        key = request_key(request.method, request.url, request.body)
+        stored = self.store.get_document(key)
+        if stored is not None:
+            return build_response(request, *stored)
+        response = super().send(request, *args, **kwargs)
+        if response.status_code == 200:
+            self.store.set_document(key, response_meta(response), response.content)
+        return response
+
+
+def cycle_session(
+    store: SeriesStore, session: Optional[Session] = None, pool_size: int = 10
+) -> Session:
+    """Mounts a CycleAdapter for http and https on a (new) session."""
+    session = session or Session()
+    adapter = CycleAdapter(store, pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+class Composite(NamedTuple):
+    """Declares the series a composite zone is derived from."""
+
+    zone_key: str
+    consumption: Callable
+    production: Callable
+    exchanges: Dict[str, Callable]  # neighbour zone key -> exchange parser
+
+
+class Inputs(NamedTuple):
+    zone_key: str
+    consumption: List[dict]
+    production: List[dict]
+    exchanges: Dict[str, List[dict]]  # neighbour zone key -> exchange events
+
+    def net_imports(self) -> Dict[datetime, float]:
+        """Sums the exchanges into the zone per datetime."""
+        imports: Dict[datetime, float] = {}
+        for events in self.exchanges.values():
+            for event in events:
+                net_flow = event["netFlow"]
+                if event["sortedZoneKeys"].startswith(f"{self.zone_key}->"):
+                    net_flow = -net_flow
+                imports[event["datetime"]] = (
+                    imports.get(event["datetime"], 0) + net_flow
+                )
+        return imports
+
+
+def fetch_inputs(
+    composite: Composite,
+    session: Optional[Session] = None,
+    target_datetime: Optional[datetime] = None,
+    logger: Logger = getLogger(__name__),
+) -> Inputs:
+    """Reads the inputs of a composite zone from the store of the current cycle.
+
+    Live inputs are requested for the current hour, which is the granularity of
+    the periods they are queried for, so that composites running in the same
+    hour share them. Exchanges are requested in the direction they are
+    configured in, as the standalone exchange entries are.
+    """
+    session = session or Session()
+    if target_datetime is None:
+        target_datetime = arrow.utcnow().floor("hour").datetime
+    zone_key = composite.zone_key
+
+    def fetch(function: Callable, *args: str) -> Any:
+        return series(
+            function,
+            *args,
+            session=session,
+            target_datetime=target_datetime,
+            logger=logger,
+        )
+
+    with cycle():
+        return Inputs(
+            zone_key=zone_key,
+            consumption=fetch(composite.consumption, zone_key) or [],
+            production=fetch(composite.production, zone_key) or [],
+            exchanges={
+                neighbour: fetch(function, *sorted([zone_key, neighbour])) or []
+                for neighbour, function in composite.exchanges.items()
+            },
+        )
@@ -1,5 +1,8 @@
+import functools
 from datetime import timedelta
 
+from parsers.lib.processing import dispatch
+
 
 def refetch_frequency(frequency: timedelta):
     """Specifies the refetch frequency of a parser.
@@ -11,6 +14,7 @@ def refetch_frequency(frequency: timedelta):
     assert isinstance(frequency, timedelta)
 
     def wrap(f):
+        @functools.wraps(f)
         def wrapped_f(*args, **kwargs):
             result = f(*args, **kwargs)
             return result
@@ -19,3 +23,18 @@ def refetch_frequency(frequency: timedelta):
         return wrapped_f
 
     return wrap
+
+
+def cpu_bound(f):
+    """Marks a CPU-bound parsing stage, a module-level function of downloaded
+    data. Its calls run in the process pool of parsers.lib.processing while one
+    is active, so that they don't hold the GIL of the threads doing network I/O.
+    Arguments and return values must be picklable.
+    """
+
+    @functools.wraps(f)
+    def wrapped_f(*args, **kwargs):
+        return dispatch(f, args, kwargs)
+
+    wrapped_f.CPU_BOUND = True
+    return wrapped_f
@@ -0,0 +1,154 @@
+"""
+Per-point fingerprints of parser output in a memory-mapped file, so incremental
+runs (see parsers.lib.incremental) keep knowing what they emitted across
+restarts.
+
+The file is an open addressing hash table of fixed-width records (series,
+timestamp, fingerprint), where series is a hash of (key, data type). Lookups
+read a couple of records, the table is never loaded as a whole:
+
+    hashes = FingerprintStore("fingerprints.bin")
+    diff = classify(hashes, "DE", "production", events)
+    diff.new, diff.revised, diff.unchanged
+
+The table is rebuilt twice as large when it is more than MAX_LOAD full, without
+the points older than the retention (relative to the latest point of their
+series).
+"""
+
+import hashlib
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from parsers.lib.incremental import RETENTION, WATERMARK_DATA_TYPES, PointHashes
+
+RECORD = np.dtype([("series", "<u8"), ("timestamp", "<i8"), ("fingerprint", "<u8")])
+INITIAL_CAPACITY = 2**16
+MAX_LOAD = 0.7
+
+_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+
+
+def series_id(key: str, data_type: str) -> int:
+    digest = hashlib.blake2b(f"{key}\0{data_type}".encode(), digest_size=8).digest()
+    # 0 marks empty records
+    return int.from_bytes(digest, "little") | 1
+
+
+def _home_slots(series: np.ndarray, timestamps: np.ndarray, capacity: int):
+    mixed = series.astype(np.uint64) ^ (timestamps.astype(np.uint64) * _MULTIPLIER)
+    mixed ^= mixed >> np.uint64(29)
+    return (mixed & np.uint64(capacity - 1)).astype(np.int64)
+
+
+class FingerprintStore(PointHashes):
+    """PointHashes persisted in a memory-mapped file at `path`, created if it
+    doesn't exist. `capacity` is the initial number of records (a power of 2)."""
+
+    def __init__(
+        self,
+        path: str,
+        retention: timedelta = RETENTION,
+        capacity: int = INITIAL_CAPACITY,
+    ):
+        super().__init__(retention)
+        if capacity & (capacity - 1):
+            raise ValueError(f"capacity must be a power of 2, got {capacity}")
+        self.path = path
+        if os.path.exists(path) and os.path.getsize(path):
+            self._records = np.memmap(path, RECORD, mode="r+")
+            if len(self._records) & (len(self._records) - 1):
+                raise ValueError(f"{path} is not a fingerprint store")
+        else:
+            self._write(np.zeros(0, RECORD), capacity)
+        live = self._records[self._records["series"] != 0]
+        self._size = len(live)
+        latest = pd.Series(live["timestamp"]).groupby(live["series"]).max()
+        self._latest = {int(s): int(t) for s, t in latest.items()}
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def capacity(self) -> int:
+        return len(self._records)
+
+    def _find(self, series: int, timestamp: int) -> int:
+        """Returns the slot of a point, or the empty slot it would go in."""
+        mask = self.capacity - 1
+        slot = int(
+            _home_slots(np.array([series]), np.array([timestamp]), self.capacity)[0]
+        )
+        while True:
+            s = int(self._records["series"][slot])
+            if s == 0 or (
+                s == series and int(self._records["timestamp"][slot]) == timestamp
+            ):
+                return slot
+            slot = (slot + 1) & mask
+
+    def _write(self, records: np.ndarray, capacity: int) -> None:
+        """Replaces the file with a table of `capacity` slots holding `records`."""
+        table = np.zeros(capacity, RECORD)
+        slots = _home_slots(records["series"], records["timestamp"], capacity)
+        pending = np.arange(len(records))
+        while len(pending):
+            # Of the records probing an empty slot, the first one takes it
+            place = np.zeros(len(pending), dtype=bool)
+            place[np.unique(slots, return_index=True)[1]] = True
+            place &= table["series"][slots] == 0
+            table[slots[place]] = records[pending[place]]
+            pending, slots = pending[~place], (slots[~place] + 1) & (capacity - 1)
+
+        tmp = f"{self.path}.tmp"
+        table.tofile(tmp)
+        os.replace(tmp, self.path)
+        self._records = np.memmap(self.path, RECORD, mode="r+")
+
+    def _grow(self) -> None:
+        live = np.array(self._records[self._records["series"] != 0])
+        latest = pd.Series(live["timestamp"]).groupby(live["series"]).transform("max")
+        live = live[live["timestamp"] >= latest.to_numpy() - self.retention]
+        capacity = self.capacity
+        while len(live) + 1 > capacity * MAX_LOAD / 2:
+            capacity *= 2
+        self._write(live, capacity)
+        self._size = len(live)
+
+    def get(self, key: str, data_type: str, timestamp: int) -> Optional[int]:
+        series = series_id(key, data_type)
+        with self._lock:
+            latest = self._latest.get(series)
+            if latest is None or timestamp < latest - self.retention:
+                return None
+            slot = self._find(series, timestamp)
+            if self._records["series"][slot] == 0:
+                return None
+            return int(self._records["fingerprint"][slot])
+
+    def set(self, key: str, data_type: str, timestamp: int, value: int) -> None:
+        series = series_id(key, data_type)
+        with self._lock:
+            slot = self._find(series, timestamp)
+            if self._records["series"][slot] == 0:
+                if self._size + 1 > self.capacity * MAX_LOAD:
+                    self._grow()
+                    slot = self._find(series, timestamp)
+                self._size += 1
+            self._records[slot] = (series, timestamp, value)
+            self._latest[series] = max(self._latest.get(series, timestamp), timestamp)
+
+    def known_up_to(self, key: str, data_type: str) -> Optional[datetime]:
+        if data_type not in WATERMARK_DATA_TYPES:
+            return None
+        with self._lock:
+            latest = self._latest.get(series_id(key, data_type))
+        return None if latest is None else datetime.fromtimestamp(latest, timezone.utc)
+
+    def flush(self) -> None:
+        with self._lock:
+            self._records.flush()
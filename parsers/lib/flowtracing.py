@@ -0,0 +1,248 @@
+"""
+Production and consumption based carbon intensities of all zones, by flow
+tracing.
+
+The power a zone consumes is a mix of what it produces and what it imports,
+and what it imports is the mix its neighbours consume. With, at one hour:
+
+    P_i       production of zone i (storage discharge included)
+    E_i       its emissions, the sum over modes of production x emission factor
+    I_ji      import of zone i from zone j
+    T_i       P_i + the sum over j of I_ji, the power flowing through zone i
+
+the consumption based intensity c_i solves
+
+    T_i c_i - sum_j I_ji c_j = E_i
+
+a sparse system with one row per zone. Every hour is independent, so the rows
+of all hours form one block diagonal system, solved with a single sparse LU
+factorization. The same factorization gives the origin mix: the share of each
+mode in the consumption of each zone (right-hand side: production per mode),
+and optionally the share of each producing zone (right-hand side: P_i).
+
+    inputs = load_inputs(store, ["DE", "FR", "CH"], start, end)
+    result = solve(inputs, get_factors(inputs.zones))
+    result.consumption[:, inputs.zones.index("CH")]
+
+Zones without production data at an hour have NaN results, and their
+exchanges are left out of that hour. An exchange without data between two
+zones with production data makes the consumption based results of both zones
+NaN at that hour, as well as those of the zones importing from them, rather
+than counting the exchange as 0 MW.
+
+Requires scipy (the `flowtracing` extra).
+"""
+
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import csc_matrix
+from scipy.sparse.linalg import splu
+
+from electricitymap.contrib.config import (
+    CO2EQ_PARAMETERS_DIRECT,
+    CO2EQ_PARAMETERS_LIFECYCLE,
+    EXCHANGES_CONFIG,
+    emission_factors,
+)
+from electricitymap.contrib.config.constants import (
+    ENERGIES,
+    PRODUCTION_MODES,
+    STORAGE_MODES,
+)
+from parsers.lib.timeseries import TimeSeriesStore
+
+# Production modes, then storage discharges
+MODES = ENERGIES
+HOUR = pd.Timedelta(hours=1)
+
+
+class Inputs(NamedTuple):
+    datetimes: pd.DatetimeIndex  # hours, UTC
+    zones: List[str]
+    production: np.ndarray  # MW per (hour, zone, mode), NaN if unknown
+    links: List[Tuple[int, int]]  # zone indices of each exchange, sorted
+    flows: np.ndarray  # MW per (hour, link), from the first to the second zone
+
+
+class Result(NamedTuple):
+    datetimes: pd.DatetimeIndex
+    zones: List[str]
+    production: np.ndarray  # gCO2eq/kWh per (hour, zone)
+    consumption: np.ndarray  # gCO2eq/kWh per (hour, zone)
+    mix: np.ndarray  # share of each mode in consumption per (hour, zone, mode)
+    origin: Optional[np.ndarray]  # share of each producing zone per (hour, zone, zone)
+
+    def to_frame(self, kind: str = "consumption") -> pd.DataFrame:
+        """Returns the production or consumption intensities, one column per
+        zone."""
+        return pd.DataFrame(
+            getattr(self, kind), index=self.datetimes, columns=self.zones
+        )
+
+
+def get_factors(zones: List[str], lifecycle: bool = True) -> np.ndarray:
+    """Returns the emission factors (gCO2eq/kWh) per (zone, mode), lifecycle or
+    direct. Modes without a factor get the one of unknown production."""
+    parameters = CO2EQ_PARAMETERS_LIFECYCLE if lifecycle else CO2EQ_PARAMETERS_DIRECT
+    factors = np.empty((len(zones), len(MODES)))
+    for i, zone in enumerate(zones):
+        zone_factors = emission_factors(zone, parameters)
+        for m, mode in enumerate(MODES):
+            value = zone_factors.get(mode)
+            factors[i, m] = zone_factors["unknown"] if value is None else value
+    return factors
+
+
+def _hourly(frame: pd.DataFrame, datetimes: pd.DatetimeIndex) -> pd.DataFrame:
+    if frame.empty:
+        return frame.reindex(datetimes)
+    return frame.groupby(frame.index.floor(HOUR)).mean().reindex(datetimes)
+
+
+def build_inputs(
+    datetimes: pd.DatetimeIndex,
+    productions: Dict[str, pd.DataFrame],
+    exchanges: Dict[str, pd.DataFrame],
+) -> Inputs:
+    """Returns the hourly inputs of the zones of `productions`, from frames in
+    the layout of parsers.lib.timeseries (`production.wind`, `storage.hydro`,
+    `netFlow` columns indexed by datetime). Exchanges with zones that aren't
+    in `productions` are left out, and values are averaged per hour."""
+    zones = sorted(productions)
+    index = {zone: i for i, zone in enumerate(zones)}
+    production = np.full((len(datetimes), len(zones), len(MODES)), np.nan)
+    for zone, frame in productions.items():
+        hourly = _hourly(frame, datetimes)
+        for m, mode in enumerate(PRODUCTION_MODES):
+            column = f"production.{mode}"
+            if column in hourly:
+                production[:, index[zone], m] = hourly[column]
+        for m, mode in enumerate(STORAGE_MODES, len(PRODUCTION_MODES)):
+            column = f"storage.{mode}"
+            if column in hourly:
+                # Positive storage is charging, which is part of consumption
+                production[:, index[zone], m] = (-hourly[column]).clip(lower=0)
+
+    keys = [
+        key
+        for key in sorted(exchanges)
+        if all(zone in index for zone in key.split("->"))
+    ]
+    links = [tuple(index[zone] for zone in key.split("->")) for key in keys]
+    flows = np.full((len(datetimes), len(keys)), np.nan)
+    for k, key in enumerate(keys):
+        hourly = _hourly(exchanges[key], datetimes)
+        if "netFlow" in hourly:
+            flows[:, k] = hourly["netFlow"]
+    return Inputs(datetimes, zones, production, links, flows)
+
+
+def load_inputs(
+    store: TimeSeriesStore, zones: List[str], start: datetime, end: datetime
+) -> Inputs:
+    """Returns the inputs of the hours of [start, end) from a store, with the
+    exchanges of EXCHANGES_CONFIG between `zones`."""
+    datetimes = pd.date_range(pd.Timestamp(start).floor(HOUR), end, freq=HOUR)
+    datetimes = datetimes[datetimes < end]
+    zone_set = set(zones)
+    productions = {
+        zone: store.read(zone, "production", start, end).to_frame() for zone in zones
+    }
+    exchanges = {
+        key: store.read(key, "exchange", start, end).to_frame()
+        for key in EXCHANGES_CONFIG
+        if set(key.split("->")) <= zone_set
+    }
+    return build_inputs(datetimes, productions, exchanges)
+
+
+def _propagate(
+    undefined: np.ndarray,
+    hour: np.ndarray,
+    exporter: np.ndarray,
+    importer: np.ndarray,
+    imports: np.ndarray,
+) -> np.ndarray:
+    """Marks zones importing from undefined zones as undefined, until no more
+    zones are added."""
+    undefined = undefined.copy()
+    while True:
+        spreading = (
+            (imports > 0) & undefined[hour, exporter] & ~undefined[hour, importer]
+        )
+        if not spreading.any():
+            return undefined
+        undefined[hour[spreading], importer[spreading]] = True
+
+
+def solve(inputs: Inputs, factors: np.ndarray, origin: bool = False) -> Result:
+    """Returns the intensities and origin mix of every zone at every hour.
+    `factors` are the emission factors per (zone, mode), see `get_factors`.
+    The origin mix by producing zone is only computed with `origin`, it has
+    hours x zones x zones values."""
+    hours, zones, modes = inputs.production.shape
+    known = ~np.isnan(inputs.production).all(axis=2)
+    production = np.nan_to_num(inputs.production)
+    total = production.sum(axis=2)
+    emissions = (production * factors[None]).sum(axis=2)
+
+    # Imports, from the exporting to the importing zone of each link and hour
+    links = np.array(inputs.links, dtype=int).reshape(-1, 2)
+    source, target = links[:, 0], links[:, 1]
+    both_known = known[:, source] & known[:, target]
+    missing = np.isnan(inputs.flows) & both_known
+    flows = np.nan_to_num(inputs.flows)
+    flows[~both_known] = 0
+    hour = np.repeat(np.arange(hours), len(inputs.links))
+    exporter = np.where(flows >= 0, source, target).ravel()
+    importer = np.where(flows >= 0, target, source).ravel()
+    imports = np.abs(flows).ravel()
+
+    throughput = total.copy()
+    np.add.at(throughput, (hour, importer), imports)
+    # Rows of zones nothing flows through solve to 0, they are NaN below
+    diagonal = np.where(throughput > 0, throughput, 1).ravel()
+    row = np.concatenate([np.arange(hours * zones), hour * zones + importer])
+    column = np.concatenate([np.arange(hours * zones), hour * zones + exporter])
+    matrix = csc_matrix(
+        (np.concatenate([diagonal, -imports]), (row, column)),
+        shape=(hours * zones, hours * zones),
+    )
+    lu = splu(matrix)
+
+    right_hand_side = np.column_stack(
+        [emissions.ravel(), production.reshape(hours * zones, modes)]
+    )
+    solution = lu.solve(right_hand_side).reshape(hours, zones, modes + 1)
+    undefined = ~known | (throughput <= 0)
+    # Zones with a missing exchange, and the zones importing from them
+    incomplete = np.zeros((hours, zones), dtype=bool)
+    missing_hour, missing_link = np.nonzero(missing)
+    incomplete[missing_hour, source[missing_link]] = True
+    incomplete[missing_hour, target[missing_link]] = True
+    undefined = _propagate(undefined | incomplete, hour, exporter, importer, imports)
+    consumption = np.where(undefined, np.nan, solution[:, :, 0])
+    mix = np.where(undefined[:, :, None], np.nan, solution[:, :, 1:])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        production_intensity = np.where(known & (total > 0), emissions / total, np.nan)
+
+    zone_origin = None
+    if origin:
+        right_hand_side = np.zeros((hours * zones, zones))
+        right_hand_side[
+            np.arange(hours * zones), np.tile(np.arange(zones), hours)
+        ] = total.ravel()
+        zone_origin = lu.solve(right_hand_side).reshape(hours, zones, zones)
+        zone_origin[undefined] = np.nan
+
+    return Result(
+        inputs.datetimes,
+        inputs.zones,
+        production_intensity,
+        consumption,
+        mix,
+        zone_origin,
+    )
@@ -0,0 +1,235 @@
+"""
+Incremental refetches: only emit the points of a parser run that are new or
+changed since the previous run.
+
+Live parsers return overlapping windows (e.g. 48 hours of ENTSOE data every few
+minutes), so most of what they return is already known. The runner keeps a
+content hash of each point it has emitted per (key, data type, datetime), and
+trims the output of every run to points whose hash is new:
+
+    hashes = PointHashes()
+    with watermark(hashes.known_up_to(key, data_type)):
+        events = fetch_production(key, session=session)
+    events = trim(hashes, key, data_type, events)
+
+`trim` records the hashes right away. To only record them once the points are
+stored, use `trim_pending` and then `record_diff`.
+
+Inside `watermark`, parsers that support it narrow their upstream query to
+start shortly before the datetime the runner already knows data up to (see
+`get_start`), leaving REVISION_OVERLAP for revised points. Parsers that don't
+return their usual window, which is trimmed all the same.
+
+`classify` counts the new, revised and unchanged points of a run, per key and
+data type in `hashes.stats`, which shows which sources revise the most. Hashes
+are only fingerprints of the numeric content of a point. To keep them across
+restarts, use a parsers.lib.fingerprints.FingerprintStore.
+"""
+
+import hashlib
+import json
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timedelta, timezone
+from threading import Lock
+from typing import (
+    Any,
+    ContextManager,
+    Dict,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+)
+
+import arrow
+
+# Data types whose points are measurements, which can be requested from a
+# watermark on. Forecasts and prices are published ahead and revised as a whole.
+WATERMARK_DATA_TYPES = {"consumption", "exchange", "production"}
+REVISION_OVERLAP = timedelta(hours=6)
+# Hashes of points older than this (relative to the latest point) are forgotten
+RETENTION = timedelta(days=40)
+
+_known_up_to: ContextVar[Optional[datetime]] = ContextVar("_known_up_to", default=None)
+
+
+@contextmanager
+def watermark(known_up_to: Optional[datetime]) -> Iterator[None]:
+    """Lets parsers in the block know the runner has data up to `known_up_to`."""
+    token = _known_up_to.set(known_up_to)
+    try:
+        yield
+    finally:
+        _known_up_to.reset(token)
+
+
+def unbounded() -> ContextManager[None]:
+    """Clears the watermark, for calls whose result is shared with other keys."""
+    return watermark(None)
+
+
+def get_start(default: datetime, overlap: timedelta = REVISION_OVERLAP) -> datetime:
+    """Returns the start of the period a parser should query: `default`, or the
+    watermark minus `overlap` if that is later."""
+    known_up_to = _known_up_to.get()
+    if known_up_to is None:
+        return default
+    return max(arrow.get(default), arrow.get(known_up_to) - overlap).datetime
+
+
+def get_timestamp(event: dict) -> Optional[int]:
+    """Returns the datetime of an event in seconds since epoch."""
+    dt = event.get("datetime")
+    if dt is None:
+        return None
+    return arrow.get(dt).timestamp
+
+
+def _numeric_items(value: Any, path: str = "") -> Iterator[Tuple[str, Any]]:
+    if isinstance(value, dict):
+        for k in sorted(value):
+            yield from _numeric_items(value[k], f"{path}/{k}")
+    elif value is None or (
+        isinstance(value, (int, float)) and not isinstance(value, bool)
+    ):
+        yield path, value
+
+
+def fingerprint(event: dict) -> int:
+    """Returns a 64 bit hash of the numeric content of an event (the values of
+    all numeric and None fields, nested ones included, but not its datetime or
+    strings such as its source)."""
+    content = json.dumps(list(_numeric_items(event))).encode()
+    return int.from_bytes(hashlib.blake2b(content, digest_size=8).digest(), "big")
+
+
+class PointHashes:
+    """In-memory hashes of the points emitted per (key, data type, datetime).
+    Points older than the latest one of their series by more than `retention`
+    are forgotten."""
+
+    def __init__(self, retention: timedelta = RETENTION):
+        self.retention = int(retention.total_seconds())
+        self._hashes: Dict[Tuple[str, str], Dict[int, int]] = {}
+        # Latest timestamp per series, and size of the series after it was
+        # last pruned
+        self._latest: Dict[Tuple[str, str], int] = {}
+        self._pruned_size: Dict[Tuple[str, str], int] = {}
+        self._lock = Lock()
+        # Points classified per (key, data type), see `classify`
+        self.stats: Dict[Tuple[str, str], Counter] = defaultdict(Counter)
+
+    def get(self, key: str, data_type: str, timestamp: int) -> Optional[int]:
+        series = (key, data_type)
+        with self._lock:
+            latest = self._latest.get(series)
+            if latest is None or timestamp < latest - self.retention:
+                return None
+            return self._hashes[series].get(timestamp)
+
+    def set(self, key: str, data_type: str, timestamp: int, value: int) -> None:
+        series = (key, data_type)
+        with self._lock:
+            hashes = self._hashes.setdefault(series, {})
+            hashes[timestamp] = value
+            self._latest[series] = max(self._latest.get(series, timestamp), timestamp)
+            # Pruned once the series doubled in size, so inserts stay O(1)
+            if len(hashes) >= 2 * self._pruned_size.get(series, 1024):
+                oldest = self._latest[series] - self.retention
+                for t in [t for t in hashes if t < oldest]:
+                    del hashes[t]
+                self._pruned_size[series] = len(hashes)
+
+    def known_up_to(self, key: str, data_type: str) -> Optional[datetime]:
+        """Returns the datetime of the latest point of a key and data type, if it
+        is a measurement."""
+        if data_type not in WATERMARK_DATA_TYPES:
+            return None
+        with self._lock:
+            latest = self._latest.get((key, data_type))
+        return None if latest is None else datetime.fromtimestamp(latest, timezone.utc)
+
+
+class Diff(NamedTuple):
+    events: list  # new and revised events, and events without a datetime
+    new: int
+    revised: int
+    unchanged: int
+    hashes: Dict[int, int]  # of the new and revised points, by timestamp
+
+
+def classify(
+    hashes: PointHashes, key: str, data_type: str, events: list, record: bool = True
+) -> Diff:
+    """Compares events with the hashes of the points seen before. Unless
+    `record` is False, records their hashes and counts them (see `record`)."""
+    emitted = []
+    counts = Counter()
+    changed: Dict[int, int] = {}
+    for event in events:
+        timestamp = get_timestamp(event) if event else None
+        if timestamp is None:
+            emitted.append(event)
+            continue
+        value = fingerprint(event)
+        previous = (
+            changed[timestamp]
+            if timestamp in changed
+            else hashes.get(key, data_type, timestamp)
+        )
+        if previous == value:
+            counts["unchanged"] += 1
+            continue
+        counts["new" if previous is None else "revised"] += 1
+        changed[timestamp] = value
+        emitted.append(event)
+    diff = Diff(emitted, counts["new"], counts["revised"], counts["unchanged"], changed)
+    if record:
+        record_diff(hashes, key, data_type, diff)
+    return diff
+
+
+def record_diff(hashes: PointHashes, key: str, data_type: str, diff: Diff) -> None:
+    """Records the hashes of the points of a diff, and counts them in
+    `hashes.stats`."""
+    for timestamp, value in diff.hashes.items():
+        hashes.set(key, data_type, timestamp, value)
+    counts = {"new": diff.new, "revised": diff.revised, "unchanged": diff.unchanged}
+    hashes.stats[(key, data_type)].update(
+        {name: count for name, count in counts.items() if count}
+    )
+
+
+def trim_pending(
+    hashes: PointHashes, key: str, data_type: str, result: Any
+) -> Tuple[Any, Diff]:
+    """Returns the points of a parser result that are new or changed, and their
+    diff, whose hashes are only recorded by `record_diff`: once the points are
+    handled, so that points that weren't are emitted again by the next run. A
+    single event result is returned as is or None."""
+    if result is None:
+        return None, classify(hashes, key, data_type, [], record=False)
+    if isinstance(result, dict):
+        diff = classify(hashes, key, data_type, [result], record=False)
+        return (diff.events[0] if diff.events else None), diff
+    diff = classify(hashes, key, data_type, list(result), record=False)
+    return diff.events, diff
+
+
+def trim(hashes: PointHashes, key: str, data_type: str, result: Any) -> Any:
+    """Returns the points of a parser result that are new or changed, and
+    records their hashes. A single event result is returned as is or None."""
+    result, diff = trim_pending(hashes, key, data_type, result)
+    record_diff(hashes, key, data_type, diff)
+    return result
+
+
+def revision_report(hashes: PointHashes) -> List[Tuple[str, str, Counter]]:
+    """Returns the counters per (key, data type), most revised share first."""
+    return sorted(
+        ((key, data_type, counts) for (key, data_type), counts in hashes.stats.items()),
+        key=lambda row: -row[2]["revised"] / max(1, sum(row[2].values())),
+    )
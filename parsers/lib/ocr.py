@@ -0,0 +1,64 @@
+"""Shared tesseract helpers for parsers that read values from images.
+
+Starting tesseract is by far the most expensive step of these parsers, and the
+images they read often don't change between two runs. Results are therefore
+cached on a hash of the image content and the tesseract arguments.
+"""
+
+import hashlib
+from collections import OrderedDict
+from threading import Lock
+from typing import List
+
+import numpy as np
+import pytesseract
+from PIL import Image
+
+MAX_CACHED_RESULTS = 256
+
+_results: "OrderedDict[str, str]" = OrderedDict()
+_results_lock = Lock()
+
+
+def _cache_key(image: Image.Image, lang: str, config: str) -> str:
+    digest = hashlib.sha1()
+    for part in (image.mode, str(image.size), lang, config):
+        digest.update(part.encode())
+        digest.update(b"\0")
+    digest.update(image.tobytes())
+    return digest.hexdigest()
+
+
+def image_to_string(image: Image.Image, lang: str = "eng", config: str = "") -> str:
+    """Same as `pytesseract.image_to_string`, but skips tesseract for an image
+    that was already read with the same arguments."""
+    key = _cache_key(image, lang, config)
+    with _results_lock:
+        if key in _results:
+            _results.move_to_end(key)
+            return _results[key]
+
+    text = pytesseract.image_to_string(image, lang=lang, config=config)
+
+    with _results_lock:
+        _results[key] = text
+        while len(_results) > MAX_CACHED_RESULTS:
+            _results.popitem(last=False)
+    return text
+
+
+def images_to_string(
+    images: List[Image.Image], lang: str = "eng", config: str = ""
+) -> str:
+    """Stitches images side by side and reads them with a single tesseract call.
+
+    Images are bottom-padded with white to the tallest one, so regions of a
+    screenshot can be read as one line (e.g. with `--psm 7`).
+    """
+    arrays = [np.asarray(image.convert("L")) for image in images]
+    height = max(array.shape[0] for array in arrays)
+    arrays = [
+        np.pad(array, ((0, height - array.shape[0]), (0, 0)), constant_values=255)
+        for array in arrays
+    ]
+    return image_to_string(Image.fromarray(np.hstack(arrays)), lang, config)
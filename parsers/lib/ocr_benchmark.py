@@ -0,0 +1,82 @@
+"""
+Times `SG.get_solar` on solar map images, such as the
+parsers/test/mocks/SG_ema_gov_sg_solar_map*.png mocks: once with tesseract (an
+empty OCR cache, see parsers.lib.ocr) and once with the results of the previous
+run. The median of `--repeat` runs is reported for both.
+
+Usage: python -m parsers.lib.ocr_benchmark parsers/test/mocks/SG_ema_gov_sg_solar_map*.png
+"""
+
+import io
+import time
+from logging import CRITICAL, getLogger
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+import click
+
+from parsers import SG
+from parsers.lib.benchmark import clear_memory_caches
+
+DEFAULT_REPEAT = 5
+
+
+class _ImageSession:
+    """Serves the same image for every request, as `get_solar` streams it."""
+
+    def __init__(self, content: bytes):
+        self.content = content
+
+    def get(self, url: str, **kwargs) -> SimpleNamespace:
+        return SimpleNamespace(raw=io.BytesIO(self.content))
+
+
+def _median(values: List[float]) -> float:
+    return sorted(values)[len(values) // 2]
+
+
+def benchmark(path: Path, repeat: int = DEFAULT_REPEAT) -> Dict[str, Any]:
+    """Times `get_solar` on one image, with and without cached OCR results."""
+    session = _ImageSession(Path(path).read_bytes())
+    logger = getLogger(__name__)
+    seconds: Dict[str, List[float]] = {"cold": [], "cached": []}
+    solar_mw: Optional[float] = None
+    for _ in range(repeat):
+        for run in ("cold", "cached"):
+            if run == "cold":
+                clear_memory_caches()
+            start = time.perf_counter()
+            # None for an image older than an hour, which is read all the same
+            solar_mw = SG.get_solar(session, logger)
+            seconds[run].append(time.perf_counter() - start)
+    return {
+        "image": str(path),
+        "solar_mw": solar_mw,
+        "seconds": {run: _median(values) for run, values in seconds.items()},
+    }
+
+
+@click.command()
+@click.argument("images", nargs=-1, required=True, type=click.Path(exists=True))
+@click.option("--repeat", default=DEFAULT_REPEAT, show_default=True)
+def main(images, repeat):
+    """\b
+    Examples
+    -------
+    >>> python -m parsers.lib.ocr_benchmark parsers/test/mocks/SG_*.png
+    """
+    getLogger().setLevel(CRITICAL)
+    print(f"{'image':<50}{'cold':>11}{'cached':>11}")
+    for path in images:
+        result = benchmark(Path(path), repeat)
+        seconds = result["seconds"]
+        print(
+            f"{Path(path).name:<50}"
+            f"{seconds['cold'] * 1000:>9.1f}ms{seconds['cached'] * 1000:>9.1f}ms"
+        )
+
+
+if __name__ == "__main__":
+    # pylint: disable=no-value-for-parameter
+    main()
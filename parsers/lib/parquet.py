@@ -0,0 +1,223 @@
+"""
+Parser results as Arrow tables, written to partitioned Parquet datasets.
+
+Each data type has a fixed schema (see SCHEMAS) following the keys of
+parsers/example.py. Production, storage and forecasted modes are one column
+per mode (e.g. `production.wind`, as in parsers.lib.timeseries), zone keys and
+currencies are dictionary encoded and datetimes are UTC. Datasets are laid out
+by data type, zone and month, readable with `pyarrow.dataset` as a hive
+partitioned dataset:
+
+    root/data_type=production/zone=DE/month=2022-01/part-0.parquet
+
+    with ParquetWriter(root) as writer:
+        for events in windows:
+            writer.write("DE", "production", events)
+
+Rows are buffered per partition and written as row groups of `row_group_size`,
+so long backfills stream to disk. At most `max_open_files` partitions are open
+at once, the least recently written one is closed to open another. `commit`
+closes every open partition, after which all rows written so far are in the
+dataset. Every commit adds a part per open partition, so streaming writers
+should commit every `row_group_size` rows or so (see `pending_rows`), not after
+every write. Parts are written under a hidden temporary name and renamed when
+closed, so a killed writer leaves no incomplete files in the dataset. Existing
+files are never overwritten, every writer adds parts numbered after the last
+one.
+"""
+
+import os
+import re
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+import arrow
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from electricitymap.contrib.config.constants import (
+    FORECASTED_PRODUCTION_MODES,
+    PRODUCTION_MODES,
+    STORAGE_MODES,
+)
+
+DEFAULT_ROW_GROUP_SIZE = 100_000
+MAX_OPEN_FILES = 64
+
+KEY = pa.dictionary(pa.int32(), pa.string())
+DATETIME = pa.timestamp("s", tz="UTC")
+
+# Parts being written start with a dot, which pyarrow.dataset ignores.
+PART_NAME = re.compile(r"^\.?part-(\d+)\.parquet(\.tmp)?$")
+
+
+def _modes(prefix: str, modes: List[str]) -> List[pa.Field]:
+    return [pa.field(f"{prefix}.{mode}", pa.float64()) for mode in modes]
+
+
+SCHEMAS: Dict[str, pa.Schema] = {
+    "production": pa.schema(
+        [("zoneKey", KEY), ("datetime", DATETIME)]
+        + _modes("production", PRODUCTION_MODES)
+        + _modes("storage", STORAGE_MODES)
+        + [("source", pa.string())]
+    ),
+    "consumption": pa.schema(
+        [
+            ("zoneKey", KEY),
+            ("datetime", DATETIME),
+            ("consumption", pa.float64()),
+            ("source", pa.string()),
+        ]
+    ),
+    "exchange": pa.schema(
+        [
+            ("sortedZoneKeys", KEY),
+            ("datetime", DATETIME),
+            ("netFlow", pa.float64()),
+            ("source", pa.string()),
+        ]
+    ),
+    "price": pa.schema(
+        [
+            ("zoneKey", KEY),
+            ("datetime", DATETIME),
+            ("price", pa.float64()),
+            ("currency", KEY),
+            ("source", pa.string()),
+        ]
+    ),
+    "forecast": pa.schema(
+        [("zoneKey", KEY), ("datetime", DATETIME), ("value", pa.float64())]
+        + _modes("production", FORECASTED_PRODUCTION_MODES)
+        + [("source", pa.string())]
+    ),
+}
+
+# Schema of each parser data type
+DATA_TYPE_SCHEMAS = {
+    "production": "production",
+    "consumption": "consumption",
+    "exchange": "exchange",
+    "exchangeForecast": "exchange",
+    "price": "price",
+    "consumptionForecast": "forecast",
+    "generationForecast": "forecast",
+    "productionPerModeForecast": "forecast",
+}
+
+
+def _get(event: dict, column: str) -> Any:
+    value = event
+    for part in column.split("."):
+        value = value.get(part) if isinstance(value, dict) else None
+    return value
+
+
+def get_schema(data_type: str) -> pa.Schema:
+    if data_type not in DATA_TYPE_SCHEMAS:
+        raise ValueError(f"Unsupported data type {data_type}")
+    return SCHEMAS[DATA_TYPE_SCHEMAS[data_type]]
+
+
+def to_table(data_type: str, events: Iterable[dict]) -> pa.Table:
+    """Returns parser events as a table of the schema of their data type. Fields
+    that aren't in the schema are dropped, missing ones are null."""
+    schema = get_schema(data_type)
+    events = [event for event in events if event]
+    columns = []
+    for field in schema:
+        if field.name == "datetime":
+            values = [arrow.get(e["datetime"]).to("UTC").datetime for e in events]
+        else:
+            values = [_get(e, field.name) for e in events]
+        columns.append(pa.array(values, type=field.type))
+    return pa.Table.from_arrays(columns, schema=schema)
+
+
+def _next_part(directory: Path) -> int:
+    parts = [PART_NAME.match(name) for name in os.listdir(directory)]
+    return max((int(match.group(1)) + 1 for match in parts if match), default=0)
+
+
+class _Partition:
+    def __init__(self, directory: Path, schema: pa.Schema):
+        directory.mkdir(parents=True, exist_ok=True)
+        part = _next_part(directory)
+        self.path = directory / f"part-{part}.parquet"
+        self.tmp_path = directory / f".part-{part}.parquet.tmp"
+        self.writer = pq.ParquetWriter(self.tmp_path, schema)
+        self.buffer: List[pa.Table] = []
+        self.rows = 0
+
+    def flush(self) -> None:
+        if self.buffer:
+            self.writer.write_table(pa.concat_tables(self.buffer))
+            self.buffer, self.rows = [], 0
+
+    def close(self) -> None:
+        self.flush()
+        self.writer.close()
+        os.replace(self.tmp_path, self.path)
+
+
+class ParquetWriter:
+    """Writes parser events to a Parquet dataset under `root`. Use as a context
+    manager, or call `close` to write buffered rows."""
+
+    def __init__(
+        self,
+        root: str,
+        row_group_size: int = DEFAULT_ROW_GROUP_SIZE,
+        max_open_files: int = MAX_OPEN_FILES,
+    ):
+        self.root = Path(root)
+        self.row_group_size = row_group_size
+        self.max_open_files = max_open_files
+        self._partitions: "OrderedDict[Path, _Partition]" = OrderedDict()
+        # Rows written since the last commit
+        self.pending_rows = 0
+
+    def _get_partition(self, directory: Path, schema: pa.Schema) -> _Partition:
+        if directory in self._partitions:
+            self._partitions.move_to_end(directory)
+        else:
+            if len(self._partitions) >= self.max_open_files:
+                self._partitions.popitem(last=False)[1].close()
+            self._partitions[directory] = _Partition(directory, schema)
+        return self._partitions[directory]
+
+    def write(self, key: str, data_type: str, events: Iterable[dict]) -> int:
+        """Buffers events of a zone or exchange, returns their number."""
+        table = to_table(data_type, events)
+        months = [dt.strftime("%Y-%m") for dt in table["datetime"].to_pylist()]
+        for month in sorted(set(months)):
+            directory = (
+                self.root / f"data_type={data_type}" / f"zone={key}" / f"month={month}"
+            )
+            partition = self._get_partition(directory, table.schema)
+            partition.buffer.append(
+                table.filter(pa.array([m == month for m in months]))
+            )
+            partition.rows += partition.buffer[-1].num_rows
+            if partition.rows >= self.row_group_size:
+                partition.flush()
+        self.pending_rows += table.num_rows
+        return table.num_rows
+
+    def commit(self) -> None:
+        """Closes open partitions, so every row written so far is in the dataset."""
+        while self._partitions:
+            self._partitions.popitem(last=False)[1].close()
+        self.pending_rows = 0
+
+    def close(self) -> None:
+        self.commit()
+
+    def __enter__(self) -> "ParquetWriter":
+        return self
+
+    def __exit__(self, *exc_info) -> Optional[bool]:
+        self.close()
+        return None
@@ -1,6 +1,7 @@
 import importlib
 
 from electricitymap.contrib.config import EXCHANGES_CONFIG, ZONES_CONFIG
+from parsers.lib.instrumentation import instrument
 
 # Prepare all parsers
 CONSUMPTION_PARSERS = {}
@@ -30,11 +31,15 @@ for zone_id, zone_config in ZONES_CONFIG.items():
     for parser_key, v in zone_config.get("parsers", {}).items():
         mod_name, fun_name = v.split(".")
         mod = importlib.import_module("parsers.%s" % mod_name)
-        PARSER_KEY_TO_DICT[parser_key][zone_id] = getattr(mod, fun_name)
+        PARSER_KEY_TO_DICT[parser_key][zone_id] = instrument(
+            getattr(mod, fun_name), parser_key
+        )
 
 # Read all exchanges
 for exchange_id, exchange_config in EXCHANGES_CONFIG.items():
     for parser_key, v in exchange_config.get("parsers", {}).items():
         mod_name, fun_name = v.split(".")
         mod = importlib.import_module("parsers.%s" % mod_name)
-        PARSER_KEY_TO_DICT[parser_key][exchange_id] = getattr(mod, fun_name)
+        PARSER_KEY_TO_DICT[parser_key][exchange_id] = instrument(
+            getattr(mod, fun_name), parser_key
+        )
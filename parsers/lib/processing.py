@@ -0,0 +1,75 @@
+"""
+Process pool for the CPU-bound stages of parsers.
+
+Parsers run in threads, which is fine while they wait on the network but
+serialises pure-Python parsing (BeautifulSoup, image matching) on the GIL. A
+parser marks such a stage, a module-level function of the downloaded payload,
+with `parsers.lib.config.cpu_bound`:
+
+    @cpu_bound
+    def parse_production(xml_text): ...
+
+While a pool is active (`process_pool(workers)`, or `--processes` /
+PARSER_PROCESSES of the scheduler and backfill), calls of marked stages run in
+the pool: the calling thread keeps the network I/O, and only the payload and
+the parsed result cross the process boundary. Without a pool, stages are called
+in process as usual.
+"""
+
+import importlib
+import os
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from threading import Lock
+from typing import Any, Callable, Iterator, Optional
+
+ENV_VARIABLE = "PARSER_PROCESSES"
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = Lock()
+
+
+def _run_stage(module_name: str, qualname: str, args: tuple, kwargs: dict) -> Any:
+    """Runs a cpu_bound stage in a worker process. Stages are looked up by name
+    since the decorated function itself can't be pickled."""
+    stage = getattr(importlib.import_module(module_name), qualname)
+    return stage.__wrapped__(*args, **kwargs)
+
+
+def dispatch(f: Callable, args: tuple, kwargs: dict) -> Any:
+    """Calls a cpu_bound stage in the active pool, or in process if there is none."""
+    pool = _pool
+    if pool is None:
+        return f(*args, **kwargs)
+    return pool.submit(_run_stage, f.__module__, f.__qualname__, args, kwargs).result()
+
+
+def start(workers: Optional[int] = None) -> ProcessPoolExecutor:
+    """Starts the process pool used by cpu_bound stages, if not started yet."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=workers or os.cpu_count())
+        return _pool
+
+
+def shutdown() -> None:
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown()
+
+
+def is_active() -> bool:
+    return _pool is not None
+
+
+@contextmanager
+def process_pool(workers: Optional[int] = None) -> Iterator[ProcessPoolExecutor]:
+    """Runs cpu_bound stages in a pool of `workers` processes inside the block."""
+    pool = start(workers)
+    try:
+        yield pool
+    finally:
+        shutdown()
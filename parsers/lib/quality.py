@@ -163,3 +163,11 @@ def validate_production(obj: Dict[str, Any], zone_key: ZoneKey) -> None:
             )
 
     validate_reasonable_time(obj, zone_key)
+
+
+# Feeder-level validation function for each data type that has one.
+VALIDATORS = {
+    "consumption": validate_consumption,
+    "exchange": validate_exchange,
+    "production": validate_production,
+}
@@ -0,0 +1,391 @@
+"""
+Plans and dispatches live parser calls for every configured zone and exchange.
+
+Run times are derived from the only scheduling metadata we have:
+- `REFETCH_FREQUENCY`, set by `parsers.lib.config.refetch_frequency`, which is how
+  much history a single call returns. A parser is called `REFETCH_POLLS` times
+  per window, so that consecutive calls overlap without re-reading the same
+  history every few minutes.
+- `delays` from zones.json (in hours). Data that is published with a delay
+  doesn't become fresher by polling every few minutes.
+
+Usage: python -m parsers.lib.scheduler --dry-run
+"""
+
+import heapq
+import importlib
+import inspect
+import re
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from logging import Logger, getLogger
+from threading import BoundedSemaphore, Lock
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import click
+from requests import Session
+
+from electricitymap.contrib.config.constants import EXCHANGE_DATA_TYPES
+from electricitymap.contrib.config.model import CONFIG_MODEL, ConfigModel
+from parsers.lib import processing
+from parsers.lib.composite import SeriesStore, cycle, cycle_session
+from parsers.lib.fingerprints import FingerprintStore
+from parsers.lib.incremental import (
+    PointHashes,
+    record_diff,
+    revision_report,
+    trim_pending,
+    watermark,
+)
+from parsers.lib.instrumentation import instrument
+
+# Interval used for parsers without any scheduling metadata, and the shortest
+# one planned from it.
+DEFAULT_INTERVAL = timedelta(minutes=5)
+# A parser returning a window of history `w` is polled every `w / REFETCH_POLLS`.
+REFETCH_POLLS = 4
+# A parser whose data is delayed by `d` hours is polled every `d / DELAY_POLLS`.
+DELAY_POLLS = 4
+DEFAULT_HOST_CONCURRENCY = 4
+DEFAULT_WORKERS = 16
+
+# Parser modules whose functions all read one upstream document per cycle and
+# cache it for live calls. Their calls are coalesced: they run together, one
+# after the other, so that only the first call of a group hits the network.
+# RU (live calls aren't cached) and JP (production also downloads a per-zone
+# file) don't qualify.
+SHARED_DOCUMENTS = {
+    "BR": "BR",
+    "occtonet": "occtonet",
+    "OPENNEM": "OPENNEM",
+}
+
+_URL_HOST = re.compile(r"https?://([A-Za-z0-9.\-]+)")
+_module_hosts: Dict[str, str] = {}
+
+
+class ScheduledTask(NamedTuple):
+    key: str  # zone key or sorted zone keys
+    data_type: str
+    function_name: str  # e.g. "ENTSOE.fetch_production"
+    function: Callable
+    interval: timedelta
+    host: str
+    group: str  # calls with the same group share an upstream document
+
+
+def get_host(function_name: str) -> str:
+    """Returns the upstream host a parser module mostly talks to.
+
+    This is the most common host of the URLs in the module source, or the module
+    name if none can be found.
+    """
+    module_name = function_name.split(".")[0]
+    if module_name not in _module_hosts:
+        try:
+            source = inspect.getsource(
+                importlib.import_module(f"parsers.{module_name}")
+            )
+        except (ImportError, OSError, TypeError):
+            source = ""
+        hosts = Counter(_URL_HOST.findall(source))
+        _module_hosts[module_name] = (
+            hosts.most_common(1)[0][0] if hosts else module_name
+        )
+    return _module_hosts[module_name]
+
+
+def get_interval(function: Callable, delay_hours: Optional[int] = None) -> timedelta:
+    """Returns how often a parser function should be called."""
+    refetch_frequency = getattr(function, "REFETCH_FREQUENCY", None)
+    interval = DEFAULT_INTERVAL
+    if refetch_frequency is not None:
+        interval = max(interval, refetch_frequency / REFETCH_POLLS)
+    if delay_hours:
+        interval = max(interval, timedelta(hours=delay_hours) / DELAY_POLLS)
+    if refetch_frequency is not None:
+        # Never less often than the history returned by a single call
+        interval = min(interval, refetch_frequency)
+    return interval
+
+
+def _configured_parsers(
+    config_model: ConfigModel,
+) -> Iterable[Tuple[str, str, str, Callable, Optional[int]]]:
+    for zone_key, zone in config_model.zones.items():
+        delays = zone.delays.dict() if zone.delays else {}
+        for data_type, function_name in zone.parsers.dict().items():
+            if function_name:
+                yield (
+                    zone_key,
+                    data_type,
+                    function_name,
+                    instrument(zone.parsers.get_function(data_type), data_type),
+                    delays.get(data_type),
+                )
+    for exchange_key, exchange in config_model.exchanges.items():
+        if not exchange.parsers:
+            continue
+        for data_type, function_name in exchange.parsers.dict().items():
+            if function_name:
+                yield (
+                    exchange_key,
+                    data_type,
+                    function_name,
+                    instrument(exchange.parsers.get_function(data_type), data_type),
+                    None,
+                )
+
+
+def plan_tasks(
+    config_model: ConfigModel = CONFIG_MODEL,
+    keys: Optional[Iterable[str]] = None,
+    data_types: Optional[Iterable[str]] = None,
+) -> List[ScheduledTask]:
+    """Enumerates every configured (zone/exchange, data type, function) and plans
+    its interval, host and coalescing group."""
+    keys = set(keys) if keys else None
+    data_types = set(data_types) if data_types else None
+    tasks = []
+    for key, data_type, function_name, function, delay in _configured_parsers(
+        config_model
+    ):
+        if (keys and key not in keys) or (data_types and data_type not in data_types):
+            continue
+        interval = get_interval(function, delay)
+        module_name = function_name.split(".")[0]
+        if module_name in SHARED_DOCUMENTS:
+            group = f"{SHARED_DOCUMENTS[module_name]}@{interval}"
+        else:
+            group = f"{function_name}:{key}:{data_type}"
+        tasks.append(
+            ScheduledTask(
+                key=key,
+                data_type=data_type,
+                function_name=function_name,
+                function=function,
+                interval=interval,
+                host=get_host(function_name),
+                group=group,
+            )
+        )
+    return tasks
+
+
+def coalesce(tasks: Iterable[ScheduledTask]) -> Dict[str, List[ScheduledTask]]:
+    """Groups tasks that share an upstream document."""
+    groups: Dict[str, List[ScheduledTask]] = defaultdict(list)
+    for task in tasks:
+        groups[task.group].append(task)
+    return dict(groups)
+
+
+def requests_per_host_per_hour(tasks: Iterable[ScheduledTask]) -> Dict[str, float]:
+    """Estimates the planned request volume, counting one request per call and a
+    single one per coalesced group."""
+    volume: Dict[str, float] = defaultdict(float)
+    for group in coalesce(tasks).values():
+        calls_per_hour = timedelta(hours=1) / group[0].interval
+        if group[0].function_name.split(".")[0] in SHARED_DOCUMENTS:
+            volume[group[0].host] += calls_per_hour
+        else:
+            volume[group[0].host] += calls_per_hour * len(group)
+    return dict(volume)
+
+
+def run_task(
+    task: ScheduledTask,
+    session: Optional[Session] = None,
+    logger: Logger = getLogger(__name__),
+) -> Any:
+    """Calls a parser function with the arguments its data type expects."""
+    if task.data_type in EXCHANGE_DATA_TYPES:
+        args = task.key.split("->")
+    else:
+        args = [task.key]
+    return task.function(*args, session=session, target_datetime=None, logger=logger)
+
+
+class Scheduler:
+    """Runs planned tasks on a bounded worker pool with per-host concurrency limits.
+
+    `on_result(task, result)` and `on_error(task, exception)` are called from the
+    worker threads. With `hashes`, runs are incremental (see
+    parsers.lib.incremental): results only contain new or changed points, whose
+    hashes are recorded once `on_result` returned.
+    """
+
+    def __init__(
+        self,
+        tasks: List[ScheduledTask],
+        on_result: Callable[[ScheduledTask, Any], None],
+        on_error: Optional[Callable[[ScheduledTask, Exception], None]] = None,
+        workers: int = DEFAULT_WORKERS,
+        host_limits: Optional[Dict[str, int]] = None,
+        session: Optional[Session] = None,
+        hashes: Optional[PointHashes] = None,
+        logger: Logger = getLogger(__name__),
+    ):
+        self.groups = coalesce(tasks)
+        self.hashes = hashes
+        self.on_result = on_result
+        self.on_error = on_error
+        self.workers = workers
+        # Tasks of different groups, and composite zones, often request the same
+        # series and documents within a cycle
+        self.store = SeriesStore(max_age=DEFAULT_INTERVAL)
+        self.session = session or cycle_session(self.store, pool_size=workers)
+        self.logger = logger
+        host_limits = host_limits or {}
+        self._host_semaphores = {
+            task.host: BoundedSemaphore(
+                host_limits.get(task.host, DEFAULT_HOST_CONCURRENCY)
+            )
+            for task in tasks
+        }
+        self._running_groups = set()
+        self._running_lock = Lock()
+
+    def _run_group(self, group: str) -> None:
+        try:
+            for task in self.groups[group]:
+                known_up_to = (
+                    self.hashes.known_up_to(task.key, task.data_type)
+                    if self.hashes is not None
+                    else None
+                )
+                with self._host_semaphores[task.host], cycle(self.store), watermark(
+                    known_up_to
+                ):
+                    try:
+                        result = run_task(task, self.session, self.logger)
+                        if self.hashes is not None:
+                            result, diff = trim_pending(
+                                self.hashes, task.key, task.data_type, result
+                            )
+                    except Exception as e:
+                        self.logger.exception(
+                            f"{task.function_name} failed for {task.key}",
+                            extra={"key": task.key},
+                        )
+                        if self.on_error:
+                            self.on_error(task, e)
+                        continue
+                self.on_result(task, result)
+                # Points of a result that couldn't be handled are emitted again
+                if self.hashes is not None:
+                    record_diff(self.hashes, task.key, task.data_type, diff)
+        finally:
+            with self._running_lock:
+                self._running_groups.discard(group)
+
+    def run(self, duration: Optional[timedelta] = None) -> None:
+        """Dispatches due groups until `duration` has elapsed (forever if None).
+        A group that is still running when it is due again is skipped."""
+        start = time.monotonic()
+        due: List[Tuple[float, str]] = [(start, group) for group in self.groups]
+        heapq.heapify(due)
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            while due:
+                next_run, group = heapq.heappop(due)
+                if (
+                    duration is not None
+                    and next_run - start >= duration.total_seconds()
+                ):
+                    break
+                time.sleep(max(0, next_run - time.monotonic()))
+                with self._running_lock:
+                    is_running = group in self._running_groups
+                    self._running_groups.add(group)
+                if is_running:
+                    self.logger.warning(f"Skipping {group}, previous run not finished")
+                else:
+                    executor.submit(self._run_group, group)
+                interval = self.groups[group][0].interval.total_seconds()
+                heapq.heappush(due, (next_run + interval, group))
+
+
+def print_plan(tasks: List[ScheduledTask]) -> None:
+    """Prints the planned request volume per host per hour."""
+    volume = requests_per_host_per_hour(tasks)
+    width = max([len(host) for host in volume] + [4])
+    print(f"{'host':<{width}}  requests/hour")
+    for host, requests in sorted(volume.items(), key=lambda item: -item[1]):
+        print(f"{host:<{width}}  {requests:>13.1f}")
+    print(
+        f"{'total':<{width}}  {sum(volume.values()):>13.1f}"
+        f"  ({len(tasks)} parser entries, {len(coalesce(tasks))} groups)"
+    )
+
+
+@click.command()
+@click.option("--zone", "zones", multiple=True, help="Only schedule these keys.")
+@click.option("--data-type", "data_types", multiple=True)
+@click.option("--workers", default=DEFAULT_WORKERS, show_default=True)
+@click.option("--dry-run", is_flag=True, help="Print the plan and exit.")
+@click.option(
+    "--processes",
+    type=int,
+    default=None,
+    envvar=processing.ENV_VARIABLE,
+    help="Run CPU-bound parsing stages in a pool of this many processes.",
+)
+@click.option(
+    "--incremental",
+    is_flag=True,
+    help="Only report points that are new or changed since the previous run.",
+)
+@click.option(
+    "--fingerprints",
+    type=click.Path(dir_okay=False),
+    default=None,
+    help="Persist the fingerprints of incremental runs in this file.",
+)
+def main(zones, data_types, workers, dry_run, processes, incremental, fingerprints):
+    """\b
+    Examples
+    -------
+    >>> python -m parsers.lib.scheduler --dry-run
+    >>> python -m parsers.lib.scheduler --zone DK-DK1 --zone DE --workers 4
+    >>> python -m parsers.lib.scheduler --workers 64 --processes 16
+    >>> python -m parsers.lib.scheduler --incremental
+    >>> python -m parsers.lib.scheduler --fingerprints fingerprints.bin
+    """
+    tasks = plan_tasks(keys=zones, data_types=data_types)
+    if dry_run:
+        print_plan(tasks)
+        return
+
+    logger = getLogger(__name__)
+
+    def on_result(task: ScheduledTask, result: Any) -> None:
+        count = len(result) if isinstance(result, (list, tuple)) else int(bool(result))
+        logger.info(f"{task.function_name} {task.key} {task.data_type}: {count} events")
+
+    hashes = None
+    if fingerprints:
+        hashes = FingerprintStore(fingerprints)
+    elif incremental:
+        hashes = PointHashes()
+
+    if processes:
+        processing.start(processes)
+    try:
+        Scheduler(tasks, on_result, workers=workers, hashes=hashes, logger=logger).run()
+    finally:
+        processing.shutdown()
+        if isinstance(hashes, FingerprintStore):
+            hashes.flush()
+        if hashes is not None:
+            for key, data_type, counts in revision_report(hashes):
+                logger.info(
+                    f"{key} {data_type}: {counts['new']} new, "
+                    f"{counts['revised']} revised, {counts['unchanged']} unchanged"
+                )
+
+
+if __name__ == "__main__":
+    # pylint: disable=no-value-for-parameter
+    main()
@@ -0,0 +1,121 @@
+"""
+Coalesces identical HTTP requests that are in flight at the same time.
+
+Many configured entries request the same upstream document concurrently, e.g.
+both sides of an ENTSOE exchange or the production and exchange parsers of a
+zone that publishes a single snapshot. With a `CoalescingAdapter` mounted on the
+session they share, the first of concurrent identical requests (same method,
+URL with sorted query, headers and body) goes to the network and the others
+wait for its response. Nothing is kept once the request completes: this is not
+a cache.
+
+Requests are compared on a hash that includes their credentials, so requests
+made with different tokens are never shared. Streamed requests and requests
+with a streamed body are never coalesced.
+"""
+
+import hashlib
+from concurrent.futures import Future
+from threading import Lock
+from typing import Callable, Dict, Optional, Tuple, TypeVar
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from requests import PreparedRequest, Response, Session
+from requests.adapters import HTTPAdapter
+
+from parsers.lib.cassette import build_response, response_meta
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """Runs at most one call per key at a time; concurrent callers with the same
+    key get the result (or exception) of the call in flight."""
+
+    def __init__(self):
+        self._calls: Dict[str, Future] = {}
+        self._lock = Lock()
+        self.shared = 0
+
+    def do(self, key: str, function: Callable[[], T]) -> Tuple[T, bool]:
+        """Returns the result and whether it was shared with a call in flight."""
+        with self._lock:
+            future = self._calls.get(key)
+            is_leader = future is None
+            if is_leader:
+                future = self._calls[key] = Future()
+            else:
+                self.shared += 1
+        if not is_leader:
+            return future.result(), True
+
+        try:
+            result = function()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+        finally:
+            with self._lock:
+                del self._calls[key]
+        return result, False
+
+
+def coalescing_key(request: PreparedRequest) -> Optional[str]:
+    """Hash of the method, URL with sorted query, headers and body of a request,
+    or None if its body is streamed."""
+    body = request.body
+    if isinstance(body, str):
+        body = body.encode()
+    elif body is None:
+        body = b""
+    elif not isinstance(body, bytes):
+        return None
+    parts = urlsplit(request.url)
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    headers = sorted((name.lower(), value) for name, value in request.headers.items())
+
+    digest = hashlib.sha256()
+    for part in [request.method.upper(), urlunsplit(parts._replace(query=query))]:
+        digest.update(part.encode() + b"\0")
+    for name, value in headers:
+        digest.update(f"{name}: {value}".encode() + b"\0")
+    digest.update(body)
+    return digest.hexdigest()
+
+
+class CoalescingAdapter(HTTPAdapter):
+    """Shares the response of concurrent identical requests."""
+
+    def __init__(self, flight: Optional[SingleFlight] = None, **kwargs):
+        super().__init__(**kwargs)
+        self.flight = flight or SingleFlight()
+
+    def send(self, request: PreparedRequest, *args, **kwargs) -> Response:
+        key = None if kwargs.get("stream") else coalescing_key(request)
+        if key is None:
+            return super().send(request, *args, **kwargs)
+
+        def fetch() -> Response:
+            response = super(CoalescingAdapter, self).send(request, *args, **kwargs)
+            # Read while in flight, so that waiters don't touch the connection
+            response.content
+            return response
+
+        response, shared = self.flight.do(key, fetch)
+        if not shared:
+            return response
+        # Each caller gets its own response object
+        return build_response(request, response_meta(response), response.content)
+
+
+def coalescing_session(
+    session: Optional[Session] = None, pool_size: int = 10
+) -> Session:
+    """Mounts a CoalescingAdapter for http and https on a (new) session."""
+    session = session or Session()
+    adapter = CoalescingAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
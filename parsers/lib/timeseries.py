@@ -0,0 +1,293 @@
+"""
+A local store of parser outputs, as memory-mapped columnar arrays.
+
+Each (key, data type) is a directory holding a sorted int64 array of
+timestamps (seconds since epoch) and one float array per column, e.g.
+`production.wind` for every mode of PRODUCTION_MODES and `storage.hydro` for
+every mode of STORAGE_MODES, with NaN for missing values:
+
+    store = TimeSeriesStore("data")
+    store.append("DE", "production", events)
+    block = store.read("DE", "production", start, end)
+    block.columns["production.wind"]  # a view of the mapped file
+
+Appends that are older than the latest stored point (revisions, backfills in
+any order) are merged in, points with the same timestamp replace stored ones.
+Reads are zero-copy slices.
+
+Stored points are never overwritten before the points replacing them are on
+disk: new points are written past the stored ones, and `meta.json`, replaced
+atomically, then marks them as stored. A merged tail is first written to that
+free space too, and only copied over the stored tail once `meta.json` records
+where it is; a copy that was interrupted is redone when the table is reopened.
+
+The functions of `validators/` take DataFrames, so `run_validators` runs them on
+a copy of the points (`Block.to_frame`), not straight on the mapped arrays.
+"""
+
+import json
+import os
+from datetime import datetime
+from pathlib import Path
+from threading import Lock
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import arrow
+import numpy as np
+import pandas as pd
+
+from electricitymap.contrib.config.constants import PRODUCTION_MODES, STORAGE_MODES
+
+COLUMNS: Dict[str, List[str]] = {
+    "production": [f"production.{mode}" for mode in PRODUCTION_MODES]
+    + [f"storage.{mode}" for mode in STORAGE_MODES],
+    "consumption": ["consumption"],
+    "exchange": ["netFlow"],
+    "price": ["price"],
+}
+INITIAL_CAPACITY = 1024
+
+TIMESTAMP = np.dtype("<i8")
+
+
+def _get_value(event: dict, column: str) -> float:
+    value = event
+    for part in column.split("."):
+        value = value.get(part) if isinstance(value, dict) else None
+    return np.nan if value is None else value
+
+
+class Block(NamedTuple):
+    """Points of a range, as views of the mapped arrays."""
+
+    timestamps: np.ndarray
+    columns: Dict[str, np.ndarray]
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def to_frame(self) -> pd.DataFrame:
+        """Returns the points indexed by datetime. pandas consolidates the columns
+        into a single block, so the frame holds a copy of them."""
+        index = pd.DatetimeIndex(
+            pd.to_datetime(self.timestamps, unit="s", utc=True), name="datetime"
+        )
+        return pd.DataFrame(self.columns, index=index)
+
+
+def to_block(data_type: str, events: Iterable[dict]) -> Block:
+    """Returns parser events as the columns of their data type, in their order."""
+    events = [event for event in events if event and event.get("datetime")]
+    timestamps = np.array(
+        [arrow.get(event["datetime"]).timestamp for event in events], dtype=TIMESTAMP
+    )
+    columns = {
+        column: np.array([_get_value(e, column) for e in events], dtype=np.float64)
+        for column in COLUMNS[data_type]
+    }
+    return Block(timestamps, columns)
+
+
+class Table:
+    """The arrays of one (key, data type), in `directory`."""
+
+    def __init__(self, directory: Path, columns: List[str], dtype=np.float64):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._meta_path = self.directory / "meta.json"
+        if self._meta_path.exists():
+            meta = json.loads(self._meta_path.read_text())
+            self.column_names, self.dtype = meta["columns"], np.dtype(meta["dtype"])
+            self.length = meta["length"]
+            # (position, start, count) of a merged tail not copied into place yet
+            self._moving: Optional[Tuple[int, int, int]] = meta.get("moving")
+        else:
+            self.column_names, self.dtype = list(columns), np.dtype(dtype)
+            self.length = 0
+            self._moving = None
+            self._save_meta()
+        self.lock = Lock()
+        self._map(INITIAL_CAPACITY)
+        if self._moving:
+            self._move_tail()
+
+    def _save_meta(self) -> None:
+        meta = {
+            "columns": self.column_names,
+            "dtype": self.dtype.str,
+            "length": self.length,
+            "moving": self._moving,
+        }
+        tmp_path = self._meta_path.with_suffix(".json.tmp")
+        tmp_path.write_text(json.dumps(meta))
+        os.replace(tmp_path, self._meta_path)
+
+    def _map_file(self, name: str, dtype: np.dtype, capacity: int) -> np.memmap:
+        path = self.directory / name
+        with open(path, "ab") as f:
+            if f.tell() < capacity * dtype.itemsize:
+                f.truncate(capacity * dtype.itemsize)
+            size = max(f.tell(), capacity * dtype.itemsize)
+        return np.memmap(path, dtype, mode="r+", shape=(size // dtype.itemsize,))
+
+    def _map(self, capacity: int) -> None:
+        self.timestamps = self._map_file("timestamp.bin", TIMESTAMP, capacity)
+        self.columns = {
+            column: self._map_file(f"{column}.bin", self.dtype, capacity)
+            for column in self.column_names
+        }
+
+    @property
+    def capacity(self) -> int:
+        return len(self.timestamps)
+
+    def read(self, start: Optional[int] = None, end: Optional[int] = None) -> Block:
+        """Returns the points in [start, end)."""
+        timestamps = self.timestamps[: self.length]
+        i = 0 if start is None else np.searchsorted(timestamps, start, "left")
+        j = self.length if end is None else np.searchsorted(timestamps, end, "left")
+        return Block(
+            timestamps[i:j],
+            {column: values[i:j] for column, values in self.columns.items()},
+        )
+
+    def write(self, timestamps: np.ndarray, values: np.ndarray) -> None:
+        """Merges points, `values` having one column per column name."""
+        if not len(timestamps):
+            return
+        # Only the tail from the earliest new point is rewritten, nothing when
+        # points are appended in order
+        start = int(
+            np.searchsorted(self.timestamps[: self.length], timestamps.min(), "left")
+        )
+        if start < self.length:
+            tail = [self.columns[c][start : self.length] for c in self.column_names]
+            timestamps = np.concatenate(
+                [self.timestamps[start : self.length], timestamps]
+            )
+            values = np.concatenate([np.column_stack(tail), values])
+        # The last point of each timestamp wins, the ones being written after
+        # the stored ones
+        order = np.argsort(timestamps, kind="stable")
+        timestamps, values = timestamps[order], values[order]
+        last = np.append(timestamps[1:] != timestamps[:-1], True)
+        timestamps, values = timestamps[last], values[last]
+
+        # Points are written past the stored ones: where they go when appended
+        # in order, and past where they go otherwise
+        count = len(timestamps)
+        position = start if start == self.length else max(self.length, start + count)
+        if position + count > self.capacity:
+            capacity = self.capacity
+            while capacity < position + count:
+                capacity *= 2
+            self._map(capacity)
+        self.timestamps[position : position + count] = timestamps
+        for k, column in enumerate(self.column_names):
+            self.columns[column][position : position + count] = values[:, k]
+        self.flush()
+        self.length = start + count
+        if position != start:
+            self._moving = (position, start, count)
+        self._save_meta()
+        if self._moving:
+            self._move_tail()
+
+    def _move_tail(self) -> None:
+        """Copies a merged tail from where it was written to where it goes."""
+        position, start, count = self._moving
+        self.timestamps[start : start + count] = self.timestamps[
+            position : position + count
+        ]
+        for values in self.columns.values():
+            values[start : start + count] = values[position : position + count]
+        self.flush()
+        self._moving = None
+        self._save_meta()
+
+    def flush(self) -> None:
+        self.timestamps.flush()
+        for values in self.columns.values():
+            values.flush()
+
+
+class TimeSeriesStore:
+    """Tables of parser outputs per (key, data type), under `root`."""
+
+    def __init__(self, root: str, dtype=np.float64):
+        self.root = Path(root)
+        self.dtype = dtype
+        self._tables: Dict[Tuple[str, str], Table] = {}
+        self._lock = Lock()
+
+    def table(self, key: str, data_type: str) -> Table:
+        if data_type not in COLUMNS:
+            raise ValueError(f"Unsupported data type {data_type}")
+        with self._lock:
+            if (key, data_type) not in self._tables:
+                self._tables[(key, data_type)] = Table(
+                    self.root / key / data_type, COLUMNS[data_type], self.dtype
+                )
+            return self._tables[(key, data_type)]
+
+    def append(self, key: str, data_type: str, events: Iterable[dict]) -> int:
+        """Stores parser events, returns their number."""
+        table = self.table(key, data_type)
+        block = to_block(data_type, events)
+        values = np.column_stack(
+            [block.columns[column] for column in table.column_names]
+        ).astype(table.dtype)
+        with table.lock:
+            table.write(block.timestamps, values)
+        return len(block)
+
+    def read(
+        self,
+        key: str,
+        data_type: str,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+    ) -> Block:
+        """Returns the points of [start, end). The block is only valid until the
+        next append to the table."""
+        table = self.table(key, data_type)
+        with table.lock:
+            return table.read(
+                None if start is None else arrow.get(start).timestamp,
+                None if end is None else arrow.get(end).timestamp,
+            )
+
+
+def get_validators(kind: str, zone_key: str) -> Dict[str, Callable]:
+    """Returns the functions of `validators/` to run on data of a kind and zone,
+    by name."""
+    from validators import sanity_checks, zone_specific_checks
+
+    functions = {}
+    for module in (sanity_checks, zone_specific_checks):
+        for name, f in vars(module).items():
+            if not getattr(f, "IS_VALIDATOR", False) or f.VALIDATOR_KIND != kind:
+                continue
+            if f.zone_keys is not None and zone_key not in f.zone_keys:
+                continue
+            if f.not_zone_keys is not None and zone_key in f.not_zone_keys:
+                continue
+            functions[name] = f
+    return functions
+
+
+def run_validators(
+    store: TimeSeriesStore,
+    key: str,
+    data_type: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+) -> pd.DataFrame:
+    """Returns the result of every validator of a key and data type on a range
+    of the store, one column per validator."""
+    events = store.read(key, data_type, start, end).to_frame()
+    results = {}
+    for name, f in get_validators(data_type, key).items():
+        kwargs = {"zone_key": key} if "zone_key" in f.args else {}
+        results[name] = f(events, **kwargs)
+    return pd.DataFrame(results, index=events.index)
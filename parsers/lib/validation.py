@@ -7,6 +7,8 @@ from typing import Any, Dict, List, Tuple, Union
 import numpy as np
 import pandas as pd
 
+from parsers.lib.instrumentation import timed_phase
+
 
 def has_value_for_key(datapoint: Dict[str, Any], key: str, logger: Logger):
     """
@@ -108,6 +110,7 @@ def validate_production_diffs(
     return [datapoints[i] for i in ok_diff[ok_diff].index]
 
 
+@timed_phase("validate")
 def validate(
     datapoint: Dict, logger: Union[Logger, None], **kwargs
 ) -> Union[Dict[str, Any], None]:
@@ -38,3 +38,36 @@ def get_response_text(zone_key: str, url, session: Optional[Session] = None):
 def get_response_soup(zone_key: str, url, session: Optional[Session] = None):
     response_text = get_response_text(zone_key, url, session)
     return BeautifulSoup(response_text, "html.parser")
+
+
+# asyncio variants, for use with parsers.lib.aio.AsyncSession
+
+
+async def get_response_async(zone_key: str, url: str, session):
+    response = await session.get(url)
+    if response.status_code != 200:
+        raise ParserException(
+            zone_key, "Response code: {0}".format(response.status_code)
+        )
+    return response
+
+
+async def get_response_with_params_async(zone_key: str, url, session, params=None):
+    response = await session.get(url, params=params)
+    if response.status_code != 200:
+        raise ParserException(
+            zone_key, "Response code: {0}".format(response.status_code)
+        )
+    return response
+
+
+async def get_response_text_async(zone_key: str, url, session):
+    response = await get_response_async(zone_key, url, session)
+    if not response.text:
+        raise ParserException(zone_key, "Response empty")
+    return response.text
+
+
+async def get_response_soup_async(zone_key: str, url, session):
+    response_text = await get_response_text_async(zone_key, url, session)
+    return BeautifulSoup(response_text, "html.parser")
@@ -1,9 +1,13 @@
 #!/usr/bin/env python3
 # coding=utf-8
+import time
+from collections import OrderedDict
 from datetime import datetime
 from io import StringIO
 from logging import Logger, getLogger
-from typing import Dict, List, Optional
+from threading import Lock
+from typing import Dict, List, Optional, Tuple
+from weakref import WeakKeyDictionary
 
 import arrow
 import pandas as pd
@@ -49,24 +53,74 @@ FLOWS_TO_REVERT = ["JP-CB->JP-TK", "JP-CG->JP-KN", "JP-CG->JP-SK"]
 SOURCE_URL = "occtonet.occto.or.jp"
 EXCHANGE_COLUMNS = ["sortedZoneKeys", "netFlow", "source"]
 
+# Every link is shared by two zones and each download needs a login and three form
+# posts, so downloads are cached per (link id, date). Past days are final, the
+# current day is downloaded again once its entry is older than LIVE_CACHE_TTL.
+LIVE_CACHE_TTL = 5 * 60
+SESSION_TTL = 10 * 60
+MAX_CACHED_DOWNLOADS = 256
+_link_cache: "OrderedDict[Tuple[int, str], Tuple[float, pd.DataFrame]]" = OrderedDict()
+_authorised_sessions: "WeakKeyDictionary[Session, float]" = WeakKeyDictionary()
+_cache_lock = Lock()
+_default_session: Optional[Session] = None
+
+
+def _get_session(session: Optional[Session]) -> Session:
+    """Returns the given session, or a module-wide one so that its cookies are reused."""
+    global _default_session
+    if session:
+        return session
+    with _cache_lock:
+        if _default_session is None:
+            _default_session = Session()
+        return _default_session
+
+
+def _authorise(session: Session) -> None:
+    """Logs the session in, unless it already did so within SESSION_TTL."""
+    with _cache_lock:
+        authorised_at = _authorised_sessions.get(session)
+    if authorised_at is not None and time.monotonic() - authorised_at < SESSION_TTL:
+        return
+    get_cookies(session)
+    with _cache_lock:
+        _authorised_sessions[session] = time.monotonic()
+
+
+def _fetch_link(session: Session, exchange_id: int, date: str) -> pd.DataFrame:
+    """Returns the flows of one interconnector on a given date (YYYY/MM/DD, JST).
+    The returned DataFrame is shared between callers and must not be modified."""
+    key = (exchange_id, date)
+    is_live = date >= arrow.now("Asia/Tokyo").strftime("%Y/%m/%d")
+    with _cache_lock:
+        if key in _link_cache:
+            fetched_at, df = _link_cache[key]
+            if not is_live or time.monotonic() - fetched_at < LIVE_CACHE_TTL:
+                _link_cache.move_to_end(key)
+                return df
+
+    # This authorises subsequent calls
+    _authorise(session)
+    form_data = get_form_data(session, exchange_id, date)
+    df = get_exchange(session, form_data)
+
+    with _cache_lock:
+        _link_cache[key] = (time.monotonic(), df)
+        _link_cache.move_to_end(key)
+        while len(_link_cache) > MAX_CACHED_DOWNLOADS:
+            _link_cache.popitem(last=False)
+    return df
+
 
 def _fetch_exchange(
     session: Session, datetime: datetime, sorted_zone_keys: str
 ) -> List[dict]:
     exch_id = EXCHANGE_MAPPING[sorted_zone_keys]
 
-    # This authorises subsequent calls
-    cookies = get_cookies(session)
-
-    df = pd.DataFrame()
-    for i in range(len(exch_id)):
-        form_data = get_form_data(session, exch_id[i], datetime)
-        _df = get_exchange(session, form_data)
-        if df.empty:
-            df = _df
-        else:
-            df += _df
-            df.reset_index()
+    df = _fetch_link(session, exch_id[0], datetime)
+    for link_id in exch_id[1:]:
+        df = df + _fetch_link(session, link_id, datetime)
+    df = df.copy()
 
     if sorted_zone_keys in FLOWS_TO_REVERT:
         df["netFlow"] = -1 * df["netFlow"]
@@ -93,8 +147,7 @@ def fetch_exchange(
     logger: Logger = getLogger(__name__),
 ) -> List[dict]:
     """Requests the last known power exchange (in MW) between two zones."""
-    if not session:
-        session = Session()
+    session = _get_session(session)
 
     query_datetime = arrow.get(target_datetime).to("Asia/Tokyo").strftime("%Y/%m/%d")
 
@@ -110,8 +163,7 @@ def fetch_exchange_forecast(
     logger: Logger = getLogger(__name__),
 ) -> List[dict]:
     """Gets exchange forecast between two specified zones."""
-    if not session:
-        session = Session()
+    session = _get_session(session)
 
     query_datetime = arrow.get(target_datetime).to("Asia/Tokyo").strftime("%Y/%m/%d")
 
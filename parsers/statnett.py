@@ -1,9 +1,12 @@
 #!/usr/bin/env python3
 
 
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from logging import Logger, getLogger
-from typing import Optional
+from threading import Lock
+from typing import List, Optional
 
 import arrow
 from requests import Session
@@ -74,6 +77,17 @@ exchanges_mapping = {
 
 # Mappings used to go from country to bidding zone level
 
+FLOW_MAP_URL = "http://driftsdata.statnett.no/restapi/PhysicalFlowMap/GetFlow"
+
+# Flow map snapshots of the past don't change, so the ones fetched for a time
+# range are cached per minute. Snapshots of the last minutes aren't.
+FLOW_MAP_SAMPLES_PER_HOUR = 4
+MAX_FLOW_MAPS = FLOW_MAP_SAMPLES_PER_HOUR * 24 * 7
+MAX_PARALLEL_FLOW_MAP_REQUESTS = 8
+FLOW_MAP_FINAL_AFTER = timedelta(minutes=5)
+_flow_maps: "OrderedDict[int, list]" = OrderedDict()
+_flow_maps_lock = Lock()
+
 
 @refetch_frequency(timedelta(hours=1))
 def fetch_production(
@@ -159,24 +173,25 @@ def fetch_exchange_by_bidding_zone(
     target_datetime: Optional[datetime] = None,
     logger: Logger = getLogger(__name__),
 ) -> dict:
-    # Convert bidding zone names into statnett zones
-    bidding_zone_1_trimmed, bidding_zone_2_trimmed = [
-        x.split("-")[-1] for x in [bidding_zone1, bidding_zone2]
-    ]
-    bidding_zone_a, bidding_zone_b = sorted(
-        [bidding_zone_1_trimmed, bidding_zone_2_trimmed]
-    )
     r = session or Session()
     timestamp = (
         target_datetime.timestamp() if target_datetime else arrow.now().timestamp
     ) * 1000
-    url = (
-        "http://driftsdata.statnett.no/restapi/PhysicalFlowMap/GetFlow?Ticks=%d"
-        % timestamp
-    )
+    url = "%s?Ticks=%d" % (FLOW_MAP_URL, timestamp)
     response = r.get(url)
     obj = response.json()
 
+    return _exchange_from_flow_map(obj, bidding_zone1, bidding_zone2)
+
+
+def _exchange_from_flow_map(obj: list, bidding_zone1: str, bidding_zone2: str) -> dict:
+    # Convert bidding zone names into statnett zones
+    bidding_zone_1_trimmed, bidding_zone_2_trimmed = [
+        x.split("-")[-1] for x in [bidding_zone1, bidding_zone2]
+    ]
+    bidding_zone_a, bidding_zone_b = sorted(
+        [bidding_zone_1_trimmed, bidding_zone_2_trimmed]
+    )
     exchange = list(
         filter(
             lambda x: set([x["OutAreaElspotId"], x["InAreaElspotId"]])
@@ -195,6 +210,26 @@ def fetch_exchange_by_bidding_zone(
     }
 
 
+def _fetch_flow_map(session: Session, ticks: int) -> list:
+    """Returns the flow map snapshot at `ticks` (in ms), from the cache if it is
+    final."""
+    is_final = ticks < (arrow.utcnow() - FLOW_MAP_FINAL_AFTER).timestamp * 1000
+    if is_final:
+        with _flow_maps_lock:
+            if ticks in _flow_maps:
+                _flow_maps.move_to_end(ticks)
+                return _flow_maps[ticks]
+
+    response = session.get("%s?Ticks=%d" % (FLOW_MAP_URL, ticks))
+    obj = response.json()
+    if is_final:
+        with _flow_maps_lock:
+            _flow_maps[ticks] = obj
+            while len(_flow_maps) > MAX_FLOW_MAPS:
+                _flow_maps.popitem(last=False)
+    return obj
+
+
 def _fetch_exchanges_from_sorted_bidding_zones(
     sorted_bidding_zones,
     session: Optional[Session] = None,
@@ -235,6 +270,58 @@ def fetch_exchange(
     return data
 
 
+def fetch_exchange_range(
+    zone_key1: str,
+    zone_key2: str,
+    start: datetime,
+    end: datetime,
+    session: Optional[Session] = None,
+    logger: Logger = getLogger(__name__),
+) -> List[dict]:
+    """
+    Returns the hourly average exchange for the hours from `start` to `end`
+    (excluded). Each hour is averaged over FLOW_MAP_SAMPLES_PER_HOUR flow map
+    snapshots, which are fetched in parallel. Hours in the future are left out.
+    """
+    r = session or Session()
+    sorted_exchange = "->".join(sorted([zone_key1, zone_key2]))
+    bidding_zones = [e.split("->") for e in exchanges_mapping[sorted_exchange]]
+
+    now = arrow.utcnow()
+    step = timedelta(hours=1) / FLOW_MAP_SAMPLES_PER_HOUR
+    samples = []
+    sample = arrow.get(start).floor("hour")
+    while sample < arrow.get(end) and sample <= now:
+        samples.append(sample.timestamp * 1000)
+        sample = sample + step
+
+    with ThreadPoolExecutor(max_workers=MAX_PARALLEL_FLOW_MAP_REQUESTS) as executor:
+        flow_maps = list(executor.map(lambda t: _fetch_flow_map(r, t), samples))
+
+    hourly_flows = defaultdict(list)
+    for ticks, flow_map in zip(samples, flow_maps):
+        try:
+            net_flow = sum(
+                _exchange_from_flow_map(flow_map, *zones)["netFlow"]
+                for zones in bidding_zones
+            )
+        except (IndexError, KeyError):
+            logger.warning(f"No {sorted_exchange} flow in the flow map at {ticks}")
+            continue
+        hour = arrow.get(ticks / 1000).floor("hour").datetime
+        hourly_flows[hour].append(net_flow)
+
+    return [
+        {
+            "sortedZoneKeys": sorted_exchange,
+            "datetime": hour,
+            "netFlow": sum(flows) / len(flows),
+            "source": "driftsdata.stattnet.no",
+        }
+        for hour, flows in sorted(hourly_flows.items())
+    ]
+
+
 if __name__ == "__main__":
     """Main method, never used by the Electricity Map backend, but handy for testing."""
 
@@ -0,0 +1,175 @@
+import asyncio
+import json
+import os
+import unittest
+from datetime import datetime, timezone
+from unittest.mock import patch
+
+import pytest
+
+pytest.importorskip("aiohttp")
+
+from aiohttp import web
+
+from parsers import EIA, ENTSOE
+from parsers.lib import aio
+
+PRICE_XML = """<Publication_MarketDocument>
+<TimeSeries>
+<currency_Unit.name>EUR</currency_Unit.name>
+<Period>
+<timeInterval><start>2022-01-01T00:00Z</start><end>2022-01-01T02:00Z</end></timeInterval>
+<resolution>PT60M</resolution>
+<Point><position>1</position><price.amount>10.5</price.amount></Point>
+<Point><position>2</position><price.amount>12.0</price.amount></Point>
+</Period>
+</TimeSeries>
+</Publication_MarketDocument>"""
+
+
+class FakeAsyncSession:
+    def __init__(self, text: str):
+        self.text = text
+        self.requests = []
+
+    async def get(self, url, params=None, **kwargs):
+        self.requests.append((url, dict(params or {})))
+        return aio.AsyncResponse(url, 200, {}, self.text.encode(), "utf-8")
+
+
+class FakeEIASession:
+    def __init__(self, series: dict):
+        self.series = series
+        self.requests = []
+
+    async def get(self, url, params=None, **kwargs):
+        self.requests.append((url, dict(params or {})))
+        data = self.series.get(params["series_id"])
+        body = {"series": [{"data": data}]} if data else {"data": {}}
+        return aio.AsyncResponse(url, 200, {}, json.dumps(body).encode(), "utf-8")
+
+
+class TestAsyncSession(unittest.TestCase):
+    def test_get(self):
+        async def handler(request):
+            return web.json_response({"zone": request.query["zone"]})
+
+        async def fetch():
+            app = web.Application()
+            app.router.add_get("/data", handler)
+            runner = web.AppRunner(app)
+            await runner.setup()
+            site = web.TCPSite(runner, "127.0.0.1", 0)
+            await site.start()
+            port = site._server.sockets[0].getsockname()[1]
+            try:
+                async with aio.AsyncSession() as session:
+                    return await session.get(
+                        f"http://127.0.0.1:{port}/data", params={"zone": "DE"}
+                    )
+            finally:
+                await runner.cleanup()
+
+        response = asyncio.run(fetch())
+        self.assertTrue(response.ok)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"zone": "DE"})
+
+
+class TestRunParsers(unittest.TestCase):
+    def test_get_parser_functions(self):
+        function, async_function = aio.get_parser_functions("DE", "price")
+        self.assertIs(async_function, ENTSOE.fetch_price_async)
+        self.assertIsNotNone(function)
+
+    def test_async_and_sync_parsers(self):
+        calls = []
+
+        def fetch_production(zone_key, session, target_datetime, logger):
+            calls.append(("sync", zone_key, session))
+            return {"zoneKey": zone_key}
+
+        async def fetch_exchange_async(
+            zone_key1, zone_key2, session, target_datetime, logger
+        ):
+            calls.append(("async", zone_key1, zone_key2))
+            return [{"sortedZoneKeys": f"{zone_key1}->{zone_key2}"}]
+
+        def fail(zone_key, session, target_datetime, logger):
+            raise ValueError("boom")
+
+        functions = {
+            ("DE", "production"): (fetch_production, None),
+            ("DE->FR", "exchange"): (None, fetch_exchange_async),
+            ("FR", "production"): (fail, None),
+        }
+        with patch.object(
+            aio,
+            "get_parser_functions",
+            side_effect=lambda key, data_type: functions[(key, data_type)],
+        ):
+            runs = aio.run(list(functions), session=FakeAsyncSession(""))
+
+        self.assertEqual([run.key for run in runs], ["DE", "DE->FR", "FR"])
+        self.assertEqual(runs[0].result, {"zoneKey": "DE"})
+        self.assertEqual(runs[1].result, [{"sortedZoneKeys": "DE->FR"}])
+        self.assertIsInstance(runs[2].error, ValueError)
+        self.assertIn(("async", "DE", "FR"), calls)
+
+
+class TestENTSOEAsync(unittest.TestCase):
+    @patch.dict(os.environ, {"ENTSOE_TOKEN": "token"})
+    def test_fetch_price_async(self):
+        session = FakeAsyncSession(PRICE_XML)
+        data = asyncio.run(ENTSOE.fetch_price_async("DE", session=session))
+
+        self.assertEqual([d["price"] for d in data], [10.5, 12.0])
+        self.assertEqual(data[0]["currency"], "EUR")
+        self.assertEqual(session.requests[0][1]["documentType"], "A44")
+        self.assertEqual(session.requests[0][1]["securityToken"], "token")
+
+
+@patch.dict(os.environ, {"EIA_KEY": "key"})
+class TestEIAAsync(unittest.TestCase):
+    def test_fetch_exchange_async(self):
+        session = FakeEIASession({"EBA.MISO-IESO.ID.H": [["20220101T01Z", 250]]})
+        data = asyncio.run(
+            EIA.fetch_exchange_async(
+                "CA-ON",
+                "US-MIDW-MISO",
+                session=session,
+                target_datetime=datetime(2022, 1, 1, 2, tzinfo=timezone.utc),
+            )
+        )
+
+        self.assertEqual(len(data), 1)
+        self.assertEqual(data[0]["sortedZoneKeys"], "CA-ON->US-MIDW-MISO")
+        self.assertEqual(data[0]["netFlow"], -250)
+        url, params = session.requests[0]
+        self.assertEqual(url, EIA.SERIES_ENDPOINT)
+        self.assertEqual(params["api_key"], "key")
+        self.assertEqual(params["start"], "20211231T02Z")
+        self.assertEqual(params["end"], "20220101T02Z")
+
+    def test_fetch_production_mix_async(self):
+        session = FakeEIASession(
+            {
+                "EBA.MISO-ALL.NG.COL.H": [["20220101T01Z", 100]],
+                "EBA.MISO-ALL.NG.WAT.H": [["20220101T01Z", -10]],
+                "EBA.MISO-ALL.NG.WND.H": [["20220101T01Z", 50]],
+            }
+        )
+        data = asyncio.run(
+            EIA.fetch_production_mix_async("US-MIDW-MISO", session=session)
+        )
+
+        self.assertEqual(len(session.requests), len(EIA.TYPES))
+        self.assertTrue(all("num" in params for _, params in session.requests))
+        self.assertEqual(len(data), 1)
+        self.assertEqual(data[0]["production"]["coal"], 100)
+        self.assertEqual(data[0]["production"]["wind"], 50)
+        self.assertEqual(data[0]["storage"]["hydro"], -10)
+
+
+if __name__ == "__main__":
+    unittest.main()
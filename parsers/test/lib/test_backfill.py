@@ -0,0 +1,210 @@
+import json
+import tempfile
+import unittest
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import pytest
+from click.testing import CliRunner
+
+from parsers.lib import backfill
+from parsers.lib.config import refetch_frequency
+from parsers.lib.timeseries import TimeSeriesStore
+
+START = datetime(2022, 1, 1, tzinfo=timezone.utc)
+END = datetime(2022, 1, 5, tzinfo=timezone.utc)
+
+
+class FakeParser:
+    """Returns 25 hourly points ending at target_datetime, so windows overlap."""
+
+    def __init__(self, failing_targets=()):
+        self.failing_targets = set(failing_targets)
+        self.calls = []
+
+        @refetch_frequency(timedelta(days=1))
+        def fetch_production(zone_key, session=None, target_datetime=None, logger=None):
+            self.calls.append(target_datetime)
+            if target_datetime in self.failing_targets:
+                raise ValueError("upstream unavailable")
+            return [
+                {
+                    "zoneKey": zone_key,
+                    "datetime": target_datetime - timedelta(hours=h),
+                    "production": {"wind": float(h)},
+                }
+                for h in range(25)
+            ]
+
+        self.function = fetch_production
+
+
+class TestBackfill(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.output = Path(self.tmp_dir.name) / "DE.jsonl"
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def read_output(self):
+        with open(self.output) as f:
+            return [json.loads(line) for line in f]
+
+    def test_split_windows(self):
+        self.assertEqual(
+            backfill.split_windows(START, END, timedelta(days=1)),
+            [END - timedelta(days=d) for d in range(4)],
+        )
+
+    def test_backfill_dedupes_overlapping_windows(self):
+        parser = FakeParser()
+        stats = backfill.backfill(
+            "DE", "production", START, END, self.output, function=parser.function
+        )
+
+        events = self.read_output()
+        datetimes = [e["datetime"] for e in events]
+        self.assertEqual(len(parser.calls), 4)
+        self.assertEqual(stats["events"], 4 * 24 + 1)
+        self.assertEqual(len(datetimes), len(set(datetimes)))
+        self.assertEqual(min(datetimes), START.isoformat())
+        self.assertEqual(max(datetimes), END.isoformat())
+
+    def test_interrupted_backfill_resumes(self):
+        failing_target = END - timedelta(days=2)
+        parser = FakeParser(failing_targets=[failing_target])
+        stats = backfill.backfill(
+            "DE", "production", START, END, self.output, function=parser.function
+        )
+        self.assertEqual(stats["failed"], 1)
+
+        parser = FakeParser()
+        stats = backfill.backfill(
+            "DE", "production", START, END, self.output, function=parser.function
+        )
+        self.assertEqual(parser.calls, [failing_target])
+        self.assertEqual(stats["skipped"], 3)
+        datetimes = [e["datetime"] for e in self.read_output()]
+        self.assertEqual(len(datetimes), 4 * 24 + 1)
+        self.assertEqual(len(datetimes), len(set(datetimes)))
+
+    def test_invalid_windows_fail(self):
+        first, second = END - timedelta(days=1), END
+        paris = timezone(timedelta(hours=1))
+
+        @refetch_frequency(timedelta(days=1))
+        def fetch_production(zone_key, session=None, target_datetime=None, logger=None):
+            if target_datetime == first:
+                # The same instant as the first event of the next window
+                return [{"datetime": first.astimezone(paris), "production": {}}]
+            if target_datetime == second:
+                return [
+                    {"datetime": first.isoformat(), "production": {}},
+                    {"datetime": second.isoformat(), "production": {}},
+                ]
+            return [{"datetime": target_datetime.replace(tzinfo=None)}]
+
+        stats = backfill.backfill(
+            "DE", "production", START, END, self.output, function=fetch_production
+        )
+        self.assertEqual(stats["fetched"], 2)
+        self.assertEqual(stats["failed"], 2)
+        self.assertEqual(stats["events"], 2)
+        self.assertEqual(
+            sorted(e["datetime"] for e in self.read_output()),
+            [first.isoformat(), second.isoformat()],
+        )
+
+    def test_store_errors_fail_the_window(self):
+        store = TimeSeriesStore(Path(self.tmp_dir.name) / "store")
+        stats = backfill.backfill(
+            "DE",
+            "generationForecast",
+            START,
+            END,
+            self.output,
+            function=FakeParser().function,
+            store=store,
+        )
+        self.assertEqual(stats["failed"], 4)
+        self.assertEqual(stats["events"], 0)
+        self.assertFalse(self.output.read_text())
+
+    def test_store_rejects_unsupported_data_types(self):
+        result = CliRunner().invoke(
+            backfill.main,
+            ["DE", "generationForecast", "2022-01-01", "2022-01-02"]
+            + ["-o", str(self.output), "--store", self.tmp_dir.name],
+        )
+        self.assertEqual(result.exit_code, 2)
+        self.assertIn("--store", result.output)
+        self.assertFalse(self.output.exists())
+
+    def test_backfill_to_store(self):
+        store = TimeSeriesStore(Path(self.tmp_dir.name) / "store")
+        backfill.backfill(
+            "DE",
+            "production",
+            START,
+            END,
+            self.output,
+            function=FakeParser().function,
+            store=store,
+        )
+        block = store.read("DE", "production")
+        self.assertEqual(len(block), 4 * 24 + 1)
+        self.assertEqual(block.to_frame().index[0], START)
+
+    def test_backfill_to_parquet(self):
+        pytest.importorskip("pyarrow")
+        import pyarrow.dataset as ds
+
+        from parsers.lib.parquet import ParquetWriter
+
+        root = Path(self.tmp_dir.name) / "dataset"
+        writer = ParquetWriter(root)
+        backfill.backfill(
+            "DE",
+            "production",
+            START,
+            END,
+            self.output,
+            function=FakeParser().function,
+            parquet=writer,
+        )
+        # Checkpointed windows are in the dataset without closing the writer
+        dataset = ds.dataset(root, format="parquet", partitioning="hive")
+        self.assertEqual(dataset.count_rows(), 4 * 24 + 1)
+        # Windows are committed together, not one part file each
+        self.assertEqual(len(dataset.files), 1)
+        writer.close()
+
+    def test_backfill_to_parquet_commits_every_row_group(self):
+        pytest.importorskip("pyarrow")
+        import pyarrow.dataset as ds
+
+        from parsers.lib.parquet import ParquetWriter
+
+        root = Path(self.tmp_dir.name) / "dataset"
+        with ParquetWriter(root, row_group_size=40) as writer:
+            stats = backfill.backfill(
+                "DE",
+                "production",
+                START,
+                END,
+                self.output,
+                workers=1,
+                function=FakeParser().function,
+                parquet=writer,
+            )
+            self.assertEqual(writer.pending_rows, 0)
+        dataset = ds.dataset(root, format="parquet", partitioning="hive")
+        self.assertEqual(dataset.count_rows(), 4 * 24 + 1)
+        # 25, 24, 24 and 24 rows: committed after the 2nd and the 4th window
+        self.assertEqual(len(dataset.files), 2)
+        self.assertEqual(stats["fetched"], 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+from requests import Session
+
+from electricitymap.contrib.parsers.lib import validation
+from parsers.lib import benchmark, cassette
+
+URL = "https://example.com/production"
+
+
+def fetch_production(zone_key, session=None, target_datetime=None, logger=None):
+    values = (session or Session()).get(URL).json()
+    data = {
+        "zoneKey": zone_key,
+        "datetime": target_datetime,
+        "production": values,
+        "source": "example.com",
+    }
+    return validation.validate(data, logger, required=["gas"])
+
+
+class TestBenchmark(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "DE_production.json.gz")
+
+        recorded = cassette.Cassette(
+            {
+                "zone": "DE",
+                "data_type": "production",
+                "target_datetime": "2022-01-01T00:00:00+00:00",
+            }
+        )
+        recorded.add_response(URL, json.dumps({"gas": 100.0, "coal": 50.0}))
+        recorded.save(self.path)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_phase_timer_is_exclusive(self):
+        timer = benchmark.PhaseTimer()
+        with timer.phase("transform"):
+            with timer.phase("network"):
+                time.sleep(0.05)
+        self.assertGreaterEqual(timer.totals["network"], 0.05)
+        self.assertLess(timer.totals["transform"], 0.05)
+
+    def test_validate_is_timed(self):
+        # Parsers configured in CONFIG_MODEL are imported as
+        # electricitymap.contrib.parsers.*, like `validation` here
+        timer = benchmark.PhaseTimer()
+        with benchmark.timing_phases(timer):
+            validation.validate({"production": {"gas": 1.0}}, None)
+        self.assertGreater(timer.totals["validate"], 0)
+
+    def test_clear_memory_caches(self):
+        from electricitymap.contrib.parsers import OPENNEM as contrib_OPENNEM
+        from parsers import BR, OPENNEM
+
+        BR._snapshot = (0.0, {})
+        for module in (OPENNEM, contrib_OPENNEM):
+            module._documents["url"] = (0.0, [])
+        benchmark.clear_memory_caches()
+        self.assertIsNone(BR._snapshot)
+        self.assertFalse(OPENNEM._documents)
+        self.assertFalse(contrib_OPENNEM._documents)
+
+    @patch.object(benchmark, "clear_memory_caches")
+    @patch.object(benchmark, "get_parser_function", return_value=fetch_production)
+    def test_benchmark(self, _, clear_memory_caches):
+        result = benchmark.benchmark(self.path, repeat=2)
+
+        # Before the warm-up, the timed runs and the tracemalloc run
+        self.assertEqual(clear_memory_caches.call_count, 4)
+
+        self.assertEqual(result["zone"], "DE")
+        self.assertEqual(result["events"], 1)
+        self.assertEqual(result["validation_failures"], 0)
+        self.assertEqual(set(result["seconds"]), set(benchmark.PHASES) | {"total"})
+        self.assertGreater(result["seconds"]["network"], 0)
+        self.assertGreater(result["seconds"]["parse"], 0)
+        self.assertGreater(result["allocated_peak_bytes"], 0)
+
+    def test_compare(self):
+        results = [{"cassette": "a", "seconds": {"total": 2.0}}]
+        baseline = [{"cassette": "a", "seconds": {"total": 1.0}}]
+        self.assertEqual(benchmark.compare(results, baseline), {"a": 2.0})
+
+
+if __name__ == "__main__":
+    unittest.main()
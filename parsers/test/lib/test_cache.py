@@ -0,0 +1,114 @@
+import os
+import tempfile
+import threading
+import unittest
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from requests import Session
+
+from parsers.lib import cache
+
+
+class CountingHandler(BaseHTTPRequestHandler):
+    calls = 0
+
+    def do_GET(self):
+        CountingHandler.calls += 1
+        body = f"document {self.path}".encode()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestDiskCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_get_set(self):
+        disk_cache = cache.DiskCache(self.tmp.name)
+        self.assertIsNone(disk_cache.get("GET a"))
+        disk_cache.set("GET a", {"status_code": 200}, b"content")
+        self.assertEqual(disk_cache.get("GET a"), ({"status_code": 200}, b"content"))
+
+    def test_evicts_least_recently_used(self):
+        disk_cache = cache.DiskCache(self.tmp.name, max_bytes=10**6)
+        for i in range(3):
+            disk_cache.set(f"GET {i}", {}, os.urandom(1000))
+            os.utime(disk_cache._path(f"GET {i}"), (i, i))
+        # Reading an entry makes it the most recently used one
+        disk_cache.get("GET 0")
+        disk_cache.max_bytes = 2500
+        disk_cache.evict()
+
+        self.assertIsNotNone(disk_cache.get("GET 0"))
+        self.assertIsNone(disk_cache.get("GET 1"))
+        self.assertIsNotNone(disk_cache.get("GET 2"))
+
+
+class TestCachedSession(unittest.TestCase):
+    def setUp(self):
+        CountingHandler.calls = 0
+        self.server = HTTPServer(("127.0.0.1", 0), CountingHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_port}/data"
+        self.tmp = tempfile.TemporaryDirectory()
+        self.session = cache.cached_session(cache.DiskCache(self.tmp.name))
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmp.cleanup()
+
+    def test_leaves_the_given_session_as_is(self):
+        session = Session()
+        session.headers["User-Agent"] = "parser"
+        session.cookies.set("id", "1")
+        session.auth = ("user", "password")
+        adapters = dict(session.adapters)
+
+        cached = cache.cached_session(cache.DiskCache(self.tmp.name), session)
+        cached.headers["X-Backfill"] = "1"
+        cached.cookies.set("other", "2")
+
+        self.assertIsNot(cached, session)
+        self.assertIsInstance(cached.get_adapter(self.url), cache.CachingAdapter)
+        self.assertEqual(session.adapters, adapters)
+        self.assertEqual(cached.headers["User-Agent"], "parser")
+        self.assertNotIn("X-Backfill", session.headers)
+        self.assertEqual(dict(session.cookies), {"id": "1"})
+        self.assertEqual(cached.auth, ("user", "password"))
+
+    def test_only_caches_immutable_periods(self):
+        past = datetime.now(timezone.utc) - timedelta(days=30)
+        recent = datetime.now(timezone.utc) - timedelta(hours=1)
+
+        # Requests that aren't marked are never cached
+        self.session.get(self.url)
+        self.session.get(self.url)
+        with cache.immutable(recent):
+            self.session.get(self.url)
+            self.session.get(self.url)
+        self.assertEqual(CountingHandler.calls, 4)
+
+        with cache.immutable(past):
+            first = self.session.get(self.url, params={"token": "a"})
+            second = self.session.get(self.url, params={"token": "b"})
+            with cache.uncached():
+                self.session.get(self.url, params={"token": "a"})
+        self.assertEqual(CountingHandler.calls, 6)
+        self.assertEqual(first.text, second.text)
+        self.assertEqual(
+            list(second.iter_content(8)), [b"document", b" /data?t", b"oken=a"]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+import unittest
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from electricitymap.contrib.config import ZONES_CONFIG
+from parsers.lib import capacity
+
+
+class TestCapacity(unittest.TestCase):
+    def setUp(self):
+        self.calls = 0
+
+        @capacity.source("TEST", "solar")
+        def get_solar_capacities(session, logger):
+            self.calls += 1
+            return pd.Series({"2020-01-01": 10, "2021-01-01": 20, "2022-01-01": None})
+
+        @capacity.source("CH", "wind")
+        def get_wind_capacities(session, logger):
+            raise ValueError("unavailable")
+
+    def tearDown(self):
+        del capacity._sources[("TEST", "solar")]
+        del capacity._sources[("CH", "wind")]
+        capacity.clear()
+
+    def test_capacity_at(self):
+        datetimes = [
+            datetime(2019, 6, 1, tzinfo=timezone.utc),
+            datetime(2020, 1, 1, tzinfo=timezone.utc),
+            datetime(2020, 12, 31, 23, 30, tzinfo=timezone.utc),
+            datetime(2022, 6, 1, tzinfo=timezone.utc),
+        ]
+        np.testing.assert_array_equal(
+            capacity.capacity_at("TEST", "solar", datetimes), [10, 10, 10, 20]
+        )
+        capacity.capacity_at("TEST", "solar", datetimes)
+        self.assertEqual(self.calls, 1)
+
+    def test_static_capacities(self):
+        now = [datetime.now(timezone.utc)]
+        self.assertEqual(
+            capacity.capacity_at("CH", "wind", now)[0],
+            ZONES_CONFIG["CH"]["capacity"]["wind"],
+        )
+        self.assertEqual(
+            capacity.capacity_at("CH", "nuclear", now)[0],
+            ZONES_CONFIG["CH"]["capacity"]["nuclear"],
+        )
+        self.assertTrue(np.isnan(capacity.capacity_at("TEST", "wind", now)[0]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+import json
+import os
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from requests import PreparedRequest, Response, Session
+
+from parsers.lib import cassette
+
+
+class CountingHandler(BaseHTTPRequestHandler):
+    calls = 0
+
+    def do_GET(self):
+        CountingHandler.calls += 1
+        body = f"call {CountingHandler.calls} {self.path}".encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestCassette(unittest.TestCase):
+    def setUp(self):
+        CountingHandler.calls = 0
+        self.server = HTTPServer(("127.0.0.1", 0), CountingHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_port}/data"
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "run.json.gz")
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmp.cleanup()
+
+    def test_record_and_replay(self):
+        with cassette.recording(self.path, meta={"zone": "DE"}):
+            first = Session().get(self.url, params={"token": "secret", "a": "1"})
+            second = Session().get(self.url, params={"a": "1", "token": "secret"})
+        self.assertEqual(CountingHandler.calls, 2)
+
+        with cassette.replaying(self.path) as played:
+            # Tokens are redacted: a different token still matches.
+            replayed = [
+                Session().get(self.url, params={"a": "1", "token": "other"})
+                for _ in range(3)
+            ]
+        self.assertEqual(CountingHandler.calls, 2)
+        self.assertEqual(played.meta, {"zone": "DE"})
+        self.assertEqual(replayed[0].text, first.text)
+        self.assertEqual(replayed[1].text, second.text)
+        # The last response is repeated once the recorded ones are used up.
+        self.assertEqual(replayed[2].text, second.text)
+        self.assertNotIn("secret", str(played.interactions))
+
+    def test_redact_body(self):
+        self.assertEqual(
+            cassette.redact_body(b"user=me&password=hunter2"),
+            b"user=me&password=REDACTED",
+        )
+        self.assertEqual(
+            json.loads(cassette.redact_body(b'{"auth": {"apiKey": "k"}, "a": [1]}')),
+            {"auth": "REDACTED", "a": [1]},
+        )
+        for body in [b"user=me", b'{"user": "me"}', b"plain text", b"\xff\x00"]:
+            self.assertIs(cassette.redact_body(body), body)
+
+    def test_body_fields_are_redacted(self):
+        def post(password):
+            request = PreparedRequest()
+            request.prepare(
+                method="POST", url=self.url, data={"user": "me", "password": password}
+            )
+            return request
+
+        response = Response()
+        response.status_code = 200
+        response._content = b"ok"
+        recorded = cassette.Cassette()
+        recorded.record(post("hunter2"), response)
+
+        self.assertNotIn("hunter2", str(recorded.interactions))
+        self.assertEqual(recorded.play(post("other")).content, b"ok")
+
+    def test_replay_miss(self):
+        with cassette.recording(self.path):
+            Session().get(self.url)
+        with cassette.replaying(self.path):
+            with self.assertRaises(cassette.CassetteMiss):
+                Session().get(self.url + "/other")
+
+    def test_restores_transport(self):
+        with cassette.recording(self.path):
+            with self.assertRaises(RuntimeError):
+                with cassette.recording(self.path + ".nested"):
+                    pass
+        Session().get(self.url)
+        self.assertEqual(CountingHandler.calls, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,129 @@
+import threading
+import unittest
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from parsers.lib import composite
+
+DATETIME = datetime(2022, 1, 1, tzinfo=timezone.utc)
+calls = Counter()
+
+
+def fetch_consumption(zone_key, session=None, target_datetime=None, logger=None):
+    calls["consumption", zone_key] += 1
+    return [{"zoneKey": zone_key, "datetime": DATETIME, "consumption": 100}]
+
+
+def fetch_production(zone_key, session=None, target_datetime=None, logger=None):
+    calls["production", zone_key] += 1
+    return [{"zoneKey": zone_key, "datetime": DATETIME, "production": {"solar": 10}}]
+
+
+def fetch_exchange(
+    zone_key1, zone_key2, session=None, target_datetime=None, logger=None
+):
+    calls["exchange", zone_key1, zone_key2] += 1
+    return [
+        {
+            "sortedZoneKeys": f"{zone_key1}->{zone_key2}",
+            "datetime": DATETIME,
+            "netFlow": 30,
+        }
+    ]
+
+
+A = composite.Composite(
+    zone_key="A",
+    consumption=fetch_consumption,
+    production=fetch_production,
+    exchanges={"B": fetch_exchange, "0": fetch_exchange},
+)
+B = composite.Composite(
+    zone_key="B",
+    consumption=fetch_consumption,
+    production=fetch_production,
+    exchanges={"A": fetch_exchange},
+)
+
+
+class CountingHandler(BaseHTTPRequestHandler):
+    calls = 0
+
+    def do_GET(self):
+        CountingHandler.calls += 1
+        body = b"document"
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestSeriesStore(unittest.TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_series_are_fetched_once_per_cycle(self):
+        store = composite.SeriesStore()
+        first = store.series(fetch_consumption, ("A",), target_datetime=DATETIME)
+        first[0]["consumption"] = 0
+        second = store.series(fetch_consumption, ("A",), target_datetime=DATETIME)
+
+        self.assertEqual(calls["consumption", "A"], 1)
+        self.assertEqual(second[0]["consumption"], 100)
+
+        store.series(fetch_consumption, ("A",), target_datetime=None)
+        self.assertEqual(calls["consumption", "A"], 2)
+
+    def test_series_expire(self):
+        store = composite.SeriesStore(max_age=timedelta(0))
+        store.series(fetch_consumption, ("A",))
+        store.series(fetch_consumption, ("A",))
+        self.assertEqual(calls["consumption", "A"], 2)
+
+    def test_composites_share_inputs(self):
+        with composite.cycle():
+            inputs = composite.fetch_inputs(A, target_datetime=DATETIME)
+            composite.fetch_inputs(B, target_datetime=DATETIME)
+
+        self.assertEqual(calls["exchange", "A", "B"], 1)
+        self.assertEqual(calls["exchange", "0", "A"], 1)
+        # Exports to B, imports from 0
+        self.assertEqual(inputs.net_imports(), {DATETIME: 0})
+        self.assertEqual(inputs.consumption[0]["consumption"], 100)
+
+    def test_inputs_without_cycle(self):
+        composite.fetch_inputs(A, target_datetime=DATETIME)
+        composite.fetch_inputs(A, target_datetime=DATETIME)
+        self.assertEqual(calls["production", "A"], 2)
+
+
+class TestCycleSession(unittest.TestCase):
+    def setUp(self):
+        CountingHandler.calls = 0
+        self.server = HTTPServer(("127.0.0.1", 0), CountingHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_port}/data"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_documents_are_shared_within_a_cycle(self):
+        session = composite.cycle_session(composite.SeriesStore())
+        first = session.get(self.url, params={"token": "a"})
+        second = session.get(self.url, params={"token": "b"})
+        self.assertEqual(CountingHandler.calls, 1)
+        self.assertEqual(first.text, second.text)
+
+        expired = composite.cycle_session(composite.SeriesStore(timedelta(0)))
+        expired.get(self.url)
+        expired.get(self.url)
+        self.assertEqual(CountingHandler.calls, 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
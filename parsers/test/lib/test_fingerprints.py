@@ -0,0 +1,73 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta, timezone
+
+from parsers.lib import incremental
+from parsers.lib.fingerprints import FingerprintStore
+
+NOW = datetime(2022, 1, 2, tzinfo=timezone.utc)
+
+
+def event(hour, value, source="entsoe.eu"):
+    return {
+        "zoneKey": "DE",
+        "datetime": NOW + timedelta(hours=hour),
+        "production": {"wind": value, "solar": None},
+        "source": source,
+    }
+
+
+class TestFingerprintStore(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "fingerprints.bin")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_classify(self):
+        hashes = FingerprintStore(self.path, capacity=16)
+        diff = incremental.classify(
+            hashes, "DE", "production", [event(0, 10), event(1, 20)]
+        )
+        self.assertEqual((diff.new, diff.revised, diff.unchanged), (2, 0, 0))
+
+        events = [event(0, 10, source="other"), event(1, 25), event(2, 30)]
+        diff = incremental.classify(hashes, "DE", "production", events)
+        self.assertEqual((diff.new, diff.revised, diff.unchanged), (1, 1, 1))
+        self.assertEqual(diff.events, events[1:])
+        self.assertEqual(
+            hashes.stats[("DE", "production")],
+            {"new": 3, "revised": 1, "unchanged": 1},
+        )
+
+    def test_persistence_and_growth(self):
+        hashes = FingerprintStore(self.path, capacity=16)
+        events = [event(hour, hour) for hour in range(100)]
+        incremental.trim(hashes, "DE", "production", events)
+        self.assertEqual(len(hashes), 100)
+        self.assertGreaterEqual(hashes.capacity, 100 / 0.7)
+        hashes.flush()
+
+        reopened = FingerprintStore(self.path)
+        self.assertEqual(
+            reopened.known_up_to("DE", "production"), NOW + timedelta(hours=99)
+        )
+        self.assertEqual(incremental.trim(reopened, "DE", "production", events), [])
+        self.assertIsNone(reopened.known_up_to("FR", "production"))
+
+    def test_retention(self):
+        hashes = FingerprintStore(self.path, retention=timedelta(hours=10), capacity=16)
+        incremental.trim(
+            hashes, "DE", "production", [event(hour, 1) for hour in range(60)]
+        )
+        # Old points are dropped when the table grows
+        self.assertLess(len(hashes), 30)
+        self.assertEqual(
+            len(incremental.trim(hashes, "DE", "production", [event(0, 1)])), 1
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,143 @@
+import tempfile
+import unittest
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("scipy")
+
+from parsers.lib import flowtracing
+from parsers.lib.timeseries import TimeSeriesStore
+
+START = datetime(2022, 1, 1, tzinfo=timezone.utc)
+COAL = flowtracing.MODES.index("coal")
+WIND = flowtracing.MODES.index("wind")
+NUCLEAR = flowtracing.MODES.index("nuclear")
+
+
+def frame(rows):
+    index = pd.DatetimeIndex(
+        [START + timedelta(hours=h) for h in range(len(rows))], name="datetime"
+    )
+    return pd.DataFrame(rows, index=index)
+
+
+class TestFlowTracing(unittest.TestCase):
+    def setUp(self):
+        # A (coal) exports to B (wind), which exports to C (nuclear). C has no
+        # data in the second hour.
+        datetimes = pd.date_range(START, periods=2, freq=flowtracing.HOUR)
+        self.inputs = flowtracing.build_inputs(
+            datetimes,
+            productions={
+                "A": frame([{"production.coal": 100.0}] * 2),
+                "B": frame([{"production.wind": 100.0}] * 2),
+                "C": frame(
+                    [{"production.nuclear": 50.0}, {"production.nuclear": None}]
+                ),
+            },
+            exchanges={
+                "A->B": frame([{"netFlow": 50.0}] * 2),
+                "B->C": frame([{"netFlow": 50.0}] * 2),
+                "C->D": frame([{"netFlow": 10.0}] * 2),
+            },
+        )
+        self.factors = np.zeros((3, len(flowtracing.MODES)))
+        self.factors[0, COAL] = 1000
+
+    def test_build_inputs(self):
+        self.assertEqual(self.inputs.zones, ["A", "B", "C"])
+        self.assertEqual(self.inputs.links, [(0, 1), (1, 2)])
+        self.assertTrue(np.isnan(self.inputs.production[1, 2]).all())
+
+    def test_solve(self):
+        result = flowtracing.solve(self.inputs, self.factors, origin=True)
+
+        np.testing.assert_allclose(result.production[0], [1000, 0, 0])
+        np.testing.assert_allclose(result.consumption[0], [1000, 1000 / 3, 1000 / 6])
+        np.testing.assert_allclose(
+            result.mix[0, 2, [COAL, WIND, NUCLEAR]], [1 / 6, 1 / 3, 1 / 2]
+        )
+        np.testing.assert_allclose(result.mix[0].sum(axis=1), 1)
+        np.testing.assert_allclose(result.origin[0, 2], [1 / 6, 1 / 3, 1 / 2])
+
+        # Without C, its import from B is left out
+        np.testing.assert_allclose(result.consumption[1, :2], [1000, 1000 / 3])
+        self.assertTrue(np.isnan(result.consumption[1, 2]))
+        self.assertTrue(np.isnan(result.production[1, 2]))
+        self.assertEqual(result.to_frame().loc[START, "B"], result.consumption[0, 1])
+
+    def test_missing_exchange(self):
+        # A->B is missing in the first hour: A and B are undefined, and so is C,
+        # which imports from B
+        flows = self.inputs.flows.copy()
+        flows[0, 0] = np.nan
+        result = flowtracing.solve(
+            self.inputs._replace(flows=flows), self.factors, origin=True
+        )
+
+        self.assertTrue(np.isnan(result.consumption[0]).all())
+        self.assertTrue(np.isnan(result.mix[0]).all())
+        self.assertTrue(np.isnan(result.origin[0]).all())
+        np.testing.assert_allclose(result.production[0], [1000, 0, 0])
+        np.testing.assert_allclose(result.consumption[1, :2], [1000, 1000 / 3])
+
+    def test_storage_discharge(self):
+        datetimes = pd.date_range(START, periods=1, freq=flowtracing.HOUR)
+        inputs = flowtracing.build_inputs(
+            datetimes,
+            {"A": frame([{"production.wind": 100.0, "storage.hydro": -100.0}])},
+            {},
+        )
+        factors = np.zeros((1, len(flowtracing.MODES)))
+        factors[0, flowtracing.MODES.index("hydro discharge")] = 300
+        np.testing.assert_allclose(
+            flowtracing.solve(inputs, factors).consumption, [[150]]
+        )
+
+    def test_load_inputs(self):
+        with tempfile.TemporaryDirectory() as directory:
+            store = TimeSeriesStore(directory)
+            for zone, mode in [("DE", "coal"), ("FR", "nuclear")]:
+                store.append(
+                    zone,
+                    "production",
+                    [
+                        {
+                            "datetime": START + timedelta(minutes=m),
+                            "production": {mode: 100},
+                        }
+                        for m in range(0, 120, 15)
+                    ],
+                )
+            store.append(
+                "DE->FR",
+                "exchange",
+                [{"datetime": START + timedelta(hours=1), "netFlow": -20.0}],
+            )
+            inputs = flowtracing.load_inputs(
+                store, ["DE", "FR"], START, START + timedelta(hours=2)
+            )
+
+        self.assertEqual(len(inputs.datetimes), 2)
+        self.assertEqual(inputs.links, [(0, 1)])
+        np.testing.assert_array_equal(inputs.flows[:, 0], [np.nan, -20])
+        result = flowtracing.solve(inputs, flowtracing.get_factors(inputs.zones))
+        # The exchange is missing in the first hour
+        self.assertTrue(np.isnan(result.consumption[0]).all())
+        self.assertFalse(np.isnan(result.production[0]).any())
+        # DE imports nuclear power from FR in the second hour
+        self.assertLess(result.consumption[1, 0], result.production[1, 0])
+
+    def test_get_factors(self):
+        lifecycle = flowtracing.get_factors(["DE"])
+        direct = flowtracing.get_factors(["DE"], lifecycle=False)
+        self.assertEqual(lifecycle.shape, (1, len(flowtracing.MODES)))
+        self.assertEqual(direct[0, WIND], 0)
+        self.assertGreater(lifecycle[0, WIND], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
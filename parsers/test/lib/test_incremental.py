@@ -0,0 +1,171 @@
+import os
+import unittest
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+
+import arrow
+
+from parsers import ENTSOE
+from parsers.lib import incremental
+from parsers.lib.scheduler import ScheduledTask, Scheduler
+
+NOW = datetime(2022, 1, 2, tzinfo=timezone.utc)
+
+
+def event(hour, value):
+    return {
+        "zoneKey": "DE",
+        "datetime": NOW + timedelta(hours=hour),
+        "production": {"wind": value},
+        "source": "entsoe.eu",
+    }
+
+
+class TestTrim(unittest.TestCase):
+    def setUp(self):
+        self.hashes = incremental.PointHashes()
+
+    def test_only_new_and_changed_points(self):
+        first = [event(0, 10), event(1, 20)]
+        self.assertEqual(
+            incremental.trim(self.hashes, "DE", "production", first), first
+        )
+
+        second = [event(0, 10), event(1, 25), event(2, 30)]
+        self.assertEqual(
+            incremental.trim(self.hashes, "DE", "production", second), second[1:]
+        )
+        self.assertEqual(
+            self.hashes.known_up_to("DE", "production"), NOW + timedelta(hours=2)
+        )
+        # Keys and data types are separate
+        self.assertEqual(
+            len(incremental.trim(self.hashes, "FR", "production", second)), 3
+        )
+
+    def test_single_event(self):
+        consumption = {"zoneKey": "DE", "datetime": NOW, "consumption": 1.0}
+        self.assertIs(
+            incremental.trim(self.hashes, "DE", "consumption", consumption),
+            consumption,
+        )
+        self.assertIsNone(
+            incremental.trim(self.hashes, "DE", "consumption", dict(consumption))
+        )
+
+    def test_retention(self):
+        hashes = incremental.PointHashes(retention=timedelta(hours=1))
+        incremental.trim(hashes, "DE", "production", [event(0, 10), event(2, 10)])
+        self.assertIsNone(hashes.get("DE", "production", arrow.get(NOW).timestamp))
+
+    def test_pruning(self):
+        hashes = incremental.PointHashes(retention=timedelta(hours=1))
+        for hour in range(5000):
+            hashes.set("DE", "production", hour * 3600, hour)
+        self.assertLess(len(hashes._hashes[("DE", "production")]), 2048)
+        self.assertIsNone(hashes.get("DE", "production", 4997 * 3600))
+        self.assertEqual(hashes.get("DE", "production", 4998 * 3600), 4998)
+        self.assertEqual(
+            hashes.known_up_to("DE", "production"),
+            datetime.fromtimestamp(4999 * 3600, timezone.utc),
+        )
+
+    def test_forecasts_have_no_watermark(self):
+        incremental.trim(self.hashes, "DE", "generationForecast", [event(0, 10)])
+        self.assertIsNone(self.hashes.known_up_to("DE", "generationForecast"))
+
+
+class TestWatermark(unittest.TestCase):
+    def test_get_start(self):
+        default = NOW - timedelta(hours=48)
+        self.assertEqual(incremental.get_start(default), default)
+        with incremental.watermark(NOW):
+            self.assertEqual(incremental.get_start(default), NOW - timedelta(hours=6))
+            with incremental.unbounded():
+                self.assertEqual(incremental.get_start(default), default)
+
+    @patch.dict(os.environ, {"ENTSOE_TOKEN": "token"})
+    def test_entsoe_period(self):
+        with incremental.watermark(arrow.utcnow().shift(hours=-1).datetime):
+            narrowed = ENTSOE._add_ENTSOE_query_params({})
+            historical = ENTSOE._add_ENTSOE_query_params({}, NOW)
+        full = ENTSOE._add_ENTSOE_query_params({})
+
+        self.assertEqual(
+            arrow.get(full["periodEnd"], "YYYYMMDDHHmm")
+            - arrow.get(narrowed["periodStart"], "YYYYMMDDHHmm"),
+            timedelta(hours=24 + 7),
+        )
+        self.assertEqual(
+            arrow.get(full["periodEnd"], "YYYYMMDDHHmm")
+            - arrow.get(full["periodStart"], "YYYYMMDDHHmm"),
+            timedelta(hours=72),
+        )
+        self.assertEqual(historical["periodStart"], "202112310000")
+
+
+class TestIncrementalScheduler(unittest.TestCase):
+    def test_results_are_trimmed(self):
+        runs = [[event(0, 10), event(1, 20)], [event(0, 10), event(1, 20), event(2, 5)]]
+        watermarks = []
+
+        def fetch_production(zone_key, session=None, target_datetime=None, logger=None):
+            watermarks.append(incremental.get_start(NOW - timedelta(days=2)))
+            return runs.pop(0)
+
+        task = ScheduledTask(
+            key="DE",
+            data_type="production",
+            function_name="ENTSOE.fetch_production",
+            function=fetch_production,
+            interval=timedelta(minutes=5),
+            host="example.com",
+            group="DE",
+        )
+        results = []
+        runner = Scheduler(
+            [task],
+            lambda task, result: results.append(result),
+            hashes=incremental.PointHashes(),
+        )
+        runner._run_group("DE")
+        runner._run_group("DE")
+
+        self.assertEqual([len(result) for result in results], [2, 1])
+        self.assertEqual(
+            watermarks, [NOW - timedelta(days=2), NOW - timedelta(hours=5)]
+        )
+
+    def test_unhandled_results_are_emitted_again(self):
+        def fetch_production(zone_key, session=None, target_datetime=None, logger=None):
+            return [event(0, 10), event(1, 20)]
+
+        task = ScheduledTask(
+            key="DE",
+            data_type="production",
+            function_name="ENTSOE.fetch_production",
+            function=fetch_production,
+            interval=timedelta(minutes=5),
+            host="example.com",
+            group="DE",
+        )
+        results = []
+
+        def on_result(task, result):
+            results.append(result)
+            if len(results) == 1:
+                raise OSError("disk full")
+
+        hashes = incremental.PointHashes()
+        runner = Scheduler([task], on_result, hashes=hashes)
+        with self.assertRaises(OSError):
+            runner._run_group("DE")
+        self.assertIsNone(hashes.known_up_to("DE", "production"))
+        runner._run_group("DE")
+        runner._run_group("DE")
+
+        self.assertEqual([len(result) for result in results], [2, 2, 0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,187 @@
+import json
+import os
+import tempfile
+import threading
+import unittest
+from collections import defaultdict
+from contextlib import ExitStack, contextmanager
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from unittest.mock import patch
+
+from requests import Response, Session
+from requests.adapters import HTTPAdapter
+
+from parsers.lib import cassette, instrumentation
+from parsers.lib.config import refetch_frequency
+
+
+class JsonHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = b'{"value": 1}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestInstrumentation(unittest.TestCase):
+    def setUp(self):
+        self.server = HTTPServer(("127.0.0.1", 0), JsonHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.host = f"127.0.0.1:{self.server.server_port}"
+        self.sink = instrumentation.add_sink(instrumentation.CounterSink())
+
+    def tearDown(self):
+        instrumentation.remove_sink(self.sink)
+        self.server.shutdown()
+        self.server.server_close()
+
+    def fetch_production(self):
+        url = f"http://{self.host}/data"
+
+        @instrumentation.instrumented()
+        @refetch_frequency(timedelta(days=1))
+        def fetch_production(zone_key, session=None, target_datetime=None, logger=None):
+            session = Session()
+            return [session.get(url).json(), session.get(url).json()]
+
+        return fetch_production
+
+    def test_records_calls(self):
+        fetch_production = self.fetch_production()
+        self.assertEqual(fetch_production.REFETCH_FREQUENCY, timedelta(days=1))
+
+        fetch_production("DE")
+        fetch_production("DE")
+
+        counters = self.sink.calls[
+            ("test_instrumentation.fetch_production", "DE", "production")
+        ]
+        self.assertEqual(counters["calls"], 2)
+        self.assertEqual(counters["events"], 4)
+        self.assertGreater(counters["parse_seconds"], 0)
+        self.assertEqual(counters["http"][self.host][:2], [4, 4 * len('{"value": 1}')])
+
+    def test_exchange_keys_and_exceptions(self):
+        @instrumentation.instrumented()
+        def fetch_exchange(zone_key1, zone_key2, session=None):
+            raise ValueError("no data")
+
+        with self.assertRaises(ValueError):
+            fetch_exchange("FR", "DE")
+        counters = self.sink.calls[
+            ("test_instrumentation.fetch_exchange", "DE->FR", "exchange")
+        ]
+        self.assertEqual(dict(counters["exceptions"]), {"ValueError": 1})
+
+    def test_instrument_is_idempotent(self):
+        fetch_production = self.fetch_production()
+        self.assertIs(
+            instrumentation.instrument(fetch_production, "production"),
+            fetch_production,
+        )
+
+    def test_sinks(self):
+        prometheus = instrumentation.add_sink(instrumentation.PrometheusSink())
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "calls.jsonl")
+            jsonl = instrumentation.add_sink(instrumentation.JsonLinesSink(path))
+            try:
+                self.fetch_production()("DE")
+            finally:
+                instrumentation.remove_sink(prometheus)
+                instrumentation.remove_sink(jsonl)
+            with open(path) as f:
+                records = [json.loads(line) for line in f]
+
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0]["http"][self.host]["requests"], 2)
+        text = prometheus.render()
+        self.assertIn(
+            'parser_calls_total{function="test_instrumentation.fetch_production",'
+            'key="DE",data_type="production"} 1',
+            text,
+        )
+        self.assertIn(f'host="{self.host}"}} 2', text)
+
+    def test_sinks_from_env(self):
+        sinks = instrumentation.sinks_from_env("counters, jsonl:/tmp/x.jsonl")
+        self.assertIsInstance(sinks[0], instrumentation.CounterSink)
+        self.assertIsInstance(sinks[1], instrumentation.JsonLinesSink)
+        with self.assertRaises(ValueError):
+            instrumentation.sinks_from_env("statsd")
+
+    def test_hooks_are_only_installed_during_calls(self):
+        send, json_ = HTTPAdapter.send, Response.json
+        hooked = []
+
+        @instrumentation.instrumented()
+        def fetch_production(zone_key, session=None, target_datetime=None, logger=None):
+            hooked.append((HTTPAdapter.send is not send, Response.json is not json_))
+            return []
+
+        fetch_production("DE")
+        self.assertEqual(hooked, [(True, True)])
+        self.assertIs(HTTPAdapter.send, send)
+        self.assertIs(Response.json, json_)
+
+
+class PhaseCounter:
+    def __init__(self):
+        self.phases = defaultdict(int)
+
+    @contextmanager
+    def phase(self, name):
+        self.phases[name] += 1
+        yield
+
+
+class TestPhases(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "run.json.gz")
+        recorded = cassette.Cassette()
+        recorded.add_response("http://example.com/data", '{"value": 1}')
+        recorded.save(self.path)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_cassette_is_timed_once_in_any_order(self):
+        send = HTTPAdapter.send
+        for timer_first in (True, False):
+            timer = PhaseCounter()
+            with ExitStack() as stack:
+                if timer_first:
+                    stack.enter_context(instrumentation.timing_phases(timer))
+                stack.enter_context(cassette.replaying(self.path))
+                if not timer_first:
+                    stack.enter_context(instrumentation.timing_phases(timer))
+                Session().get("http://example.com/data").json()
+
+            self.assertEqual(dict(timer.phases), {"network": 1, "parse": 1})
+            self.assertIs(HTTPAdapter.send, send)
+
+
+class TestDisabled(unittest.TestCase):
+    def test_invalid_env(self):
+        with patch.dict(os.environ, {instrumentation.ENV_VARIABLE: "statsd"}):
+            with patch.object(instrumentation, "_env_sinks_loaded", False):
+                with self.assertLogs(instrumentation.logger, "ERROR"):
+                    self.assertFalse(instrumentation.is_enabled())
+
+    def test_instrument_without_sinks(self):
+        def fetch_price(zone_key):
+            return []
+
+        self.assertFalse(instrumentation.is_enabled())
+        self.assertIs(instrumentation.instrument(fetch_price, "price"), fetch_price)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,38 @@
+import unittest
+from unittest.mock import patch
+
+from PIL import Image
+
+from parsers.lib import ocr
+
+
+@patch("parsers.lib.ocr.pytesseract.image_to_string", return_value="42")
+class TestImageToString(unittest.TestCase):
+    def setUp(self):
+        ocr._results.clear()
+
+    def test_unchanged_image_is_read_once(self, tesseract):
+        image = Image.new("L", (20, 10), color=255)
+        self.assertEqual(ocr.image_to_string(image, config="--psm 7"), "42")
+        self.assertEqual(ocr.image_to_string(image.copy(), config="--psm 7"), "42")
+        self.assertEqual(tesseract.call_count, 1)
+
+    def test_cache_depends_on_content_and_arguments(self, tesseract):
+        image = Image.new("L", (20, 10), color=255)
+        ocr.image_to_string(image, config="--psm 7")
+        ocr.image_to_string(image, config="--psm 6")
+        ocr.image_to_string(Image.new("L", (20, 10), color=0), config="--psm 7")
+        self.assertEqual(tesseract.call_count, 3)
+
+    def test_images_are_read_in_one_call(self, tesseract):
+        images = [Image.new("L", (20, 10)), Image.new("L", (30, 12))]
+        ocr.images_to_string(images, lang="digits_comma", config="--psm 7")
+
+        self.assertEqual(tesseract.call_count, 1)
+        stitched = tesseract.call_args[0][0]
+        self.assertEqual(stitched.size, (50, 12))
+        self.assertEqual(stitched.getpixel((0, 11)), 255)
+
+
+if __name__ == "__main__":
+    unittest.main()
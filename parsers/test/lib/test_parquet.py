@@ -0,0 +1,122 @@
+import tempfile
+import unittest
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import pytest
+
+pa = pytest.importorskip("pyarrow")
+
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from parsers.lib import parquet
+from parsers.lib.parquet import ParquetWriter
+
+START = datetime(2022, 1, 31, 22, tzinfo=timezone.utc)
+
+
+def production(hour, wind):
+    return {
+        "zoneKey": "DE",
+        "datetime": START + timedelta(hours=hour),
+        "production": {"wind": wind, "solar": None},
+        "storage": {"hydro": -1.0},
+        "source": "entsoe.eu",
+    }
+
+
+class TestParquet(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.root = Path(self.directory.name)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_to_table(self):
+        table = parquet.to_table("production", [production(0, 1.5)])
+        self.assertEqual(table.schema, parquet.SCHEMAS["production"])
+        self.assertEqual(table.schema.field("zoneKey").type, parquet.KEY)
+        row = table.to_pylist()[0]
+        self.assertEqual(row["datetime"], START)
+        self.assertEqual(row["production.wind"], 1.5)
+        self.assertIsNone(row["production.solar"])
+        self.assertIsNone(row["production.coal"])
+        self.assertEqual(row["storage.hydro"], -1.0)
+
+        table = parquet.to_table(
+            "generationForecast",
+            [{"zoneKey": "DE", "datetime": START, "value": 3, "source": "entsoe.eu"}],
+        )
+        self.assertEqual(table.schema, parquet.SCHEMAS["forecast"])
+        with self.assertRaises(ValueError):
+            parquet.to_table("weather", [])
+
+    def test_partitioned_streaming_writes(self):
+        with ParquetWriter(self.root, row_group_size=3, max_open_files=1) as writer:
+            for hour in range(8):
+                writer.write("DE", "production", [production(hour, hour)])
+            writer.write(
+                "DE->FR",
+                "exchange",
+                [{"sortedZoneKeys": "DE->FR", "datetime": START, "netFlow": 1.0}],
+            )
+
+        january = self.root / "data_type=production/zone=DE/month=2022-01"
+        february = self.root / "data_type=production/zone=DE/month=2022-02"
+        self.assertEqual(pq.read_metadata(january / "part-0.parquet").num_rows, 2)
+        # 6 rows, in row groups of 3
+        self.assertEqual(
+            pq.read_metadata(february / "part-0.parquet").num_row_groups, 2
+        )
+
+        dataset = ds.dataset(
+            self.root / "data_type=production", format="parquet", partitioning="hive"
+        )
+        table = dataset.to_table(filter=ds.field("month") == "2022-02")
+        self.assertEqual(
+            sorted(table["production.wind"].to_pylist()), list(range(2, 8))
+        )
+
+        # New writers add parts instead of overwriting
+        with ParquetWriter(self.root) as writer:
+            writer.write("DE", "production", [production(0, 0)])
+        self.assertEqual(len(list(january.glob("*.parquet"))), 2)
+        exchanges = ds.dataset(self.root / "data_type=exchange", partitioning="hive")
+        self.assertEqual(
+            exchanges.to_table()["sortedZoneKeys"].type,
+            pa.dictionary(pa.int32(), pa.string()),
+        )
+
+    def test_commit_and_part_numbering(self):
+        january = self.root / "data_type=production/zone=DE/month=2022-01"
+        january.mkdir(parents=True)
+        # A gap in the numbering of existing parts, and a part left by a killed
+        # writer
+        pq.write_table(
+            parquet.to_table("production", [production(0, 0)]),
+            january / "part-1.parquet",
+        )
+        (january / ".part-2.parquet.tmp").write_bytes(b"PAR1")
+
+        writer = ParquetWriter(self.root)
+        writer.write("DE", "production", [production(1, 1)])
+        writer.commit()
+        self.assertTrue((january / "part-3.parquet").exists())
+        self.assertEqual(pq.read_metadata(january / "part-1.parquet").num_rows, 1)
+
+        # Parts that are still being written are hidden from the dataset
+        writer.write("DE", "production", [production(0, 2)])
+        dataset = ds.dataset(
+            self.root / "data_type=production", format="parquet", partitioning="hive"
+        )
+        self.assertEqual(
+            sorted(dataset.to_table()["production.wind"].to_pylist()), [0, 1]
+        )
+        writer.close()
+        self.assertEqual(len(list(january.glob("part-*.parquet"))), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+import os
+import unittest
+
+from parsers import ENTSOE
+from parsers.lib import processing
+from parsers.lib.config import cpu_bound
+
+UNITS_XML = """<GL_MarketDocument>
+<TimeSeries>
+<inBiddingZone_Domain.mRID>10YNL----------L</inBiddingZone_Domain.mRID>
+<MktPSRType><psrType>B14</psrType>
+<PowerSystemResources><mRID>49W000000000054X</mRID><name>Borssele</name></PowerSystemResources>
+</MktPSRType>
+<Period><timeInterval><start>2022-01-01T00:00Z</start></timeInterval>
+<resolution>PT60M</resolution>
+<Point><position>1</position><quantity>485</quantity></Point>
+<Point><position>2</position><quantity>486</quantity></Point>
+</Period>
+</TimeSeries>
+</GL_MarketDocument>"""
+
+PRICE_XML = """<Publication_MarketDocument>
+<TimeSeries>
+<currency_Unit.name>EUR</currency_Unit.name>
+<Period><timeInterval><start>2022-01-01T00:00Z</start></timeInterval>
+<resolution>PT60M</resolution>
+<Point><position>1</position><price.amount>50.87</price.amount></Point>
+<Point><position>2</position><price.amount>48.19</price.amount></Point>
+</Period>
+</TimeSeries>
+</Publication_MarketDocument>"""
+
+
+@cpu_bound
+def parse(content: bytes) -> dict:
+    return {"length": len(content), "pid": os.getpid()}
+
+
+class TestProcessing(unittest.TestCase):
+    def test_runs_in_process_without_pool(self):
+        self.assertFalse(processing.is_active())
+        self.assertTrue(parse.CPU_BOUND)
+        self.assertEqual(parse(b"abc"), {"length": 3, "pid": os.getpid()})
+
+    def test_runs_in_pool(self):
+        with processing.process_pool(2):
+            self.assertTrue(processing.is_active())
+            result = parse(b"abcd")
+        self.assertEqual(result["length"], 4)
+        self.assertNotEqual(result["pid"], os.getpid())
+        self.assertFalse(processing.is_active())
+
+    def test_entsoe_stages_in_pool(self):
+        stages = [
+            (ENTSOE.parse_production, (UNITS_XML,)),
+            (ENTSOE.parse_production_per_units, (UNITS_XML,)),
+            (ENTSOE.parse_exchange, (UNITS_XML, True)),
+            (ENTSOE.parse_price, (PRICE_XML,)),
+        ]
+        expected = [stage(*args) for stage, args in stages]
+        with processing.process_pool(2):
+            results = [stage(*args) for stage, args in stages]
+        self.assertEqual(results, expected)
+
+        units = results[1]
+        self.assertEqual(len(units), 2)
+        self.assertEqual(units[0]["productionType"], "nuclear")
+        self.assertIs(type(units[0]["unitName"]), str)
+        prices, currencies, _ = results[3]
+        self.assertEqual(prices, [50.87, 48.19])
+        self.assertEqual(currencies, ["EUR", "EUR"])
+        self.assertIs(type(currencies[0]), str)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,114 @@
+import unittest
+from datetime import timedelta
+from threading import Lock
+
+from parsers.lib import scheduler
+from parsers.lib.config import refetch_frequency
+from parsers.lib.scheduler import ScheduledTask
+
+
+@refetch_frequency(timedelta(minutes=10))
+def fetch_production(zone_key, session=None, target_datetime=None, logger=None):
+    return [{"zoneKey": zone_key}]
+
+
+def fetch_exchange(
+    zone_key1, zone_key2, session=None, target_datetime=None, logger=None
+):
+    return {"sortedZoneKeys": f"{zone_key1}->{zone_key2}"}
+
+
+def make_task(key, data_type, function_name, function, group, host="example.com"):
+    return ScheduledTask(
+        key=key,
+        data_type=data_type,
+        function_name=function_name,
+        function=function,
+        interval=timedelta(minutes=5),
+        host=host,
+        group=group,
+    )
+
+
+class TestPlan(unittest.TestCase):
+    def test_interval(self):
+        self.assertEqual(
+            scheduler.get_interval(fetch_exchange), scheduler.DEFAULT_INTERVAL
+        )
+        self.assertEqual(
+            scheduler.get_interval(fetch_exchange, delay_hours=24),
+            timedelta(hours=6),
+        )
+        # Never less often than the history returned by a single call.
+        self.assertEqual(
+            scheduler.get_interval(fetch_production, delay_hours=24),
+            timedelta(minutes=10),
+        )
+
+    def test_interval_from_refetch_frequency(self):
+        @refetch_frequency(timedelta(days=21))
+        def fetch_history(zone_key, session=None, target_datetime=None, logger=None):
+            return []
+
+        self.assertEqual(scheduler.get_interval(fetch_history), timedelta(days=21) / 4)
+        self.assertGreater(
+            scheduler.get_interval(fetch_history),
+            1000 * scheduler.get_interval(fetch_exchange),
+        )
+        tasks = scheduler.plan_tasks(keys=["AUS-NSW"], data_types=["production"])
+        self.assertEqual(tasks[0].interval, timedelta(days=21) / 4)
+
+    def test_plan_tasks(self):
+        tasks = scheduler.plan_tasks(keys=["BR-CS", "BR-S", "BR-CS->BR-S", "DK-BHM"])
+        groups = scheduler.coalesce(tasks)
+
+        br_groups = [group for group in groups if group.startswith("BR@")]
+        self.assertEqual(len(br_groups), 1)
+        self.assertEqual(len(groups[br_groups[0]]), 3)
+        self.assertEqual(
+            scheduler.requests_per_host_per_hour(groups[br_groups[0]]),
+            {"tr.ons.org.br": 12.0},
+        )
+
+    def test_unshared_documents_are_counted(self):
+        # RU doesn't cache live calls, JP production downloads a file per zone
+        tasks = scheduler.plan_tasks(
+            keys=["RU-1", "RU-2", "JP-TK", "JP-CB"], data_types=["production"]
+        )
+        self.assertEqual(len(scheduler.coalesce(tasks)), 4)
+        self.assertAlmostEqual(
+            sum(scheduler.requests_per_host_per_hour(tasks).values()),
+            sum(timedelta(hours=1) / task.interval for task in tasks),
+        )
+
+
+class TestScheduler(unittest.TestCase):
+    def test_run(self):
+        tasks = [
+            make_task("DE", "production", "X.fetch_production", fetch_production, "a"),
+            make_task("BR-CS", "production", "BR.fetch", fetch_production, "BR"),
+            make_task("BR-S->UY", "exchange", "BR.fetch", fetch_exchange, "BR"),
+        ]
+        results = []
+        lock = Lock()
+
+        def on_result(task, result):
+            with lock:
+                results.append((task.key, result))
+
+        scheduler.Scheduler(tasks, on_result, workers=2).run(
+            duration=timedelta(seconds=1)
+        )
+
+        self.assertCountEqual(
+            results,
+            [
+                ("DE", [{"zoneKey": "DE"}]),
+                ("BR-CS", [{"zoneKey": "BR-CS"}]),
+                ("BR-S->UY", {"sortedZoneKeys": "BR-S->UY"}),
+            ],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from parsers.lib import singleflight
+
+
+class SlowHandler(BaseHTTPRequestHandler):
+    calls = 0
+
+    def do_GET(self):
+        SlowHandler.calls += 1
+        time.sleep(0.2)
+        body = f"call {SlowHandler.calls} {self.path}".encode()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestSingleFlight(unittest.TestCase):
+    def test_shares_exceptions(self):
+        flight = singleflight.SingleFlight()
+        started = threading.Event()
+
+        def fail():
+            started.set()
+            time.sleep(0.1)
+            raise ValueError("upstream down")
+
+        with ThreadPoolExecutor(2) as executor:
+            leader = executor.submit(flight.do, "key", fail)
+            started.wait()
+            follower = executor.submit(flight.do, "key", fail)
+            for future in (leader, follower):
+                with self.assertRaises(ValueError):
+                    future.result()
+        self.assertEqual(flight.shared, 1)
+        # Nothing is kept once the call completed
+        self.assertEqual(flight.do("key", lambda: 1), (1, False))
+
+
+class TestCoalescingSession(unittest.TestCase):
+    def setUp(self):
+        SlowHandler.calls = 0
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), SlowHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_port}/data"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_coalesces_concurrent_identical_requests(self):
+        session = singleflight.coalescing_session(pool_size=8)
+        params = [{"a": "1", "b": "2"}] * 6 + [{"b": "2", "a": "1"}] + [{"a": "3"}]
+        with ThreadPoolExecutor(8) as executor:
+            responses = list(
+                executor.map(lambda p: session.get(self.url, params=p), params)
+            )
+
+        self.assertEqual(SlowHandler.calls, 2)
+        self.assertEqual(len({r.text for r in responses[:7]}), 1)
+        self.assertEqual(len({id(r) for r in responses}), 8)
+        self.assertIn("a=3", responses[7].text)
+
+    def test_credentials_and_headers_are_not_shared(self):
+        session = singleflight.coalescing_session(pool_size=8)
+        requests = [({"token": "a"}, {})] * 2 + [({"token": "b"}, {})]
+        requests += [({"token": "a"}, {"Authorization": "Bearer c"})]
+        with ThreadPoolExecutor(4) as executor:
+            responses = list(
+                executor.map(
+                    lambda r: session.get(self.url, params=r[0], headers=r[1]),
+                    requests,
+                )
+            )
+
+        # Only the two requests with the same token and headers are shared
+        self.assertEqual(SlowHandler.calls, 3)
+        self.assertIn("token=b", responses[2].text)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+import tempfile
+import unittest
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+
+import numpy as np
+
+from parsers.lib import timeseries
+from parsers.lib.timeseries import TimeSeriesStore
+
+START = datetime(2022, 1, 1, tzinfo=timezone.utc)
+
+
+def production(hour, wind, hydro_storage=None):
+    return {
+        "zoneKey": "DE",
+        "datetime": START + timedelta(hours=hour),
+        "production": {"wind": wind, "solar": None},
+        "storage": {"hydro": hydro_storage},
+        "source": "entsoe.eu",
+    }
+
+
+class TestTimeSeriesStore(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.store = TimeSeriesStore(self.directory.name)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_append_and_merge(self):
+        self.store.append("DE", "production", [production(0, 1), production(3, 4)])
+        # Out of order, with a revision of hour 3
+        self.store.append(
+            "DE",
+            "production",
+            [production(2, 3), production(1, 2, -5), production(3, 5)],
+        )
+
+        block = self.store.read("DE", "production")
+        self.assertEqual(len(block), 4)
+        np.testing.assert_array_equal(block.columns["production.wind"], [1, 2, 3, 5])
+        np.testing.assert_array_equal(
+            block.columns["storage.hydro"], [np.nan, -5, np.nan, np.nan]
+        )
+        self.assertTrue(np.isnan(block.columns["production.solar"]).all())
+
+        block = self.store.read(
+            "DE", "production", START + timedelta(hours=1), START + timedelta(hours=3)
+        )
+        np.testing.assert_array_equal(block.columns["production.wind"], [2, 3])
+        self.assertIsInstance(block.columns["production.wind"].base, np.memmap)
+
+    def test_growth_and_reopening(self):
+        events = [production(hour, hour) for hour in range(3000)]
+        self.store.append("DE", "production", events[::2])
+        self.store.append("DE", "production", events[1::2])
+
+        block = TimeSeriesStore(self.directory.name).read("DE", "production")
+        np.testing.assert_array_equal(block.columns["production.wind"], range(3000))
+        self.assertEqual(block.to_frame().index[-1], START + timedelta(hours=2999))
+
+    def test_interrupted_writes(self):
+        self.store.append("DE", "production", [production(0, 1), production(3, 4)])
+        merge = [production(2, 3), production(3, 5)]
+
+        # Before meta.json is replaced: the stored points are left as they were
+        with patch.object(timeseries.Table, "_save_meta", side_effect=OSError):
+            with self.assertRaises(OSError):
+                self.store.append("DE", "production", merge)
+        block = TimeSeriesStore(self.directory.name).read("DE", "production")
+        np.testing.assert_array_equal(block.columns["production.wind"], [1, 4])
+
+        # After: the merged tail is copied into place on reopening
+        store = TimeSeriesStore(self.directory.name)
+        with patch.object(timeseries.Table, "_move_tail", side_effect=OSError):
+            with self.assertRaises(OSError):
+                store.append("DE", "production", merge)
+        block = TimeSeriesStore(self.directory.name).read("DE", "production")
+        np.testing.assert_array_equal(block.columns["production.wind"], [1, 3, 5])
+
+    def test_float32(self):
+        store = TimeSeriesStore(self.directory.name, dtype=np.float32)
+        store.append("DE->FR", "exchange", [{"datetime": START, "netFlow": 1.5}])
+        block = store.read("DE->FR", "exchange")
+        self.assertEqual(block.columns["netFlow"].dtype, np.float32)
+
+    def test_run_validators(self):
+        self.store.append("CH", "production", [production(0, 10), production(1, -1)])
+        results = timeseries.run_validators(self.store, "CH", "production")
+        self.assertEqual(list(results["validate_positive_production"]), [1, 0])
+        # CH is excluded from this zone specific check
+        self.assertNotIn("validate_production_has_fossil_fuel", results)
+
+
+if __name__ == "__main__":
+    unittest.main()
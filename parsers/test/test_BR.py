@@ -8,6 +8,8 @@ from datetime import datetime
 from unittest.mock import patch
 
 from arrow import get
+from requests import Session
+from requests_mock import Adapter
 
 from parsers import BR
 
@@ -127,5 +129,31 @@ class RegionTestcase(unittest.TestCase):
         self.assertEqual(data["source"], "ons.org.br")
 
 
+class SnapshotTestcase(unittest.TestCase):
+    """Tests that all BR zones and exchanges share one downloaded snapshot."""
+
+    def setUp(self):
+        with open("parsers/test/mocks/BR.html") as f:
+            self.fake_data = f.read()
+
+        BR._snapshot = None
+        self.session = Session()
+        self.adapter = Adapter()
+        self.session.mount("http://", self.adapter)
+        self.adapter.register_uri("GET", BR.URL, text=self.fake_data)
+
+    def tearDown(self):
+        BR._snapshot = None
+
+    def test_single_download(self):
+        for zone_key in BR.REGIONS:
+            BR.fetch_production(zone_key, self.session)
+        BR.fetch_exchange("BR-S", "UY", self.session)
+        data = BR.fetch_region_exchange("BR-N", "BR-NE", self.session)
+
+        self.assertEqual(self.adapter.call_count, 1)
+        self.assertEqual(data["netFlow"], 2967.768)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -1,13 +1,47 @@
+import json
+import os
+import tempfile
 import unittest
 from datetime import datetime
+from unittest.mock import patch
 
 import arrow
 import numpy as np
 import pandas as pd
+from requests import Session
+from requests_mock import Adapter
 
+from parsers import OPENNEM
+from parsers.lib import benchmark, cassette
 from parsers.OPENNEM import filter_production_objs, process_solar_rooftop, sum_vector
 
 
+def dataset(_id, data_type, region=None, data=(1.0, 2.0, 3.0), start="2021-01-01"):
+    return {
+        "id": _id,
+        "type": data_type,
+        "data_type": data_type,
+        "region": region,
+        "history": {
+            "interval": "5m",
+            "start": arrow.get(start).isoformat(),
+            "last": arrow.get(start).shift(minutes=5 * (len(data) - 1)).isoformat(),
+            "data": list(data),
+        },
+    }
+
+
+LATEST = {
+    "data": [
+        dataset("au.nem.nsw1.fuel_tech.coal_black.power", "power", "NSW1"),
+        dataset("au.nem.nsw1.fuel_tech.solar_utility.power", "power", "NSW1"),
+        dataset("au.nem.qld1.fuel_tech.coal_black.power", "power", "QLD1"),
+        dataset("au.nem.nsw1.price", "price", "NSW1"),
+        dataset("au.nem.NSW1->QLD1.power", "power"),
+    ]
+}
+
+
 class TestOPENNEM(unittest.TestCase):
     def test_process_solar_rooftop(self):
         idx = pd.date_range(
@@ -95,5 +129,103 @@ class TestOPENNEM(unittest.TestCase):
         assert len(filtered_objs) == 1
 
 
+class TestOPENNEMLatest(unittest.TestCase):
+    def setUp(self):
+        benchmark.clear_memory_caches()
+        self.session = Session()
+        self.adapter = Adapter()
+        self.session.mount("https://", self.adapter)
+        self.adapter.register_uri(
+            "GET", OPENNEM.generate_url("AUS-NSW", False, None, None), json=LATEST
+        )
+
+    def test_latest_is_shared(self):
+        production = OPENNEM.fetch_production("AUS-NSW", self.session)
+        prices = OPENNEM.fetch_price("AUS-NSW", self.session)
+        exchanges = OPENNEM.fetch_exchange("AUS-QLD", "AUS-NSW", self.session)
+
+        self.assertEqual(self.adapter.call_count, 1)
+        self.assertEqual(production[-1]["production"]["coal"], 3.0)
+        self.assertEqual(production[-1]["production"]["solar"], 3.0)
+        self.assertEqual([p["price"] for p in prices], [1.0, 2.0, 3.0])
+        self.assertEqual(exchanges[0]["sortedZoneKeys"], "AUS-NSW->AUS-QLD")
+        self.assertEqual(exchanges[0]["netFlow"], 1.0)
+
+
+class TestOPENNEMMonthlyBenchmark(unittest.TestCase):
+    """Replays a month of 5-minute NSW production through the offline benchmark."""
+
+    FUEL_TECHS = ["coal_black", "coal_brown", "gas_ccgt", "gas_ocgt", "hydro"]
+    FUEL_TECHS += ["wind", "solar_utility", "battery_discharging", "pumps"]
+
+    def setUp(self):
+        # Also empties the cache of electricitymap.contrib.parsers.OPENNEM,
+        # the module the benchmark runs
+        benchmark.clear_memory_caches()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "AUS-NSW_production.json.gz")
+        rows = 31 * 24 * 12
+        rng = np.random.default_rng(0)
+        datasets = []
+        for fuel_tech in self.FUEL_TECHS:
+            data = rng.uniform(0, 1000, rows).round(3)
+            # Gaps, so that NaN propagation is exercised
+            data[rng.integers(0, rows, 50)] = np.nan
+            datasets.append(
+                dataset(
+                    f"au.nem.nsw1.fuel_tech.{fuel_tech}.power",
+                    "power",
+                    "NSW1",
+                    data=[None if np.isnan(x) else x for x in data],
+                )
+            )
+            datasets[-1]["x_capacity_at_present"] = 1000.0
+
+        target_datetime = "2021-01-15T00:00:00+00:00"
+        recorded = cassette.Cassette(
+            {
+                "zone": "AUS-NSW",
+                "data_type": "production",
+                "target_datetime": target_datetime,
+            }
+        )
+        url = OPENNEM.generate_url("AUS-NSW", False, arrow.get(target_datetime), None)
+        recorded.add_response(url, json.dumps({"data": datasets}))
+        recorded.save(self.path)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_monthly_production(self):
+        # Feeder validation is benchmarked elsewhere and would dominate the run
+        with patch.dict(benchmark.VALIDATORS, clear=True):
+            result = benchmark.benchmark(self.path, repeat=1)
+        self.assertGreater(result["events"], 8000)
+        # The timed run downloads and decodes the month, not a cached document
+        self.assertGreater(result["seconds"]["network"], 0)
+        self.assertGreater(result["seconds"]["parse"], 0)
+
+        # Same values as the reference row-wise aggregation
+        target_datetime = arrow.get("2021-01-15").datetime
+        with cassette.replaying(self.path):
+            df, _ = OPENNEM.fetch_main_power_df(
+                "AUS-NSW", target_datetime=target_datetime
+            )
+            production = OPENNEM.fetch_production(
+                "AUS-NSW", target_datetime=target_datetime
+            )
+        df["BATTERY_DISCHARGING"] *= -1
+        objs = {obj["datetime"]: obj for obj in production}
+        for dt, row in df.iloc[:500].iterrows():
+            if dt.to_pydatetime() not in objs:
+                continue
+            obj = objs[dt.to_pydatetime()]
+            for mode, keys in OPENNEM.OPENNEM_PRODUCTION_CATEGORIES.items():
+                self.assertEqual(obj["production"][mode], sum_vector(row, keys))
+            for mode, keys in OPENNEM.OPENNEM_STORAGE_CATEGORIES.items():
+                self.assertEqual(obj["storage"][mode], sum_vector(row, keys))
+            self.assertEqual(obj["capacity"]["coal"], 2000)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,61 @@
+import json
+import re
+import unittest
+from datetime import datetime
+
+from requests import Session
+from requests_mock import Adapter
+
+from parsers import RU
+
+
+class TestRU(unittest.TestCase):
+    def setUp(self):
+        self.session = Session()
+        self.adapter = Adapter()
+        self.session.mount("https://", self.adapter)
+        RU._flow_snapshots.clear()
+
+    def register_flows(self):
+        flows = {
+            "Flows": [
+                {"Id": RU.exchange_ids["RU->FI"], "NumValue": 1000.0},
+                {"Id": RU.exchange_ids["RU->KZ"], "NumValue": -250.0},
+            ]
+        }
+        self.adapter.register_uri(
+            "GET",
+            re.compile(re.escape(RU.BASE_EXCHANGE_URL)),
+            text=json.dumps(flows),
+        )
+
+    def test_fetch_exchange_historical(self):
+        self.register_flows()
+
+        data = RU.fetch_exchange(
+            "RU", "FI", self.session, target_datetime=datetime(2022, 3, 1)
+        )
+
+        self.assertEqual(len(data), 24)
+        self.assertEqual(data[0]["sortedZoneKeys"], "FI->RU")
+        self.assertEqual(data[0]["netFlow"], -1000.0)
+        self.assertEqual(
+            data[5]["datetime"], datetime.fromisoformat("2022-03-01T05:00+00:00")
+        )
+
+    def test_historical_flow_snapshots_are_shared_between_exchanges(self):
+        self.register_flows()
+        target_datetime = datetime(2022, 3, 1)
+
+        RU.fetch_exchange("RU", "FI", self.session, target_datetime=target_datetime)
+        data = RU.fetch_exchange(
+            "KZ", "RU", self.session, target_datetime=target_datetime
+        )
+
+        self.assertEqual(self.adapter.call_count, 24)
+        self.assertEqual(len(data), 24)
+        self.assertEqual(data[0]["netFlow"], 250.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
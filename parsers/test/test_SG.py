@@ -1,5 +1,6 @@
 import logging
 import unittest
+from unittest.mock import patch
 
 from freezegun import freeze_time
 from pkg_resources import resource_string
@@ -8,11 +9,13 @@ from requests_mock import Adapter
 from testfixtures import LogCapture
 
 from parsers import SG
+from parsers.lib import ocr
 
 
 class TestSolar(unittest.TestCase):
     def setUp(self):
         self.logger = logging.getLogger("test")
+        ocr._results.clear()
         self.session = Session()
         self.adapter = Adapter()
         self.session.mount("https://", self.adapter)
@@ -46,6 +49,52 @@ class TestSolar(unittest.TestCase):
         power = SG.get_solar(self.session, logger=self.logger)
         self.assertEqual(power, 0.0)
 
+    @freeze_time("2021-12-23 03:21:00")
+    def test_unchanged_image_is_not_read_again(self):
+        def fake_tesseract(image, lang, config):
+            if "whitelist" in config:
+                return "2021-12-23 11:15"
+            return "Est. PV Output: 69.64MWac"
+
+        with patch(
+            "parsers.lib.ocr.pytesseract.image_to_string", side_effect=fake_tesseract
+        ) as tesseract:
+            for _ in range(3):
+                power = SG.get_solar(self.session, logger=self.logger)
+
+        self.assertEqual(power, 69.64)
+        self.assertEqual(tesseract.call_count, 2)
+
+
+class TestSolarOCRCache(unittest.TestCase):
+    """Tesseract runs twice per solar map image (time and output), and not at
+    all for an image it already read. Timings: parsers.lib.ocr_benchmark."""
+
+    def setUp(self):
+        ocr._results.clear()
+        self.session = Session()
+        self.adapter = Adapter()
+        self.session.mount("https://", self.adapter)
+
+    def test_each_mock_is_read_once(self):
+        mocks = ["SG_ema_gov_sg_solar_map.png", "SG_ema_gov_sg_solar_map_nonzero.png"]
+
+        def fake_tesseract(image, lang, config):
+            if "whitelist" in config:
+                return "2021-12-23 11:15"
+            return "Est. PV Output: 0MWac"
+
+        with patch(
+            "parsers.lib.ocr.pytesseract.image_to_string", side_effect=fake_tesseract
+        ) as tesseract:
+            for mock in mocks:
+                content = resource_string("parsers.test.mocks", mock)
+                self.adapter.register_uri("GET", SG.SOLAR_URL, content=content)
+                for _ in range(3):
+                    SG.get_solar(self.session, logger=logging.getLogger("test"))
+
+        self.assertEqual(tesseract.call_count, 2 * len(mocks))
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -7,8 +7,9 @@ import unittest
 from datetime import datetime
 from unittest.mock import patch
 
+import numpy as np
 from arrow import get
-from pandas import read_pickle
+from pandas import DataFrame, date_range, read_pickle
 from testfixtures import LogCapture
 
 from parsers import US_SPP
@@ -69,6 +70,43 @@ class TestUSSPP(unittest.TestCase):
                 )
             )
 
+    def test_data_processor_full_year(self):
+        """A full year of 5-minute historical data with Market/Self columns."""
+
+        index = date_range("2019-01-01", "2020-01-01", freq="5min", tz="UTC")[:-1]
+        ones = np.ones(len(index))
+        fake_data = DataFrame(
+            {
+                "GMT MKT Interval": index,
+                " Coal Market": ones,
+                " Coal Self": 2 * ones,
+                " Wind Market": 3 * ones,
+                " Wind Self": 4 * ones,
+                " Gas Self": ones,
+                " Natural Gas Market": ones,
+                " Other Market": ones,
+                " Other Self": ones,
+                " Waste Heat Market": 5 * ones,
+                " Waste Heat Self": ones,
+                " Load": ones,
+            }
+        )
+        fake_data.loc[10, " Other Self"] = np.nan
+
+        with LogCapture():
+            data = US_SPP.data_processor(fake_data, logging.getLogger("test"))
+
+        self.assertEqual(len(data), 105120)
+        dt, production = data[0]
+        self.assertEqual(dt, get(datetime(2019, 1, 1), "UTC").datetime)
+        self.assertEqual(
+            production, {"coal": 3.0, "wind": 7.0, "gas": 2.0, "unknown": 8.0}
+        )
+        self.assertTrue(np.isnan(data[10][1]["unknown"]))
+        self.assertEqual(
+            data[-1][0], get(datetime(2019, 12, 31, 23, 55), "UTC").datetime
+        )
+
 
 if __name__ == "__main__":
     unittest.main(buffer=True)
@@ -0,0 +1,65 @@
+import unittest
+from datetime import datetime
+from unittest.mock import patch
+
+import pandas as pd
+from requests import Session
+
+from parsers import occtonet
+
+
+def fake_exchange(session, form_data):
+    index = pd.DatetimeIndex(
+        [datetime(2022, 3, 1, 0, 0), datetime(2022, 3, 1, 0, 5)],
+        tz="Asia/Tokyo",
+        name="datetime",
+    )
+    return pd.DataFrame({"netFlow": [100.0, 200.0]}, index=index)
+
+
+@patch("parsers.occtonet.get_exchange", side_effect=fake_exchange)
+@patch("parsers.occtonet.get_form_data", return_value={})
+@patch("parsers.occtonet.get_cookies")
+class TestOcctonet(unittest.TestCase):
+    def setUp(self):
+        occtonet._link_cache.clear()
+        occtonet._authorised_sessions.clear()
+        self.session = Session()
+
+    def test_links_are_downloaded_once_per_date(
+        self, get_cookies, get_form_data, get_exchange
+    ):
+        target_datetime = datetime(2022, 3, 1)
+        for _ in range(2):
+            occtonet.fetch_exchange(
+                "JP-TH", "JP-TK", self.session, target_datetime=target_datetime
+            )
+        occtonet.fetch_exchange(
+            "JP-TK", "JP-TH", self.session, target_datetime=target_datetime
+        )
+
+        self.assertEqual(get_cookies.call_count, 1)
+        self.assertEqual(get_form_data.call_count, 1)
+        self.assertEqual(get_exchange.call_count, 1)
+
+    def test_links_of_an_exchange_are_summed(
+        self, get_cookies, get_form_data, get_exchange
+    ):
+        target_datetime = datetime(2022, 3, 1)
+        data = occtonet.fetch_exchange(
+            "JP-CB", "JP-HR", self.session, target_datetime=target_datetime
+        )
+        # The summed links don't modify the cached downloads.
+        data = occtonet.fetch_exchange(
+            "JP-CB", "JP-HR", self.session, target_datetime=target_datetime
+        )
+
+        self.assertEqual(get_exchange.call_count, 2)
+        self.assertEqual(len(data), 2)
+        self.assertEqual(data[0]["sortedZoneKeys"], "JP-CB->JP-HR")
+        self.assertEqual(data[0]["netFlow"], 200.0)
+        self.assertEqual(data[1]["netFlow"], 400.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+import re
+import unittest
+from datetime import datetime, timezone
+from urllib.parse import parse_qs, urlparse
+
+from requests import Session
+from requests_mock import Adapter
+
+from parsers import statnett
+
+
+class TestStatnett(unittest.TestCase):
+    def setUp(self):
+        self.session = Session()
+        self.adapter = Adapter()
+        self.session.mount("http://", self.adapter)
+        statnett._flow_maps.clear()
+
+    def register_flow_maps(self):
+        def flow_map(request, context):
+            ticks = int(parse_qs(urlparse(request.url).query)["Ticks"][0])
+            # 100MW NL->NO2 during the first half of each hour, 300MW after
+            minute = ticks // 60000 % 60
+            return [
+                {
+                    "OutAreaElspotId": "NL",
+                    "InAreaElspotId": "NO2",
+                    "Value": 100 if minute < 30 else 300,
+                    "MeasureDate": ticks,
+                }
+            ]
+
+        self.adapter.register_uri(
+            "GET", re.compile(re.escape(statnett.FLOW_MAP_URL)), json=flow_map
+        )
+
+    def test_fetch_exchange_range(self):
+        self.register_flow_maps()
+        start = datetime(2022, 3, 1, 10, 20, tzinfo=timezone.utc)
+        end = datetime(2022, 3, 1, 12, tzinfo=timezone.utc)
+
+        data = statnett.fetch_exchange_range("NL", "NO", start, end, self.session)
+
+        self.assertEqual(
+            [e["datetime"] for e in data],
+            [
+                datetime(2022, 3, 1, 10, tzinfo=timezone.utc),
+                datetime(2022, 3, 1, 11, tzinfo=timezone.utc),
+            ],
+        )
+        self.assertEqual([e["netFlow"] for e in data], [200, 200])
+        self.assertEqual(data[0]["sortedZoneKeys"], "NL->NO")
+        self.assertEqual(self.adapter.call_count, 8)
+
+        # Past snapshots are cached
+        statnett.fetch_exchange_range("NL", "NO", start, end, self.session)
+        self.assertEqual(self.adapter.call_count, 8)
+
+
+if __name__ == "__main__":
+    unittest.main()
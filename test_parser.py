@@ -3,33 +3,245 @@
 Usage: poetry run test_parser FR production
 """
 
+import csv
+import fnmatch
 import pprint
 import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
 from datetime import datetime
 from logging import DEBUG, basicConfig, getLogger
-from typing import Any, Callable, Dict, List, Union
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple, Union
 
 import arrow
 import click
 
 from electricitymap.contrib.config import ZoneKey
+from parsers.lib import cassette
 from parsers.lib.parsers import PARSER_KEY_TO_DICT
-from parsers.lib.quality import (
-    ValidationError,
-    validate_consumption,
-    validate_exchange,
-    validate_production,
-)
+from parsers.lib.quality import VALIDATORS, ValidationError
+from parsers.lib.singleflight import coalescing_session
 
 logger = getLogger(__name__)
 basicConfig(level=DEBUG, format="%(asctime)s %(levelname)-8s %(name)-30s %(message)s")
 
+GLOB_CHARACTERS = "*?["
+
+
+class BatchResult(NamedTuple):
+    zone: str
+    data_type: str
+    parser: str
+    seconds: float
+    events: int
+    validation_failures: int
+    error: Optional[str]
+
+
+def get_parser_args(zone: str, data_type: str) -> List[str]:
+    if data_type in ["exchange", "exchangeForecast"]:
+        return zone.split("->")
+    return [zone]
+
+
+def count_validation_failures(events: List[dict], zone: str, data_type: str) -> int:
+    validator = VALIDATORS.get(data_type)
+    failures = 0
+    for event in events if validator else []:
+        try:
+            validator(event, zone)
+        except ValidationError as e:
+            logger.warning(
+                "Validation failed for {} @ {}: {}".format(
+                    zone, event.get("datetime"), e
+                )
+            )
+            failures += 1
+    return failures
+
+
+def read_batch(
+    path: str,
+    default_data_type: str,
+    default_target_datetime: Optional[datetime] = None,
+) -> List[Tuple[str, str, Optional[datetime]]]:
+    """Reads `zone[,data type[,target datetime]]` lines. Blank lines and lines
+    starting with # are ignored. Lines without a data type or target datetime
+    get the defaults."""
+    entries = []
+    with open(path) as f:
+        for row in csv.reader(f):
+            row = [value.strip() for value in row]
+            if not row or not row[0] or row[0].startswith("#"):
+                continue
+            data_type = row[1] if len(row) > 1 and row[1] else default_data_type
+            target_datetime = (
+                arrow.get(row[2]).datetime
+                if len(row) > 2 and row[2]
+                else default_target_datetime
+            )
+            entries.append((row[0], data_type, target_datetime))
+    return entries
+
+
+def expand_globs(
+    entries: List[Tuple[str, str, Optional[datetime]]],
+) -> List[Tuple[str, str, Optional[datetime]]]:
+    """Expands zone globs, e.g. `DE*` or `*->FR`, to the configured keys."""
+    expanded = []
+    for zone, data_type, target_datetime in entries:
+        parsers = PARSER_KEY_TO_DICT.get(data_type, {})
+        if any(character in zone for character in GLOB_CHARACTERS):
+            zones = sorted(fnmatch.filter(parsers, zone))
+        else:
+            zones = [zone]
+        expanded.extend((key, data_type, target_datetime) for key in zones)
+    return expanded
+
+
+def run_batch(
+    entries: List[Tuple[str, str, Optional[datetime]]], workers: int
+) -> List[BatchResult]:
+    """Runs parsers concurrently, sharing one session and connection pool.
+    Identical requests in flight at the same time are made only once."""
+    session = coalescing_session(pool_size=workers)
+
+    def run(entry: Tuple[str, str, Optional[datetime]]) -> BatchResult:
+        zone, data_type, target_datetime = entry
+        parser = PARSER_KEY_TO_DICT.get(data_type, {}).get(zone)
+        parser_name = (
+            f"{parser.__module__.rsplit('.', 1)[-1]}.{parser.__name__}"
+            if parser
+            else "-"
+        )
+        start = time.time()
+        try:
+            if parser is None:
+                raise NotImplementedError(f"No {data_type} parser for {zone}")
+            res = parser(
+                *get_parser_args(zone, data_type),
+                session=session,
+                target_datetime=target_datetime,
+                logger=getLogger(__name__),
+            )
+        except Exception as e:
+            return BatchResult(
+                zone,
+                data_type,
+                parser_name,
+                time.time() - start,
+                0,
+                0,
+                f"{type(e).__name__}: {' '.join(str(e).split())}",
+            )
+        elapsed_time = time.time() - start
+        events = [res] if isinstance(res, dict) else list(res or [])
+        return BatchResult(
+            zone,
+            data_type,
+            parser_name,
+            elapsed_time,
+            len(events),
+            count_validation_failures(events, zone, data_type),
+            None if events else "parser returned nothing",
+        )
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(run, entries))
+
+
+class ParserTotals(NamedTuple):
+    entries: int
+    failed: int
+    seconds: float
+    max_seconds: float
+    events: int
+    validation_failures: int
+
+
+def aggregate_batch(results: List[BatchResult]) -> Dict[str, ParserTotals]:
+    """Sums the results of a batch per parser function."""
+    totals: Dict[str, ParserTotals] = {}
+    for r in results:
+        total = totals.get(r.parser, ParserTotals(0, 0, 0.0, 0.0, 0, 0))
+        totals[r.parser] = ParserTotals(
+            total.entries + 1,
+            total.failed + bool(r.error),
+            total.seconds + r.seconds,
+            max(total.max_seconds, r.seconds),
+            total.events + r.events,
+            total.validation_failures + r.validation_failures,
+        )
+    return totals
+
+
+def print_batch(results: List[BatchResult]) -> None:
+    header = ("parser", "entries", "failed", "seconds", "max", "events", "invalid")
+    rows = [
+        (
+            parser,
+            str(total.entries),
+            str(total.failed),
+            f"{total.seconds:.2f}",
+            f"{total.max_seconds:.2f}",
+            str(total.events),
+            str(total.validation_failures),
+        )
+        for parser, total in sorted(
+            aggregate_batch(results).items(), key=lambda item: -item[1].seconds
+        )
+    ]
+    widths = [max(len(row[i]) for row in rows + [header]) for i in range(len(header))]
+    for row in [header] + rows:
+        print(
+            "  ".join(value.ljust(width) for value, width in zip(row, widths)).rstrip()
+        )
+    failures = [r for r in results if r.error]
+    if failures:
+        print("---------------------")
+    for r in failures:
+        print(f"{r.parser} {r.zone} {r.data_type}: {r.error[:80]}")
+    print(
+        "---------------------\n"
+        f"{len(results)} entries, {len(failures)} failed, "
+        f"{sum(r.validation_failures for r in results)} validation failures, "
+        f"{sum(r.seconds for r in results):.2f}s total"
+    )
+
 
 @click.command()
-@click.argument("zone")
+@click.argument("zone", required=False)
 @click.argument("data-type", default="production")
 @click.option("--target_datetime", default=None, show_default=True)
-def test_parser(zone: ZoneKey, data_type, target_datetime):
+@click.option(
+    "--record",
+    default=None,
+    type=click.Path(dir_okay=False),
+    help="Record the HTTP exchanges of this run to a cassette file.",
+)
+@click.option(
+    "--replay",
+    default=None,
+    type=click.Path(exists=True, dir_okay=False),
+    help="Serve HTTP requests from a recorded cassette instead of the network.",
+)
+@click.option(
+    "--batch",
+    default=None,
+    type=click.Path(exists=True, dir_okay=False),
+    help="Run the `zone,data type,target datetime` lines of a file. The data type"
+    " and --target_datetime arguments are the defaults of its lines.",
+)
+@click.option("--workers", default=8, show_default=True, help="Batch concurrency.")
+@click.option(
+    "--parquet",
+    default=None,
+    type=click.Path(file_okay=False),
+    help="Also write the result to a Parquet dataset in this directory.",
+)
+def test_parser(
+    zone: ZoneKey, data_type, target_datetime, record, replay, batch, workers, parquet
+):
     """\b
     Parameters
     ----------
@@ -44,20 +256,68 @@ def test_parser(zone: ZoneKey, data_type, target_datetime):
     >>> poetry run test_parser FR production
     >>> poetry run test_parser "NO-NO3->SE" exchange
     >>> poetry run test_parser GE production --target_datetime="2022-04-10 15:00"
+    >>> poetry run test_parser DE production --record DE_production.json.gz
+    >>> poetry run test_parser DE production --replay DE_production.json.gz
+    >>> poetry run test_parser "DE*" production --workers 16
+    >>> poetry run test_parser --batch parsers.csv
+    >>> poetry run test_parser DE production --parquet results
 
     """
+    if not zone and not batch:
+        raise click.UsageError("Missing a zone or --batch file")
+    if batch or any(character in zone for character in GLOB_CHARACTERS):
+        unsupported = [
+            option
+            for option, value in [
+                ("--record", record),
+                ("--replay", replay),
+                ("--parquet", parquet),
+            ]
+            if value
+        ]
+        if unsupported:
+            raise click.UsageError(
+                f"{', '.join(unsupported)} can't be used with --batch or a zone glob"
+            )
+        if target_datetime:
+            target_datetime = arrow.get(target_datetime).datetime
+        entries = (
+            read_batch(batch, data_type, target_datetime)
+            if batch
+            else [(zone, data_type, target_datetime)]
+        )
+        print_batch(run_batch(expand_globs(entries), workers))
+        return
+    if record and replay:
+        raise click.UsageError("--record and --replay are mutually exclusive")
+    if replay and not target_datetime:
+        # Replay the window that was recorded
+        target_datetime = cassette.Cassette.load(replay).meta.get("target_datetime")
     if target_datetime:
         target_datetime = arrow.get(target_datetime).datetime
-    start = time.time()
 
-    parser: Callable[
-        ..., Union[List[Dict[str, Any]], Dict[str, Any]]
-    ] = PARSER_KEY_TO_DICT[data_type][zone]
-    if data_type in ["exchange", "exchangeForecast"]:
-        args = zone.split("->")
+    if record:
+        http = cassette.recording(
+            record,
+            meta={
+                "zone": zone,
+                "data_type": data_type,
+                "target_datetime": target_datetime and target_datetime.isoformat(),
+                "recorded_at": arrow.utcnow().isoformat(),
+            },
+        )
+    elif replay:
+        http = cassette.replaying(replay)
     else:
-        args = [zone]
-    res = parser(*args, target_datetime=target_datetime, logger=getLogger(__name__))
+        http = nullcontext()
+    start = time.time()
+
+    parser: Callable[..., Union[List[Dict[str, Any]], Dict[str, Any]]] = (
+        PARSER_KEY_TO_DICT[data_type][zone]
+    )
+    args = get_parser_args(zone, data_type)
+    with http:
+        res = parser(*args, target_datetime=target_datetime, logger=getLogger(__name__))
 
     if not res:
         raise ValueError("Error: parser returned nothing ({})".format(res))
@@ -106,16 +366,14 @@ def test_parser(zone: ZoneKey, data_type, target_datetime):
 
     if isinstance(res, dict):
         res = [res]
-    for event in res:
-        try:
-            if data_type == "production":
-                validate_production(event, zone)
-            elif data_type == "consumption":
-                validate_consumption(event, zone)
-            elif data_type == "exchange":
-                validate_exchange(event, zone)
-        except ValidationError as e:
-            logger.warning("Validation failed @ {}: {}".format(event["datetime"], e))
+    count_validation_failures(res, zone, data_type)
+
+    if parquet:
+        from parsers.lib.parquet import ParquetWriter
+
+        with ParquetWriter(parquet) as writer:
+            writer.write(zone, data_type, res)
+        print("written to {}".format(parquet))
 
 
 if __name__ == "__main__":
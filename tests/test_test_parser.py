@@ -0,0 +1,113 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime, timezone
+from unittest.mock import patch
+
+from click.testing import CliRunner
+
+import test_parser
+from parsers.lib.parsers import PARSER_KEY_TO_DICT
+
+
+def fetch_production(zone_key, session=None, target_datetime=None, logger=None):
+    if zone_key == "XX-FAIL":
+        raise ValueError("upstream down")
+    return [
+        {
+            "zoneKey": zone_key,
+            "datetime": target_datetime,
+            "production": {"wind": 10.0},
+            "source": "example.com",
+        }
+    ]
+
+
+class TestBatch(unittest.TestCase):
+    def test_read_batch(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "batch.csv")
+            with open(path, "w") as f:
+                f.write("# zone,data type,target datetime\n\n")
+                f.write("DE\n")
+                f.write("DE->FR,exchange\n")
+                f.write("FR, price , 2022-01-01T00:00:00+00:00\n")
+            entries = test_parser.read_batch(path, "production")
+
+        self.assertEqual(
+            entries,
+            [
+                ("DE", "production", None),
+                ("DE->FR", "exchange", None),
+                ("FR", "price", datetime(2022, 1, 1, tzinfo=timezone.utc)),
+            ],
+        )
+
+    def test_expand_globs(self):
+        entries = test_parser.expand_globs(
+            [("DK-*", "production", None), ("DE", "production", None)]
+        )
+        zones = [zone for zone, _, _ in entries]
+        self.assertEqual(zones[-1], "DE")
+        self.assertIn("DK-DK1", zones)
+        self.assertTrue(all(zone.startswith("DK-") for zone in zones[:-1]))
+        self.assertEqual(zones[:-1], sorted(zones[:-1]))
+
+    def test_run_batch(self):
+        target_datetime = datetime(2022, 1, 1, tzinfo=timezone.utc)
+        parsers = {"XX-A": fetch_production, "XX-FAIL": fetch_production}
+        with patch.dict(PARSER_KEY_TO_DICT["production"], parsers):
+            results = test_parser.run_batch(
+                [
+                    ("XX-A", "production", target_datetime),
+                    ("XX-FAIL", "production", target_datetime),
+                    ("XX-MISSING", "production", None),
+                ],
+                workers=2,
+            )
+
+        self.assertEqual([r.events for r in results], [1, 0, 0])
+        self.assertIsNone(results[0].error)
+        self.assertEqual(results[1].error, "ValueError: upstream down")
+        self.assertTrue(results[2].error.startswith("NotImplementedError"))
+
+        totals = test_parser.aggregate_batch(results)
+        name = f"{__name__.rsplit('.', 1)[-1]}.fetch_production"
+        self.assertEqual(totals[name].entries, 2)
+        self.assertEqual(totals[name].failed, 1)
+        self.assertEqual(totals[name].events, 1)
+        self.assertEqual(totals["-"].failed, 1)
+
+    def test_batch_target_datetime_is_the_default(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "batch.csv")
+            with open(path, "w") as f:
+                f.write("DE\n")
+                f.write("FR,price,2022-01-01T00:00:00+00:00\n")
+            with patch.object(test_parser, "run_batch", return_value=[]) as run_batch:
+                with patch.object(test_parser, "print_batch"):
+                    result = CliRunner().invoke(
+                        test_parser.test_parser,
+                        ["--batch", path, "--target_datetime", "2022-04-10 15:00"],
+                    )
+
+        self.assertEqual(result.exit_code, 0, result.output)
+        entries, _ = run_batch.call_args[0]
+        self.assertEqual(
+            entries,
+            [
+                ("DE", "production", datetime(2022, 4, 10, 15, tzinfo=timezone.utc)),
+                ("FR", "price", datetime(2022, 1, 1, tzinfo=timezone.utc)),
+            ],
+        )
+
+    def test_batch_rejects_single_run_options(self):
+        result = CliRunner().invoke(
+            test_parser.test_parser, ["DE*", "production", "--parquet", "results"]
+        )
+        self.assertEqual(result.exit_code, 2)
+        self.assertIn("--parquet", result.output)
+
+
+if __name__ == "__main__":
+    unittest.main()